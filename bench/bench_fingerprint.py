@@ -0,0 +1,71 @@
+"""字幕指纹索引基准：写入大量随机指纹后测量近似重复查询的延迟
+
+用法：python bench/bench_fingerprint.py [条目数]
+"""
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from fingerprint import BANDS, FingerprintIndex, _bands, _to_signed, simhash  # noqa: E402
+
+CHARS = '的一是了我不人在他有这个上们来到时大地为子中你说生国年着就那和要她出也得里后自以会家可下而过天去能对小多然于心学'
+
+
+def percentile(values, q):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(q * len(values)))]
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 300000
+    random.seed(42)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        index = FingerprintIndex(os.path.join(tmp, 'fingerprints.db'))
+        fingerprints = [random.getrandbits(64) for _ in range(count)]
+
+        start = time.perf_counter()
+        # 直接批量写入，避免逐条提交影响建库时间
+        index._conn.executemany(
+            f"INSERT INTO fingerprints VALUES (?, ?, ?, ?, {', '.join('?' * BANDS)}, ?)",
+            ((f"BV{i}:1", f"BV{i}", f"BV{i}:p1", _to_signed(fp), *_bands(fp), time.time())
+             for i, fp in enumerate(fingerprints))
+        )
+        index._conn.commit()
+        print(f"写入 {count} 条指纹: {time.perf_counter() - start:.1f}s")
+
+        # 近似重复查询：在已有指纹上随机翻转0~5位
+        latencies, found = [], 0
+        for _ in range(1000):
+            target = random.choice(fingerprints)
+            query = target
+            for bit in random.sample(range(64), random.randint(0, 5)):
+                query ^= 1 << bit
+            start = time.perf_counter()
+            match = index.find(query, 5)
+            latencies.append(time.perf_counter() - start)
+            found += bool(match)
+        print(f"近似重复查询: 命中 {found}/1000, p50 {percentile(latencies, 0.5) * 1000:.2f}ms, "
+              f"p99 {percentile(latencies, 0.99) * 1000:.2f}ms")
+
+        # 不相关查询
+        latencies = []
+        for _ in range(1000):
+            start = time.perf_counter()
+            index.find(random.getrandbits(64), 5)
+            latencies.append(time.perf_counter() - start)
+        print(f"不相关查询: p50 {percentile(latencies, 0.5) * 1000:.2f}ms, p99 {percentile(latencies, 0.99) * 1000:.2f}ms")
+
+        text = ''.join(random.choice(CHARS) for _ in range(20000))
+        start = time.perf_counter()
+        simhash(text)
+        print(f"SimHash（2万字字幕）: {(time.perf_counter() - start) * 1000:.1f}ms")
+        index.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,133 @@
+"""链接提取微基准：对比旧的多次正则扫描与单次预编译扫描
+
+用法：python bench/bench_links.py [迭代次数]
+"""
+import json
+import os
+import re
+import importlib
+import sys
+import timeit
+
+# links依赖同包的bvid模块，按包导入
+PLUGIN_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.dirname(PLUGIN_DIR))
+
+links_module = importlib.import_module(f"{os.path.basename(PLUGIN_DIR)}.links")
+extract_from_json = links_module.extract_from_json
+extract_video_links = links_module.extract_video_links
+
+LEGACY_PATTERNS = [
+    r'https?://(?:www\.)?bilibili\.com/video/[^\s\'"<>]+',
+    r'https?://m\.bilibili\.com/video/[^\s\'"<>]+',
+    r'https?://b23\.tv/[^\s\'"<>]+',
+    r'BV[a-zA-Z0-9]{10}',
+    r'av\d+',
+]
+
+# QQ小程序分享卡片（结构与真实卡片一致，字段值为示例）
+QQ_CARD = {
+    "app": "com.tencent.miniapp_01",
+    "config": {"autoSize": 0, "ctime": 1718000000, "forward": 1, "height": 0,
+               "token": "0" * 32, "type": "normal", "width": 0},
+    "desc": "哔哩哔哩",
+    "extra": {"app_type": 1, "appid": 100951776, "uin": 10000},
+    "meta": {
+        "detail_1": {
+            "appType": 0,
+            "appid": "1109937557",
+            "desc": "【硬核】从零开始手搓一台计算机 第三集",
+            "gamePoints": "",
+            "gamePointsUrl": "",
+            "host": {"nick": "someone", "uin": 10000},
+            "icon": "https://open.gtimg.cn/open/app_icon/00/95/17/76/100951776_100_m.png",
+            "preview": "pubminishare-30161.picsz.qpic.cn/" + "a" * 64,
+            "qqdocurl": "https://b23.tv/AbCdEfG?share_medium=android&share_source=qq"
+                        "&bbid=XY0000000000000000000000000000000000&ts=1718000000000",
+            "scene": 1036,
+            "shareTemplateData": {},
+            "shareTemplateId": "8C8E89B49BE609866298ADDFF2DBABA4",
+            "showLittleTail": "",
+            "title": "哔哩哔哩",
+            "url": "m.q.qq.com/a/s/" + "b" * 32,
+        }
+    },
+    "prompt": "[QQ小程序]【硬核】从零开始手搓一台计算机 第三集",
+    "ver": "1.0.0.19",
+    "view": "view_8C8E89B49BE609866298ADDFF2DBABA4",
+}
+
+FORWARD_TEXT = "\n".join(
+    f"用户{i}: 今天看到一个视频 https://www.bilibili.com/video/BV1jv7YzJED{i % 10}?spm_id_from=333.1007 "
+    f"还有 https://b23.tv/Xy{i}Zw 以及 av17000{i} 大家看看"
+    for i in range(20)
+) + "\n" + "闲聊内容，和视频无关。" * 200
+
+REPLY_TEXT = ("[引用] 之前发的那个视频 https://m.bilibili.com/video/BV1jv7YzJED2?p=3&share_source=copy_web "
+              "挺好看的，还有 BV1jv7YzJED2 这个也是") + " 普通回复文字" * 50
+
+
+def legacy_extract_text(text):
+    links = []
+    for pattern in LEGACY_PATTERNS:
+        links.extend(re.findall(pattern, text, re.IGNORECASE))
+    return links
+
+
+def legacy_extract_json(obj):
+    found = []
+    if isinstance(obj, dict):
+        for value in obj.values():
+            if isinstance(value, str):
+                found.extend(legacy_extract_text(value))
+            elif isinstance(value, (dict, list)):
+                found.extend(legacy_extract_json(value))
+    elif isinstance(obj, list):
+        for item in obj:
+            if isinstance(item, str):
+                found.extend(legacy_extract_text(item))
+            elif isinstance(item, (dict, list)):
+                found.extend(legacy_extract_json(item))
+    return found
+
+
+def legacy_card(raw):
+    data = json.loads(raw)
+    links = legacy_extract_json(data)
+    detail = data.get('meta', {}).get('detail_1', {})
+    if '哔哩哔哩' in detail.get('title', ''):
+        links.extend(legacy_extract_text(detail.get('qqdocurl', '')))
+        links.extend(legacy_extract_text(detail.get('url', '')))
+    return links
+
+
+def legacy_forward(text):
+    # 旧实现会对含关键词的内容再扫描一次
+    links = legacy_extract_text(text)
+    if any(keyword in text.lower() for keyword in ['bilibili', '哔哩哔哩', 'b站']):
+        links.extend(legacy_extract_text(text))
+    return links
+
+
+def main():
+    number = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    card_raw = json.dumps(QQ_CARD, ensure_ascii=False)
+
+    cases = [
+        ("QQ卡片(全部)", lambda: legacy_card(card_raw), lambda: extract_from_json(json.loads(card_raw))),
+        ("QQ卡片(首个)", lambda: legacy_card(card_raw), lambda: extract_from_json(json.loads(card_raw), limit=1)),
+        ("转发消息(全部)", lambda: legacy_forward(FORWARD_TEXT), lambda: extract_video_links(FORWARD_TEXT)),
+        ("转发消息(首个)", lambda: legacy_forward(FORWARD_TEXT), lambda: extract_video_links(FORWARD_TEXT, limit=1)),
+        ("引用消息", lambda: legacy_extract_text(REPLY_TEXT), lambda: extract_video_links(REPLY_TEXT)),
+    ]
+
+    print(f"{'场景':<16}{'旧实现(us)':>12}{'新实现(us)':>12}{'加速比':>8}  结果数(旧/新)")
+    for name, legacy, current in cases:
+        legacy_time = min(timeit.repeat(legacy, number=number, repeat=3)) / number * 1e6
+        current_time = min(timeit.repeat(current, number=number, repeat=3)) / number * 1e6
+        print(f"{name:<16}{legacy_time:>12.1f}{current_time:>12.1f}{legacy_time / current_time:>8.1f}x"
+              f"  {len(legacy())}/{len(current())}")
+
+
+if __name__ == '__main__':
+    main()
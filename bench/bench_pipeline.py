@@ -0,0 +1,306 @@
+"""离线端到端基准：启动本地模拟的B站接口、字幕CDN、b23.tv和OpenAI接口，
+用合成的消息事件并发调用 /bs，统计各阶段和整体的延迟分位数及吞吐量。
+
+需要在已安装AstrBot的环境中运行，例如：
+    python bench/bench_pipeline.py --requests 200 --concurrency 20 --videos 50
+    python bench/bench_pipeline.py --llm-latency 2.0 --error-rate 0.05 --stream
+"""
+import argparse
+import asyncio
+import functools
+import importlib
+import json
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+from collections import defaultdict
+from typing import Dict, List
+from unittest import mock
+
+from aiohttp import web
+
+PLUGIN_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.dirname(PLUGIN_DIR))
+
+PACKAGE = os.path.basename(PLUGIN_DIR)
+plugin_main = importlib.import_module(f"{PACKAGE}.main")
+bvid_module = importlib.import_module(f"{PACKAGE}.bvid")
+
+import astrbot.api.message_components as Comp  # noqa: E402
+from astrbot.api.event import AstrMessageEvent  # noqa: E402
+from astrbot.api.platform import AstrBotMessage, MessageMember, MessageType, PlatformMetadata  # noqa: E402
+
+
+class StandInServer:
+    """本地模拟服务，可配置各接口的延迟、错误率和字幕大小"""
+
+    def __init__(self, args):
+        self.args = args
+        self.base_url = ''
+        self.requests: Dict[str, int] = defaultdict(int)
+        self._runner = None
+
+    async def _delay(self, seconds: float):
+        if seconds > 0:
+            # 加入±20%的抖动，避免所有请求同时返回
+            await asyncio.sleep(seconds * random.uniform(0.8, 1.2))
+
+    def _fail(self) -> bool:
+        return random.random() < self.args.error_rate
+
+    async def view(self, request: web.Request) -> web.Response:
+        self.requests['view'] += 1
+        await self._delay(self.args.api_latency)
+        if self._fail():
+            return web.json_response({'code': -412, 'message': '请求被拦截'})
+
+        bvid = request.query.get('bvid', '')
+        aid = bvid_module.bv2av(bvid) if bvid else int(request.query.get('aid', '0'))
+        pages = [
+            {'cid': aid * 100 + page, 'page': page, 'part': f'第{page}集', 'duration': 600}
+            for page in range(1, self.args.pages + 1)
+        ]
+        return web.json_response({'code': 0, 'data': {
+            'aid': aid, 'bvid': bvid, 'title': f'基准测试视频 {bvid}', 'desc': '本地模拟的视频简介' * 5,
+            'pages': pages
+        }})
+
+    async def nav(self, request: web.Request) -> web.Response:
+        self.requests['nav'] += 1
+        await self._delay(self.args.api_latency)
+        # 与真实接口一样，未登录时返回-101但仍带有wbi_img
+        return web.json_response({'code': -101, 'message': '账号未登录', 'data': {'wbi_img': {
+            'img_url': 'https://i0.hdslb.com/bfs/wbi/7cd084941338484aae1ad9425b84077c.png',
+            'sub_url': 'https://i0.hdslb.com/bfs/wbi/4932caff0ff746eab6f01bf08b70ac45.png'
+        }}})
+
+    async def player(self, request: web.Request) -> web.Response:
+        self.requests['player'] += 1
+        await self._delay(self.args.api_latency)
+        if self._fail():
+            return web.json_response({'code': -352, 'message': '风控校验失败'})
+
+        cid = request.query.get('cid', '0')
+        return web.json_response({'code': 0, 'data': {'subtitle': {'subtitles': [
+            {'lan': 'ai-zh', 'lan_doc': '中文（自动生成）', 'subtitle_url': f'{self.base_url}/subtitle/{cid}.json'}
+        ]}}})
+
+    async def subtitle(self, request: web.Request) -> web.Response:
+        self.requests['subtitle'] += 1
+        await self._delay(self.args.cdn_latency)
+        if self._fail():
+            return web.Response(status=503)
+
+        body = [
+            {'from': i * 2.5, 'to': i * 2.5 + 2.4, 'location': 2,
+             'content': f'这是第{i}句模拟字幕，用来测试字幕解析和总结的性能'}
+            for i in range(self.args.subtitle_lines)
+        ]
+        return web.json_response({'font_size': 0.4, 'font_color': '#FFFFFF', 'body': body})
+
+    async def short_link(self, request: web.Request) -> web.Response:
+        self.requests['b23'] += 1
+        await self._delay(self.args.api_latency)
+        code = request.match_info['code']
+        bvid = bvid_module.av2bv(int(code))
+        raise web.HTTPFound(f'https://www.bilibili.com/video/{bvid}?share_source=copy_web')
+
+    async def chat_completions(self, request: web.Request) -> web.StreamResponse:
+        self.requests['llm'] += 1
+        payload = await request.json()
+        if self._fail():
+            await self._delay(self.args.llm_latency / 10)
+            return web.json_response({'error': {'message': 'rate limited'}}, status=429)
+
+        answer = '这是本地模拟生成的视频总结。' * (self.args.summary_chars // 14 + 1)
+        answer = answer[:self.args.summary_chars]
+
+        if not payload.get('stream'):
+            await self._delay(self.args.llm_latency)
+            return web.json_response({
+                'choices': [{'index': 0, 'message': {'role': 'assistant', 'content': answer}}],
+                'usage': {'prompt_tokens': len(json.dumps(payload, ensure_ascii=False)) // 2,
+                          'completion_tokens': len(answer)}
+            })
+
+        # 流式响应：首包延迟为总延迟的20%，其余内容均匀输出
+        response = web.StreamResponse(headers={'Content-Type': 'text/event-stream'})
+        await response.prepare(request)
+        await self._delay(self.args.llm_latency * 0.2)
+        pieces = [answer[i:i + 10] for i in range(0, len(answer), 10)]
+        for piece in pieces:
+            await asyncio.sleep(self.args.llm_latency * 0.8 / max(1, len(pieces)))
+            chunk = {'choices': [{'index': 0, 'delta': {'content': piece}}]}
+            await response.write(f"data: {json.dumps(chunk, ensure_ascii=False)}\n\n".encode('utf-8'))
+        await response.write(b"data: [DONE]\n\n")
+        return response
+
+    async def start(self):
+        app = web.Application()
+        app.router.add_get('/x/web-interface/view', self.view)
+        app.router.add_get('/x/web-interface/nav', self.nav)
+        app.router.add_get('/x/player/wbi/v2', self.player)
+        app.router.add_get('/subtitle/{cid}.json', self.subtitle)
+        app.router.add_route('*', '/b23/{code}', self.short_link)
+        app.router.add_post('/v1/chat/completions', self.chat_completions)
+
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, '127.0.0.1', 0)
+        await site.start()
+        port = site._server.sockets[0].getsockname()[1]
+        self.base_url = f'http://127.0.0.1:{port}'
+
+    async def stop(self):
+        if self._runner:
+            await self._runner.cleanup()
+
+
+class StageTimer:
+    """记录插件各阶段方法的耗时"""
+
+    def __init__(self):
+        self.samples: Dict[str, List[float]] = defaultdict(list)
+
+    def wrap(self, plugin, method_name: str, stage: str):
+        original = getattr(plugin, method_name)
+
+        @functools.wraps(original)
+        async def timed(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return await original(*args, **kwargs)
+            finally:
+                self.samples[stage].append(time.perf_counter() - start)
+
+        setattr(plugin, method_name, timed)
+
+
+def percentile(values: List[float], pct: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, int(round(pct / 100 * len(ordered) + 0.5)) - 1))
+    return ordered[index]
+
+
+def make_event(text: str, index: int) -> AstrMessageEvent:
+    """构造一条群聊消息事件"""
+    message = AstrBotMessage()
+    message.type = MessageType.GROUP_MESSAGE
+    message.self_id = 'bench-bot'
+    message.session_id = f'bench-group-{index % 10}'
+    message.message_id = str(index)
+    message.group_id = f'bench-group-{index % 10}'
+    message.sender = MessageMember(user_id=f'user-{index % 50}', nickname=f'用户{index % 50}')
+    message.message = [Comp.Plain(text)]
+    message.message_str = text
+    message.raw_message = None
+    message.timestamp = int(time.time())
+    meta = PlatformMetadata(name='bench', description='offline benchmark', id='bench')
+    return AstrMessageEvent(text, message, meta, message.session_id)
+
+
+async def run(args):
+    random.seed(args.seed)
+    server = StandInServer(args)
+    await server.start()
+
+    config = {
+        'openai_api_key': 'bench-key',
+        'openai_api_url': f'{server.base_url}/v1/chat/completions',
+        'openai_model': 'bench-model',
+        'bilibili_sessdata': 'bench',
+        'request_interval': args.request_interval,
+        'cache_enabled': args.cache,
+        'stream_output': args.stream,
+        'stream_flush_interval': 0.5,
+    }
+    # 使用临时数据目录：缓存、字幕库以及模拟nav接口返回的WBI密钥都不能写入实际部署的插件数据目录
+    data_dir = tempfile.mkdtemp(prefix='bilibili-summary-bench-')
+    with mock.patch.object(plugin_main.StarTools, 'get_data_dir', return_value=data_dir):
+        plugin = plugin_main.BilibiliSummaryPlugin(context=None, config=config)
+    plugin.api_base = server.base_url
+
+    timer = StageTimer()
+    timer.wrap(plugin, 'resolve_short_url', 'b23')
+    timer.wrap(plugin, 'get_video_info', 'view')
+    timer.wrap(plugin, 'get_subtitle', 'player+subtitle')
+    timer.wrap(plugin, 'download_subtitle', 'subtitle')
+    timer.wrap(plugin, 'chat_completion', 'llm')
+    if hasattr(plugin, 'chat_completion_stream'):
+        timer.wrap(plugin, 'chat_completion_stream', 'llm')
+
+    aids = [random.randrange(10_000_000, 900_000_000) for _ in range(args.videos)]
+    semaphore = asyncio.Semaphore(args.concurrency)
+    totals: List[float] = []
+    first_reply: List[float] = []
+    outcomes: Dict[str, int] = defaultdict(int)
+
+    async def one_request(index: int):
+        aid = random.choice(aids)
+        async with semaphore:
+            start = time.perf_counter()
+            video_input = bvid_module.av2bv(aid)
+            if random.random() < args.short_link_ratio:
+                # 模拟短链接：本地地址不在短链接缓存范围内，每次都会走重定向
+                video_input = await plugin.resolve_short_url(f'{server.base_url}/b23/{aid}') or video_input
+
+            event = make_event(f'/bs {video_input}', index)
+            last_text = ''
+            replies = 0
+            async for result in plugin.bilibili_summary(event, video_input):
+                replies += 1
+                # 第一条回复是"正在处理"提示，第二条开始才是有效内容
+                if replies == 2:
+                    first_reply.append(time.perf_counter() - start)
+                last_text = result.get_plain_text() if hasattr(result, 'get_plain_text') else str(result)
+            totals.append(time.perf_counter() - start)
+            outcomes['失败' if last_text.startswith('❌') else '成功'] += 1
+
+    wall_start = time.perf_counter()
+    await asyncio.gather(*(one_request(i) for i in range(args.requests)))
+    wall = time.perf_counter() - wall_start
+
+    await plugin.terminate()
+    await server.stop()
+    shutil.rmtree(data_dir, ignore_errors=True)
+
+    print(f"请求数 {args.requests}，并发 {args.concurrency}，视频数 {args.videos}，耗时 {wall:.2f}s，"
+          f"吞吐 {args.requests / wall:.1f} req/s")
+    print(f"结果：{dict(outcomes)}；模拟服务请求数：{dict(server.requests)}")
+    print(f"{'阶段':<18}{'次数':>8}{'p50(ms)':>10}{'p95(ms)':>10}{'p99(ms)':>10}")
+    rows = list(timer.samples.items()) + [('首条有效回复', first_reply), ('整体', totals)]
+    for stage, values in rows:
+        print(f"{stage:<18}{len(values):>8}"
+              f"{percentile(values, 50) * 1000:>10.1f}"
+              f"{percentile(values, 95) * 1000:>10.1f}"
+              f"{percentile(values, 99) * 1000:>10.1f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Bilibili总结插件离线基准测试')
+    parser.add_argument('--requests', type=int, default=100, help='总请求数')
+    parser.add_argument('--concurrency', type=int, default=10, help='并发请求数')
+    parser.add_argument('--videos', type=int, default=20, help='不同视频的数量，越少越容易命中缓存和并发合并')
+    parser.add_argument('--pages', type=int, default=1, help='每个视频的分P数')
+    parser.add_argument('--subtitle-lines', type=int, default=600, help='每个字幕文件的行数')
+    parser.add_argument('--summary-chars', type=int, default=400, help='模拟LLM输出的字符数')
+    parser.add_argument('--api-latency', type=float, default=0.05, help='B站接口和b23.tv的延迟(秒)')
+    parser.add_argument('--cdn-latency', type=float, default=0.03, help='字幕CDN的延迟(秒)')
+    parser.add_argument('--llm-latency', type=float, default=1.0, help='LLM接口的延迟(秒)')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='各接口返回错误的概率')
+    parser.add_argument('--short-link-ratio', type=float, default=0.2, help='以短链接发起请求的比例')
+    parser.add_argument('--request-interval', type=float, default=0.0, help='插件的请求间隔配置，0表示不限流')
+    parser.add_argument('--cache', action='store_true', help='启用总结缓存（默认关闭以测量完整流程）')
+    parser.add_argument('--stream', action='store_true', help='启用流式输出')
+    parser.add_argument('--seed', type=int, default=42)
+    args = parser.parse_args()
+    asyncio.run(run(args))
+
+
+if __name__ == '__main__':
+    main()
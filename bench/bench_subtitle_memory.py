@@ -0,0 +1,112 @@
+"""字幕解析内存基准：对比整体json解析与流式解析处理超长字幕文件时的峰值内存
+
+每种方式在独立子进程中运行，读取同一个合成的字幕文件（按64KB分块模拟网络响应），
+输出峰值RSS（减去只导入模块的基线进程）和tracemalloc记录的Python对象峰值。
+
+用法：python bench/bench_subtitle_memory.py [小时数] [读取上限字符数]
+"""
+import json
+import os
+import random
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from subtitle import SubtitleStreamParser  # noqa: E402
+
+CHARS = '的一是了我不人在他有这个上们来到时大地为子中你说生国年着就那和要她出也得里后自以会家可下而过天去能对小多然于心学'
+CHUNK_SIZE = 64 * 1024
+
+
+def generate(path: str, hours: float):
+    """生成与B站AI字幕格式相同的字幕文件，每2秒一行"""
+    random.seed(42)
+    body = [
+        {
+            'from': round(index * 2.0, 2), 'to': round(index * 2.0 + 1.8, 2), 'sid': index + 1, 'location': 2,
+            'content': ''.join(random.choice(CHARS) for _ in range(random.randint(8, 24))), 'music': 0.0
+        }
+        for index in range(int(hours * 1800))
+    ]
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump({'font_size': 0.4, 'font_color': '#FFFFFF', 'background_alpha': 0.5,
+                   'background_color': '#9C27B0', 'Stroke': 'none', 'type': 'AIsubtitle', 'lang': 'ai-zh',
+                   'version': 'v1.6.0.4', 'body': body}, f, ensure_ascii=False)
+
+
+def read_whole(path: str, max_chars: int):
+    """原方式：读取整个响应体后json解析，再逐条提取"""
+    with open(path, 'rb') as f:
+        chunks = []
+        while True:
+            chunk = f.read(CHUNK_SIZE)
+            if not chunk:
+                break
+            chunks.append(chunk)
+    data = json.loads(b''.join(chunks).decode('utf-8'))
+    segments = []
+    for item in data.get('body', []):
+        content = item.get('content', '').strip()
+        if content:
+            segments.append((item.get('from', 0.0), item.get('to', 0.0), content))
+    return segments
+
+
+def read_streaming(path: str, max_chars: int):
+    """流式解析：边读边提取，达到上限后停止读取"""
+    parser = SubtitleStreamParser(max_chars)
+    with open(path, 'r', encoding='utf-8') as f:
+        while True:
+            chunk = f.read(CHUNK_SIZE)
+            if not chunk or parser.feed(chunk):
+                break
+    return parser.close()
+
+
+def run_child(mode: str, path: str, max_chars: int):
+    tracemalloc.start()
+    start = time.perf_counter()
+    segments = [] if mode == 'baseline' else {'whole': read_whole, 'streaming': read_streaming}[mode](path, max_chars)
+    elapsed = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    # Linux下ru_maxrss单位为KB
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    print(json.dumps({'rss_kb': rss, 'traced_peak': peak, 'segments': len(segments), 'seconds': elapsed}))
+
+
+def measure(mode: str, path: str, max_chars: int) -> dict:
+    output = subprocess.run([sys.executable, __file__, '--child', mode, path, str(max_chars)],
+                            check=True, capture_output=True, text=True).stdout
+    return json.loads(output)
+
+
+def main():
+    if len(sys.argv) > 1 and sys.argv[1] == '--child':
+        run_child(sys.argv[2], sys.argv[3], int(sys.argv[4]))
+        return
+
+    hours = float(sys.argv[1]) if len(sys.argv) > 1 else 12
+    max_chars = int(sys.argv[2]) if len(sys.argv) > 2 else 100000
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'subtitle.json')
+        generate(path, hours)
+        print(f"字幕文件：{hours:g}小时，{os.path.getsize(path) / 1024 / 1024:.1f}MB")
+
+        baseline = measure('baseline', path, max_chars)['rss_kb']
+        runs = [('整体解析', 'whole', 0), ('流式解析（不限）', 'streaming', 0),
+                (f'流式解析（上限{max_chars}字符）', 'streaming', max_chars)]
+        for label, mode, limit in runs:
+            result = measure(mode, path, limit)
+            print(f"{label}: {result['segments']}行，耗时 {result['seconds'] * 1000:.0f}ms，"
+                  f"峰值RSS +{(result['rss_kb'] - baseline) / 1024:.1f}MB，"
+                  f"Python对象峰值 {result['traced_peak'] / 1024 / 1024:.1f}MB")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,55 @@
+import re
+
+# B站AV号与BV号互转（本地计算，兼容2^51以内的大AV号）
+XOR_CODE = 23442827791579
+MASK_CODE = 2251799813685247
+MAX_AID = 1 << 51
+ALPHABET = "FcwAPNKTMug3GV5Lj7EJnHpWsx4tb8haYeviqBz6rkCy12mUSDQX9RdoZf"
+BASE = len(ALPHABET)
+ALPHABET_INDEX = {char: index for index, char in enumerate(ALPHABET)}
+
+BVID_PATTERN = re.compile(r'^BV1[a-zA-Z0-9]{9}$')
+
+
+def av2bv(aid: int) -> str:
+    """AV号（数字）转BV号"""
+    if not 0 < aid < MAX_AID:
+        raise ValueError(f"AV号超出范围: {aid}")
+
+    chars = ['B', 'V', '1', '0', '0', '0', '0', '0', '0', '0', '0', '0']
+    index = len(chars) - 1
+    tmp = (MAX_AID | aid) ^ XOR_CODE
+    while tmp > 0:
+        chars[index] = ALPHABET[tmp % BASE]
+        tmp //= BASE
+        index -= 1
+
+    chars[3], chars[9] = chars[9], chars[3]
+    chars[4], chars[7] = chars[7], chars[4]
+    return ''.join(chars)
+
+
+def bv2av(bvid: str) -> int:
+    """BV号转AV号（数字）"""
+    if not BVID_PATTERN.match(bvid):
+        raise ValueError(f"无效的BV号: {bvid}")
+
+    chars = list(bvid)
+    chars[3], chars[9] = chars[9], chars[3]
+    chars[4], chars[7] = chars[7], chars[4]
+
+    tmp = 0
+    for char in chars[3:]:
+        index = ALPHABET_INDEX.get(char)
+        if index is None:
+            raise ValueError(f"无效的BV号: {bvid}")
+        tmp = tmp * BASE + index
+    return (tmp & MASK_CODE) ^ XOR_CODE
+
+
+def is_valid_bvid(bvid: str) -> bool:
+    """BV号格式正确且能还原为合法的AV号"""
+    try:
+        return av2bv(bv2av(bvid)) == bvid
+    except ValueError:
+        return False
@@ -0,0 +1,173 @@
+import json
+import os
+import sqlite3
+import time
+from collections import OrderedDict
+from typing import Optional, Dict, Any
+
+
+class TTLCache:
+    """内存中的LRU缓存，条目带过期时间，可选持久化到JSON文件"""
+
+    def __init__(self, max_size: int, ttl: float, persist_path: Optional[str] = None):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.persist_path = persist_path
+        self.hits = 0
+        self.misses = 0
+        # key -> (过期时间戳, 值)
+        self._data: "OrderedDict[str, tuple]" = OrderedDict()
+
+        if persist_path:
+            self.load()
+
+    def get(self, key: str) -> Any:
+        item = self._data.get(key)
+        if item is None:
+            self.misses += 1
+            return None
+
+        expires_at, value = item
+        if self.ttl > 0 and time.time() > expires_at:
+            del self._data[key]
+            self.misses += 1
+            return None
+
+        self._data.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def set(self, key: str, value: Any):
+        self._data[key] = (time.time() + self.ttl, value)
+        self._data.move_to_end(key)
+        while len(self._data) > self.max_size:
+            self._data.popitem(last=False)
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def load(self):
+        """从持久化文件加载未过期的条目"""
+        if not self.persist_path or not os.path.exists(self.persist_path):
+            return
+        try:
+            with open(self.persist_path, 'r', encoding='utf-8') as f:
+                items = json.load(f)
+        except (OSError, ValueError):
+            # 文件损坏时从空缓存开始
+            return
+        now = time.time()
+        for key, expires_at, value in items[-self.max_size:]:
+            if self.ttl <= 0 or expires_at > now:
+                self._data[key] = (expires_at, value)
+
+    def save(self):
+        """按LRU顺序写入持久化文件"""
+        if not self.persist_path:
+            return
+        os.makedirs(os.path.dirname(self.persist_path) or '.', exist_ok=True)
+        items = [[key, expires_at, value] for key, (expires_at, value) in self._data.items()]
+        tmp_path = self.persist_path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(items, f, ensure_ascii=False)
+        os.replace(tmp_path, self.persist_path)
+
+
+class SummaryCache:
+    """基于SQLite的视频总结结果缓存，支持TTL过期和按访问时间的LRU淘汰"""
+
+    def __init__(self, db_path: str, ttl: float, max_entries: int):
+        self.db_path = db_path
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+
+        os.makedirs(os.path.dirname(db_path) or '.', exist_ok=True)
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS summaries ("
+            "  cache_key TEXT PRIMARY KEY,"
+            "  video_id TEXT NOT NULL,"
+            "  value TEXT NOT NULL,"
+            "  created_at REAL NOT NULL,"
+            "  accessed_at REAL NOT NULL"
+            ")"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_summaries_video ON summaries(video_id)")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_summaries_accessed ON summaries(accessed_at)")
+        self._conn.commit()
+
+    def get(self, cache_key: str) -> Optional[Dict[str, Any]]:
+        """读取缓存，过期条目视为未命中并删除"""
+        now = time.time()
+        row = self._conn.execute(
+            "SELECT value, created_at FROM summaries WHERE cache_key = ?", (cache_key,)
+        ).fetchone()
+
+        if row is None:
+            self.misses += 1
+            return None
+
+        value, created_at = row
+        if self.ttl > 0 and now - created_at > self.ttl:
+            self._conn.execute("DELETE FROM summaries WHERE cache_key = ?", (cache_key,))
+            self._conn.commit()
+            self.misses += 1
+            return None
+
+        self._conn.execute("UPDATE summaries SET accessed_at = ? WHERE cache_key = ?", (now, cache_key))
+        self._conn.commit()
+        self.hits += 1
+        return json.loads(value)
+
+    def contains(self, cache_key: str) -> bool:
+        """是否存在未过期的条目（不计入命中统计，也不更新访问时间）"""
+        row = self._conn.execute(
+            "SELECT created_at FROM summaries WHERE cache_key = ?", (cache_key,)
+        ).fetchone()
+        return row is not None and not (self.ttl > 0 and time.time() - row[0] > self.ttl)
+
+    def set(self, cache_key: str, video_id: str, value: Dict[str, Any]):
+        """写入缓存，超出容量时淘汰最久未访问的条目"""
+        now = time.time()
+        self._conn.execute(
+            "INSERT OR REPLACE INTO summaries (cache_key, video_id, value, created_at, accessed_at) "
+            "VALUES (?, ?, ?, ?, ?)",
+            (cache_key, video_id, json.dumps(value, ensure_ascii=False), now, now)
+        )
+
+        if self.max_entries > 0:
+            count = self._conn.execute("SELECT COUNT(*) FROM summaries").fetchone()[0]
+            if count > self.max_entries:
+                self._conn.execute(
+                    "DELETE FROM summaries WHERE cache_key IN ("
+                    "  SELECT cache_key FROM summaries ORDER BY accessed_at ASC LIMIT ?"
+                    ")",
+                    (count - self.max_entries,)
+                )
+        self._conn.commit()
+
+    def purge(self, video_id: Optional[str] = None) -> int:
+        """清除缓存，指定video_id时只清除该视频的条目，返回清除的条目数"""
+        if video_id:
+            cursor = self._conn.execute("DELETE FROM summaries WHERE video_id = ?", (video_id,))
+        else:
+            cursor = self._conn.execute("DELETE FROM summaries")
+        self._conn.commit()
+        return cursor.rowcount
+
+    def stats(self) -> Dict[str, Any]:
+        """返回缓存统计信息"""
+        count = self._conn.execute("SELECT COUNT(*) FROM summaries").fetchone()[0]
+        total = self.hits + self.misses
+        return {
+            'entries': count,
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / total if total else 0.0
+        }
+
+    def close(self):
+        self._conn.close()
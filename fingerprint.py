@@ -0,0 +1,150 @@
+import hashlib
+import os
+import re
+import sqlite3
+import time
+from collections import Counter
+from typing import Dict, List, Optional, Tuple
+
+FINGERPRINT_BITS = 64
+# 64位指纹分为6段（11/11/11/11/10/10位）：汉明距离不超过5的两个指纹至少有一段完全相同（抽屉原理），
+# 查询时只需比较至少一段相同的候选，几十万条目时每段约几百个候选
+BAND_WIDTHS = (11, 11, 11, 11, 10, 10)
+BANDS = len(BAND_WIDTHS)
+MAX_DISTANCE = BANDS - 1
+
+_NORMALIZE_PATTERN = re.compile(r'[\W_]+', re.UNICODE)
+
+# 把一个字节的8个位展开到8个24位宽的计数字段，用一次大整数加法同时累加64个位的权重
+_FIELD_BITS = 24
+_SPREAD_TABLE = [
+    sum(((byte >> bit) & 1) << (bit * _FIELD_BITS) for bit in range(8))
+    for byte in range(256)
+]
+
+
+def _spread(value: int) -> int:
+    spread = 0
+    for index in range(8):
+        spread |= _SPREAD_TABLE[(value >> (index * 8)) & 0xFF] << (index * 8 * _FIELD_BITS)
+    return spread
+
+
+def simhash(text: str, shingle_size: int = 3) -> int:
+    """计算文本的64位SimHash：去掉空白和标点后取字符n-gram，按出现次数加权"""
+    normalized = _NORMALIZE_PATTERN.sub('', text.lower())
+    shingles = Counter(normalized[i:i + shingle_size] for i in range(len(normalized) - shingle_size + 1))
+    if not shingles:
+        return 0
+
+    ones = 0
+    total = 0
+    for shingle, count in shingles.items():
+        digest = hashlib.blake2b(shingle.encode('utf-8'), digest_size=8).digest()
+        ones += _spread(int.from_bytes(digest, 'big')) * count
+        total += count
+
+    mask = (1 << _FIELD_BITS) - 1
+    fingerprint = 0
+    for bit in range(FINGERPRINT_BITS):
+        # 该位为1的权重超过一半时置1
+        if ((ones >> (bit * _FIELD_BITS)) & mask) * 2 > total:
+            fingerprint |= 1 << bit
+    return fingerprint
+
+
+def hamming_distance(left: int, right: int) -> int:
+    return bin(left ^ right).count('1')
+
+
+def _to_signed(value: int) -> int:
+    # SQLite的INTEGER是有符号64位
+    return value - (1 << 64) if value >= (1 << 63) else value
+
+
+def _bands(fingerprint: int) -> List[int]:
+    bands = []
+    for width in BAND_WIDTHS:
+        bands.append(fingerprint & ((1 << width) - 1))
+        fingerprint >>= width
+    return bands
+
+
+class FingerprintIndex:
+    """字幕指纹索引（SQLite），按指纹分段建索引，查询近似重复时只比较至少一段相同的候选"""
+
+    def __init__(self, db_path: str, max_entries: int = 0):
+        self.db_path = db_path
+        self.max_entries = max_entries
+
+        os.makedirs(os.path.dirname(db_path) or '.', exist_ok=True)
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        band_columns = ''.join(f"  band{index} INTEGER NOT NULL," for index in range(BANDS))
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS fingerprints ("
+            "  video_key TEXT PRIMARY KEY,"
+            "  video_id TEXT NOT NULL,"
+            "  cache_key TEXT NOT NULL,"
+            "  fingerprint INTEGER NOT NULL,"
+            f"{band_columns}"
+            "  created_at REAL NOT NULL"
+            ")"
+        )
+        for index in range(BANDS):
+            self._conn.execute(f"CREATE INDEX IF NOT EXISTS idx_fingerprints_band{index} ON fingerprints(band{index})")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_fingerprints_created ON fingerprints(created_at)")
+        self._conn.commit()
+
+    def find(self, fingerprint: int, max_distance: int, exclude_video_id: Optional[str] = None,
+             cache_key_suffix: str = '') -> Optional[Dict[str, object]]:
+        """查找汉明距离不超过max_distance（最大为5）的最相近条目
+
+        跳过video_id为exclude_video_id的条目，只匹配cache_key以cache_key_suffix结尾的条目。
+        """
+        max_distance = min(max_distance, MAX_DISTANCE)
+        where = ' OR '.join(f"band{index} = ?" for index in range(BANDS))
+        rows = self._conn.execute(
+            f"SELECT video_key, video_id, cache_key, fingerprint FROM fingerprints WHERE {where}",
+            _bands(fingerprint)
+        ).fetchall()
+
+        best: Optional[Tuple[int, tuple]] = None
+        for row in rows:
+            if row[1] == exclude_video_id or not row[2].endswith(cache_key_suffix):
+                continue
+            distance = hamming_distance(fingerprint, row[3] & ((1 << 64) - 1))
+            if distance <= max_distance and (best is None or distance < best[0]):
+                best = (distance, row)
+        if best is None:
+            return None
+        distance, (video_key, video_id, cache_key, _) = best
+        return {'video_key': video_key, 'video_id': video_id, 'cache_key': cache_key, 'distance': distance}
+
+    def add(self, video_key: str, video_id: str, cache_key: str, fingerprint: int):
+        self._conn.execute(
+            f"INSERT OR REPLACE INTO fingerprints (video_key, video_id, cache_key, fingerprint, "
+            f"{', '.join(f'band{index}' for index in range(BANDS))}, created_at) "
+            f"VALUES (?, ?, ?, ?, {', '.join('?' * BANDS)}, ?)",
+            (video_key, video_id, cache_key, _to_signed(fingerprint), *_bands(fingerprint), time.time())
+        )
+        if self.max_entries > 0:
+            count = self._conn.execute("SELECT COUNT(*) FROM fingerprints").fetchone()[0]
+            if count > self.max_entries:
+                self._conn.execute(
+                    "DELETE FROM fingerprints WHERE video_key IN ("
+                    "  SELECT video_key FROM fingerprints ORDER BY created_at ASC LIMIT ?"
+                    ")",
+                    (count - self.max_entries,)
+                )
+        self._conn.commit()
+
+    def remove(self, video_key: str):
+        self._conn.execute("DELETE FROM fingerprints WHERE video_key = ?", (video_key,))
+        self._conn.commit()
+
+    def __len__(self) -> int:
+        return self._conn.execute("SELECT COUNT(*) FROM fingerprints").fetchone()[0]
+
+    def close(self):
+        self._conn.close()
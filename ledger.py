@@ -0,0 +1,139 @@
+import json
+import os
+import socket
+import sqlite3
+import threading
+import time
+import uuid
+from typing import Any, Dict, Optional
+
+
+class JobLedger:
+    """多个进程共享的任务台账（SQLite），通过租约领取总结任务并发布结果
+
+    领取任务的进程需在租约到期前续约；进程退出或卡死导致租约过期后，其他进程可以接管。
+    租约按各主机的系统时间判断，多台主机共用时需保持时钟同步。
+    各方法都是阻塞调用（等待数据库锁时最长阻塞timeout秒），在事件循环中应通过 asyncio.to_thread 调用。
+    """
+
+    CLAIMED = 'claimed'
+    TAKEOVER = 'takeover'
+    HELD = 'held'
+    DONE = 'done'
+
+    def __init__(self, db_path: str, lease_ttl: float = 30, result_ttl: float = 0, wal: bool = True):
+        self.db_path = db_path
+        self.lease_ttl = lease_ttl
+        self.result_ttl = result_ttl
+        self.owner = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        # 同一连接会在多个线程中使用，事务之间需要串行
+        self._lock = threading.Lock()
+
+        os.makedirs(os.path.dirname(db_path) or '.', exist_ok=True)
+        # isolation_level=None：由各方法显式开启事务
+        self._conn = sqlite3.connect(db_path, timeout=10, isolation_level=None, check_same_thread=False)
+        # WAL依赖共享内存，只能在同一主机上使用；网络存储上使用默认的回滚日志
+        self._conn.execute(f"PRAGMA journal_mode={'WAL' if wal else 'DELETE'}")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS jobs ("
+            "  job_key TEXT PRIMARY KEY,"
+            "  owner TEXT NOT NULL,"
+            "  status TEXT NOT NULL,"
+            "  lease_until REAL NOT NULL,"
+            "  result TEXT,"
+            "  updated_at REAL NOT NULL"
+            ")"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_jobs_updated ON jobs(updated_at)")
+
+    def peek(self, job_key: str) -> str:
+        """只读查询任务状态（不占用写锁）：返回 HELD / DONE，可以领取时返回 CLAIMED"""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT owner, status, lease_until, updated_at FROM jobs WHERE job_key = ?", (job_key,)
+            ).fetchone()
+        return self._state(row, time.time())
+
+    def _state(self, row: Optional[tuple], now: float) -> str:
+        if row is not None:
+            owner, status, lease_until, updated_at = row
+            if status == 'done' and (self.result_ttl <= 0 or now - updated_at <= self.result_ttl):
+                return self.DONE
+            if status == 'running' and owner != self.owner:
+                return self.HELD if lease_until > now else self.TAKEOVER
+        return self.CLAIMED
+
+    def claim(self, job_key: str) -> str:
+        """尝试领取任务：返回 CLAIMED / TAKEOVER（接管过期租约）/ HELD（其他进程执行中）/ DONE（已有结果）"""
+        with self._lock:
+            return self._claim(job_key)
+
+    def _claim(self, job_key: str) -> str:
+        self._conn.execute("BEGIN IMMEDIATE")
+        try:
+            # 拿到写锁后再取时间，等锁的时间不计入租约
+            now = time.time()
+            row = self._conn.execute(
+                "SELECT owner, status, lease_until, updated_at FROM jobs WHERE job_key = ?", (job_key,)
+            ).fetchone()
+            outcome = self._state(row, now)
+            if outcome in (self.DONE, self.HELD):
+                self._conn.execute("COMMIT")
+                return outcome
+            self._conn.execute(
+                "INSERT OR REPLACE INTO jobs (job_key, owner, status, lease_until, result, updated_at) "
+                "VALUES (?, ?, 'running', ?, NULL, ?)",
+                (job_key, self.owner, now + self.lease_ttl, now)
+            )
+            self._conn.execute("COMMIT")
+            return outcome
+        except BaseException:
+            self._conn.execute("ROLLBACK")
+            raise
+
+    def renew(self, job_key: str) -> bool:
+        """续约，租约已被其他进程接管时返回False"""
+        now = time.time()
+        with self._lock:
+            cursor = self._conn.execute(
+                "UPDATE jobs SET lease_until = ?, updated_at = ? WHERE job_key = ? AND owner = ? AND status = 'running'",
+                (now + self.lease_ttl, now, job_key, self.owner)
+            )
+        return cursor.rowcount == 1
+
+    def publish(self, job_key: str, result: Dict[str, Any]):
+        """发布结果，等待中的进程随后可直接读取"""
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO jobs (job_key, owner, status, lease_until, result, updated_at) "
+                "VALUES (?, ?, 'done', ?, ?, ?)",
+                (job_key, self.owner, now, json.dumps(result, ensure_ascii=False), now)
+            )
+            self._prune(now)
+
+    def release(self, job_key: str):
+        """放弃本进程持有的租约（任务失败或取消），其他进程可立即重新领取"""
+        with self._lock:
+            self._conn.execute(
+                "DELETE FROM jobs WHERE job_key = ? AND owner = ? AND status = 'running'", (job_key, self.owner)
+            )
+
+    def result(self, job_key: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT result FROM jobs WHERE job_key = ? AND status = 'done'", (job_key,)
+            ).fetchone()
+        return json.loads(row[0]) if row and row[0] else None
+
+    def _prune(self, now: float):
+        """清除过期的结果和长时间无人续约的租约"""
+        self._conn.execute(
+            "DELETE FROM jobs WHERE (status = 'running' AND lease_until < ?) OR "
+            "(status = 'done' AND ? > 0 AND updated_at < ?)",
+            (now - self.lease_ttl, self.result_ttl, now - self.result_ttl)
+        )
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
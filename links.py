@@ -0,0 +1,150 @@
+import re
+from typing import Any, Iterator, List, Optional
+
+from .bvid import MAX_AID, av2bv
+
+# 单次扫描即可识别所有支持的链接格式，分支顺序保证完整链接优先于其中的BV号；
+# 开头的前瞻用于快速跳过不可能匹配的位置
+VIDEO_LINK_PATTERN = re.compile(
+    r"(?=[hHbBaA])(?:"
+    r"https?://(?:www\.|m\.)?bilibili\.com/video/(?P<url_id>BV[a-zA-Z0-9]{10}|av\d+)(?P<url_tail>[^\s'\"<>\\]*)"
+    r"|https?://(?:b23\.tv|bili2233\.cn)/(?P<short>[^\s'\"<>\\?#/]+)[^\s'\"<>\\]*"
+    r"|(?<![a-zA-Z0-9])(?P<bv>BV[a-zA-Z0-9]{10})(?![a-zA-Z0-9])"
+    r"|(?<![a-zA-Z0-9])(?P<av>av\d+)"
+    r")",
+    re.IGNORECASE
+)
+PAGE_PARAM_PATTERN = re.compile(r'[?&]p=(\d+)')
+# b23.tv及其备用域名的短链接，捕获短链码
+SHORT_URL_PATTERN = re.compile(r'^https?://(?:www\.)?(?:b23\.tv|bili2233\.cn)/([^\s/?#]+)', re.IGNORECASE)
+
+# JSON卡片中优先检查的字段（QQ小程序卡片、结构化消息卡片）
+CARD_URL_PATHS = (
+    ('meta', 'detail_1', 'qqdocurl'),
+    ('meta', 'detail_1', 'url'),
+    ('meta', 'news', 'jumpUrl'),
+)
+
+JSON_WALK_MAX_NODES = 2000
+JSON_WALK_MAX_DEPTH = 16
+
+
+def normalize_video_id(video_id: str) -> str:
+    """统一为BV号（同一视频的AV号和BV号去重时视为同一个），超出范围的AV号只统一前缀大小写"""
+    if video_id[:2].lower() == 'bv':
+        return 'BV' + video_id[2:]
+    aid = int(video_id[2:])
+    return av2bv(aid) if 0 < aid < MAX_AID else video_id.lower()
+
+
+def parse_short_code(url: str) -> Optional[str]:
+    """提取短链接中的短链码，不是短链接时返回None"""
+    match = SHORT_URL_PATTERN.match(url.strip())
+    return match.group(1) if match else None
+
+
+def normalize_match(match: 're.Match') -> str:
+    """把一次匹配规范化为视频ID；带分P参数的链接保留为规范链接，短链接统一为b23.tv并去掉分享参数"""
+    if match.group('bv'):
+        return normalize_video_id(match.group('bv'))
+    if match.group('av'):
+        return normalize_video_id(match.group('av'))
+    if match.group('short'):
+        return f"https://b23.tv/{match.group('short')}"
+
+    video_id = normalize_video_id(match.group('url_id'))
+    page = PAGE_PARAM_PATTERN.search(match.group('url_tail'))
+    if page and page.group(1) != '1':
+        return f"https://www.bilibili.com/video/{video_id}?p={page.group(1)}"
+    return video_id
+
+
+def iter_video_links(text: str) -> Iterator[str]:
+    """按出现顺序产出文本中的视频ID或短链接（未去重）"""
+    if not text:
+        return
+    for match in VIDEO_LINK_PATTERN.finditer(text):
+        yield normalize_match(match)
+
+
+class LinkCollector:
+    """按出现顺序收集去重后的链接，达到上限后停止收集"""
+
+    def __init__(self, limit: Optional[int] = None):
+        self.limit = limit
+        self.links: List[str] = []
+        self._seen = set()
+
+    @property
+    def full(self) -> bool:
+        return self.limit is not None and len(self.links) >= self.limit
+
+    def add(self, link: str) -> bool:
+        """加入一个链接，返回是否已达到上限"""
+        if link not in self._seen and not self.full:
+            self._seen.add(link)
+            self.links.append(link)
+        return self.full
+
+    def add_all(self, links: List[str]) -> bool:
+        for link in links:
+            if self.add(link):
+                break
+        return self.full
+
+    def add_text(self, text: str) -> bool:
+        """扫描文本并加入其中的链接，返回是否已达到上限"""
+        if self.full:
+            return True
+        for link in iter_video_links(text):
+            if self.add(link):
+                break
+        return self.full
+
+
+def extract_video_links(text: str, limit: Optional[int] = None) -> List[str]:
+    """从文本中提取去重后的视频ID或短链接"""
+    collector = LinkCollector(limit)
+    collector.add_text(text)
+    return collector.links
+
+
+def iter_json_strings(obj: Any, max_nodes: int = JSON_WALK_MAX_NODES,
+                      max_depth: int = JSON_WALK_MAX_DEPTH) -> Iterator[str]:
+    """非递归地遍历JSON对象中的字符串值，限制遍历的节点数和深度"""
+    stack = [(obj, 0)]
+    visited = 0
+    while stack and visited < max_nodes:
+        node, depth = stack.pop()
+        visited += 1
+        if isinstance(node, str):
+            yield node
+        elif depth < max_depth:
+            if isinstance(node, dict):
+                children = list(node.values())
+            elif isinstance(node, list):
+                children = node
+            else:
+                continue
+            # 逆序入栈以保持原有的遍历顺序
+            for child in reversed(children):
+                if isinstance(child, (str, dict, list)):
+                    stack.append((child, depth + 1))
+
+
+def extract_from_json(data: Any, limit: Optional[int] = None) -> List[str]:
+    """从JSON卡片中提取视频链接：先检查已知的卡片字段，再有界地遍历其余字符串"""
+    collector = LinkCollector(limit)
+
+    if isinstance(data, dict):
+        for path in CARD_URL_PATHS:
+            value = data
+            for key in path:
+                value = value.get(key) if isinstance(value, dict) else None
+            if isinstance(value, str) and collector.add_text(value):
+                return collector.links
+
+    for value in iter_json_strings(data):
+        if collector.add_text(value):
+            break
+    return collector.links
@@ -0,0 +1,177 @@
+import asyncio
+import json
+import random
+import time
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Set
+
+from .metrics import Metrics
+from .resilience import CircuitBreaker, CircuitOpenError, TransientError
+
+
+class LLMEndpoint:
+    """一个OpenAI兼容的LLM接口，记录延迟的滑动平均和熔断状态"""
+
+    def __init__(self, name: str, url: str, api_key: str, model: str, weight: float,
+                 timeout: float, breaker: CircuitBreaker):
+        self.name = name
+        self.url = url
+        self.api_key = api_key
+        self.model = model
+        self.weight = max(0.0, weight)
+        self.timeout = timeout
+        self.breaker = breaker
+        # 尚无样本时为None，路由时会被优先尝试以获得延迟数据
+        self.latency: Optional[float] = None
+        self.inflight = 0
+
+    def observe(self, latency: float, alpha: float):
+        if self.latency is None:
+            self.latency = latency
+        else:
+            self.latency = alpha * latency + (1 - alpha) * self.latency
+
+
+def parse_endpoints(text: str) -> List[Dict[str, Any]]:
+    """解析llm_endpoints配置（JSON数组），格式错误时抛出ValueError"""
+    text = (text or '').strip()
+    if not text:
+        return []
+    items = json.loads(text)
+    if not isinstance(items, list):
+        raise ValueError("llm_endpoints必须是JSON数组")
+    for index, item in enumerate(items):
+        if not isinstance(item, dict) or not item.get('url') or not item.get('model'):
+            raise ValueError(f"llm_endpoints第{index + 1}项缺少url或model")
+    return items
+
+
+class EndpointPool:
+    """LLM接口池：按延迟或权重选择接口，超过对冲延迟后并发请求下一个接口，失败时自动切换"""
+
+    def __init__(self, endpoints: List[LLMEndpoint], routing: str = 'latency', hedge_delay: float = 0,
+                 ewma_alpha: float = 0.3, metrics: Optional[Metrics] = None):
+        self.endpoints = endpoints
+        self.routing = routing
+        self.hedge_delay = hedge_delay
+        self.ewma_alpha = ewma_alpha
+        self.metrics = metrics
+
+    def __len__(self) -> int:
+        return len(self.endpoints)
+
+    @property
+    def model_tag(self) -> str:
+        """参与缓存键的模型标识"""
+        return '+'.join(sorted({endpoint.model for endpoint in self.endpoints}))
+
+    def ranked(self) -> List[LLMEndpoint]:
+        """按路由策略排序的候选接口，熔断中的接口排在最后"""
+        def latency_score(endpoint: LLMEndpoint) -> float:
+            if endpoint.latency is None:
+                return 0.0
+            return endpoint.latency * (1 + endpoint.inflight)
+
+        available = [e for e in self.endpoints if not e.breaker.retry_in()]
+        unavailable = [e for e in self.endpoints if e.breaker.retry_in()]
+        if self.routing == 'weighted':
+            # 按权重无放回抽样决定顺序
+            ordered = []
+            candidates = [e for e in available if e.weight > 0]
+            while candidates:
+                chosen = random.choices(candidates, weights=[e.weight for e in candidates])[0]
+                ordered.append(chosen)
+                candidates.remove(chosen)
+            ordered += [e for e in available if e.weight <= 0]
+        else:
+            ordered = sorted(available, key=latency_score)
+        return ordered + unavailable
+
+    async def _attempt(self, endpoint: LLMEndpoint, call: Callable[[LLMEndpoint], Awaitable[Optional[str]]]) -> Optional[str]:
+        if not endpoint.breaker.allow():
+            return None
+        endpoint.inflight += 1
+        start = time.perf_counter()
+        try:
+            result = await call(endpoint)
+        except (TransientError, asyncio.TimeoutError):
+            endpoint.breaker.record_failure()
+            self._count(endpoint, 'error')
+            raise
+        except asyncio.CancelledError:
+            # 对冲落败被取消：用已耗时作为延迟的下界，避免慢接口一直因缺少样本被优先选中
+            endpoint.breaker.release()
+            endpoint.observe(time.perf_counter() - start, self.ewma_alpha)
+            raise
+        except BaseException:
+            endpoint.breaker.release()
+            raise
+        finally:
+            endpoint.inflight -= 1
+
+        endpoint.breaker.record_success()
+        if result is None:
+            self._count(endpoint, 'empty')
+            return None
+        endpoint.observe(time.perf_counter() - start, self.ewma_alpha)
+        self._count(endpoint, 'ok')
+        if self.metrics:
+            self.metrics.set_gauge('llm_latency_seconds', endpoint.latency, endpoint=endpoint.name)
+        return result
+
+    def _count(self, endpoint: LLMEndpoint, result: str):
+        if self.metrics:
+            self.metrics.inc('llm_requests_total', endpoint=endpoint.name, result=result)
+
+    async def run(self, call: Callable[[LLMEndpoint], Awaitable[Optional[str]]]) -> Optional[str]:
+        """依次尝试候选接口，返回第一个非空结果
+
+        当前请求超过hedge_delay仍未返回时并发请求下一个接口，先返回者胜出；
+        请求失败时立即切换到下一个接口。全部失败且包含临时错误时抛出TransientError，
+        所有接口都在熔断中时抛出CircuitOpenError。
+        """
+        candidates = self.ranked()
+        pending: Set[asyncio.Task] = set()
+        transient_error: Optional[TransientError] = None
+
+        def launch() -> bool:
+            while candidates:
+                endpoint = candidates.pop(0)
+                if endpoint.breaker.retry_in():
+                    continue
+                pending.add(asyncio.create_task(self._attempt(endpoint, call)))
+                return True
+            return False
+
+        if not launch():
+            raise CircuitOpenError("LLM接口全部熔断中")
+        try:
+            while pending:
+                timeout = self.hedge_delay if self.hedge_delay > 0 and candidates else None
+                done, _ = await asyncio.wait(pending, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+                if not done:
+                    # 超过对冲延迟，向下一个接口发出相同请求
+                    if launch() and self.metrics:
+                        self.metrics.inc('llm_hedged_total')
+                    continue
+
+                for task in done:
+                    pending.discard(task)
+                    try:
+                        result = task.result()
+                    except TransientError as e:
+                        transient_error = e
+                        result = None
+                    except Exception:
+                        # 超时或其他错误
+                        result = None
+                    if result is not None:
+                        return result
+                    # 失败或返回空内容，立即切换到下一个接口
+                    launch()
+        finally:
+            for task in pending:
+                task.cancel()
+
+        if transient_error:
+            raise transient_error
+        return None
@@ -1,14 +1,44 @@
 import asyncio
+import codecs
+import hashlib
+import os
 import re
 import json
-from typing import Optional, Dict, Any, List
-from urllib.parse import urlparse, parse_qs
+import sqlite3
+import time
+from typing import Optional, Dict, Any, List, Callable, Awaitable, Tuple
+from urllib.parse import urlparse, parse_qs, urljoin, urlencode
 import aiohttp
-from astrbot.api.event import filter, AstrMessageEvent
-from astrbot.api.star import Context, Star, register
+from aiohttp import web
+from astrbot.api.event import filter, AstrMessageEvent, MessageChain
+from astrbot.api.star import Context, Star, register, StarTools
 from astrbot.api import logger, AstrBotConfig
 import astrbot.api.message_components as Comp
 
+from .bvid import av2bv, is_valid_bvid
+from .cache import SummaryCache, TTLCache
+from .fingerprint import FingerprintIndex, simhash
+from .ledger import JobLedger
+from .metrics import Metrics, timed
+from .llmpool import EndpointPool, LLMEndpoint, parse_endpoints
+from .links import LinkCollector, extract_from_json, extract_video_links, parse_short_code
+from .ratelimit import RateLimiter, TokenBucket
+from .resilience import (
+    RISK_CONTROL_CODES, CircuitBreaker, CircuitOpenError, Deadline, RetryPolicy, TransientError, parse_retry_after
+)
+from .scheduler import FairScheduler, QueueFullError
+from .segstore import SegmentStore
+from .subscriptions import SubscriptionStore, plan_batches
+from .wbi import extract_wbi_keys, get_mixin_key, sign_params
+from .subtitle import (
+    Segment, SegmentArray, SubtitleStreamParser, compact_segments, estimate_tokens, format_timestamp, join_segments,
+    segment_tokens, split_segments, text_length
+)
+
+
+class SummaryError(Exception):
+    """总结流程中的可预期失败，异常信息直接回复给用户"""
+
 
 @register(
     "astrbot_plugin_bilibili_summary",
@@ -29,67 +59,432 @@ class BilibiliSummaryPlugin(Star):
         self.bilibili_sessdata = self.config.get("bilibili_sessdata", "")
         self.request_interval = self.config.get("request_interval", 2.0)
         self.max_subtitle_length = self.config.get("max_subtitle_length", 8000)
+        self.max_subtitle_chars = self.config.get("max_subtitle_chars", 100000)
+        self.max_prompt_tokens = self.config.get("max_prompt_tokens", 6000)
+        self.subtitle_compaction = self.config.get("subtitle_compaction", True)
+        self.chunk_concurrency = self.config.get("chunk_concurrency", 3)
+        self.reduce_fanout = self.config.get("reduce_fanout", 5)
+        self.max_reduce_tiers = self.config.get("max_reduce_tiers", 2)
+        self.max_parts = self.config.get("max_parts", 10)
+        self.max_batch_videos = self.config.get("max_batch_videos", 10)
+        self.batch_concurrency = self.config.get("batch_concurrency", 5)
+        self.batch_merge_output = self.config.get("batch_merge_output", False)
+        self.stream_output = self.config.get("stream_output", False)
+        self.stream_flush_interval = self.config.get("stream_flush_interval", 3.0)
+        self.stream_flush_chars = self.config.get("stream_flush_chars", 200)
+        self.ask_top_k = self.config.get("ask_top_k", 6)
+        self.request_deadline = self.config.get("request_deadline", 150)
+        self.degraded_reserve = self.config.get("degraded_reserve", 15)
+        self.dedup_max_distance = self.config.get("dedup_max_distance", 4)
         self.summary_prompt = self.config.get("summary_prompt", 
             "请根据以下视频字幕和简介，生成一个简洁明了的视频内容总结。总结应该包含视频的主要内容、关键信息和要点。请用中文回答。")
+        self.http_connect_timeout = self.config.get("http_connect_timeout", 5.0)
+        self.http_read_timeout = self.config.get("http_read_timeout", 15.0)
+        self.llm_timeout = self.config.get("llm_timeout", 120.0)
+        self.http_pool_per_host = self.config.get("http_pool_per_host", 8)
+        self.max_redirects = self.config.get("max_redirects", 5)
+        # B站接口地址，基准测试时可替换为本地模拟服务
+        self.api_base = "https://api.bilibili.com"
+
+        # 共享的HTTP客户端，首次请求时在事件循环中创建，插件卸载时关闭
+        self._http_session: Optional[aiohttp.ClientSession] = None
+        self._http_session_lock = asyncio.Lock()
+
+        # 全局限流器：按接口分桶，所有B站请求都需先获取令牌
+        rate = 1.0 / self.request_interval if self.request_interval > 0 else 0.0
+        self.rate_limiter = RateLimiter(
+            {'view': rate, 'player': rate, 'subtitle': rate, 'b23': rate, 'nav': rate, 'space': rate},
+            burst=self.config.get("rate_limit_burst", 3)
+        )
+
+        # 进程内的耗时和计数统计，可选导出为Prometheus文本格式
+        self.metrics = Metrics()
+        self.metrics_export_file = self.config.get("metrics_export_file", "")
+        self.metrics_export_port = self.config.get("metrics_export_port", 0)
+        self.metrics_export_interval = self.config.get("metrics_export_interval", 60)
+        self._metrics_task: Optional[asyncio.Task] = None
+        self._metrics_runner: Optional[web.AppRunner] = None
+
+        # 临时错误（风控、429、5xx、网络异常）的退避重试，以及按上游划分的熔断器
+        self.retry_policy = RetryPolicy(
+            max_attempts=self.config.get("retry_max_attempts", 3),
+            base_delay=self.config.get("retry_base_delay", 1.0),
+            max_delay=self.config.get("retry_max_delay", 10)
+        )
+        self.breakers: Dict[str, CircuitBreaker] = {
+            name: CircuitBreaker(
+                name,
+                failure_threshold=self.config.get("breaker_failure_threshold", 5),
+                recovery_timeout=self.config.get("breaker_recovery_timeout", 30),
+                on_state_change=self.on_breaker_state_change
+            )
+            for name in ('view', 'player', 'subtitle', 'b23', 'nav', 'space')
+        }
+
+        # LLM接口池：未配置llm_endpoints时只包含上面的OpenAI配置
+        self.llm_pool = self.build_llm_pool()
+
+        # 总结任务调度器：固定数量的工作协程，按群组/用户轮转，队列满时拒绝
+        self.scheduler = FairScheduler(
+            workers=self.config.get("scheduler_workers", 4),
+            max_queue=self.config.get("scheduler_max_queue", 20),
+            per_user_limit=self.config.get("per_user_concurrency", 2)
+        )
+
+        # 进行中的总结任务，用于合并同一视频的并发请求
+        self._inflight: Dict[str, asyncio.Future] = {}
+
+        self.data_dir = str(StarTools.get_data_dir("astrbot_plugin_bilibili_summary"))
+
+        # 短链码 -> BV号 的解析缓存
+        self.short_link_cache = TTLCache(
+            max_size=self.config.get("short_link_cache_size", 10000),
+            ttl=self.config.get("short_link_cache_ttl_hours", 720) * 3600,
+            persist_path=os.path.join(self.data_dir, "short_links.json")
+            if self.config.get("short_link_cache_persist", True) else None
+        )
+
+        # WBI签名用的mixin_key，内存缓存并持久化，过期或签名被拒绝时重新获取
+        self.wbi_key_cache = TTLCache(max_size=1, ttl=self.WBI_KEY_TTL,
+                                      persist_path=os.path.join(self.data_dir, "wbi_key.json"))
+        self._wbi_key_lock = asyncio.Lock()
+        self._wbi_key_retry_at = 0.0
+
+        # 视频信息和字幕的短期内存缓存，被动预取和用户请求共用
+        metadata_ttl = self.config.get("metadata_cache_ttl_minutes", 30) * 60
+        self.video_info_cache = TTLCache(max_size=1000, ttl=metadata_ttl)
+        self.subtitle_cache = TTLCache(max_size=200, ttl=metadata_ttl)
+
+        # 被动预取：监听群消息中的B站链接，在后台低优先级地预热缓存
+        self.prefetch_group_budget = self.config.get("prefetch_group_budget", 10)
+        # 预算不大于0时视为关闭（速率为0的令牌桶表示不限流，不能直接用于预算）
+        self.prefetch_enabled = self.config.get("prefetch_enabled", False) and self.prefetch_group_budget > 0
+        self.prefetch_summaries = self.config.get("prefetch_summaries", False)
+        self._prefetch_budgets: Dict[str, TokenBucket] = {}
+        self._prefetch_queue: Optional[asyncio.Queue] = None
+        self._prefetch_task: Optional[asyncio.Task] = None
+
+        # UP主订阅：后台按间隔轮询投稿列表，新视频离线生成总结，可选推送到订阅的会话
+        self.subscriptions = SubscriptionStore(os.path.join(self.data_dir, "subscriptions.json"))
+        self.subscription_poll_interval = self.config.get("subscription_poll_interval", 600)
+        self.subscription_batch_size = self.config.get("subscription_batch_size", 5)
+        self.subscription_concurrency = self.config.get("subscription_concurrency", 2)
+        self.subscription_push = self.config.get("subscription_push", True)
+        self._subscription_task: Optional[asyncio.Task] = None
+
+        # 总结结果缓存
+        self.cache_enabled = self.config.get("cache_enabled", True)
+        self.summary_cache: Optional[SummaryCache] = None
+        if self.cache_enabled:
+            self.summary_cache = SummaryCache(
+                os.path.join(self.data_dir, "summary_cache.db"),
+                ttl=self.config.get("cache_ttl_hours", 168) * 3600,
+                max_entries=self.config.get("cache_max_entries", 5000)
+            )
+
+        # 字幕内容指纹索引：重新上传或搬运的视频复用已有总结（依赖总结缓存）
+        self.fingerprint_index: Optional[FingerprintIndex] = None
+        if self.summary_cache and self.config.get("dedup_enabled", True):
+            self.fingerprint_index = FingerprintIndex(
+                os.path.join(self.data_dir, "fingerprints.db"),
+                max_entries=self.config.get("dedup_max_entries", 500000)
+            )
+
+        # 多实例协作：多个进程共用同一个任务台账，同一视频只由领取租约的进程处理，其余进程等待其结果
+        self.job_ledger: Optional[JobLedger] = None
+        coordination_db_path = self.config.get("coordination_db_path", "")
+        if coordination_db_path:
+            self.job_ledger = JobLedger(
+                coordination_db_path,
+                lease_ttl=self.config.get("coordination_lease_ttl", 30),
+                result_ttl=self.config.get("cache_ttl_hours", 168) * 3600,
+                wal=self.config.get("coordination_wal", True)
+            )
+
+        # 带时间戳的字幕存储和检索索引，用于 /bs ask 追问
+        self.segment_store = SegmentStore(
+            os.path.join(self.data_dir, "segments.db"),
+            ttl=self.config.get("cache_ttl_hours", 168) * 3600,
+            max_entries=self.config.get("segment_store_max_entries", 1000)
+        )
         
         # 验证配置
-        if not self.openai_api_key:
+        if not self.llm_pool.endpoints:
             logger.warning("Bilibili Summary插件: 未配置OpenAI API密钥")
         if not self.bilibili_sessdata:
             logger.warning("Bilibili Summary插件: 未配置Bilibili SESSDATA，可能无法获取字幕")
             
         logger.info("Bilibili Summary插件: 初始化完成")
 
-    def extract_bilibili_links_from_message(self, event: AstrMessageEvent) -> List[str]:
-        """从消息链中提取所有可能的bilibili链接"""
-        links = []
+    async def initialize(self):
+        """插件加载完成后启动指标导出和预取任务"""
+        if self.prefetch_enabled:
+            self._prefetch_queue = asyncio.Queue(maxsize=self.PREFETCH_QUEUE_SIZE)
+            self._prefetch_task = asyncio.create_task(self.prefetch_worker())
+        if self.subscription_poll_interval > 0:
+            self._subscription_task = asyncio.create_task(self.subscription_loop())
+        if self.metrics_export_file:
+            self._metrics_task = asyncio.create_task(self.export_metrics_loop())
+        if self.metrics_export_port:
+            app = web.Application()
+            app.router.add_get('/metrics', self.handle_metrics_request)
+            self._metrics_runner = web.AppRunner(app, access_log=None)
+            await self._metrics_runner.setup()
+            site = web.TCPSite(self._metrics_runner, self.config.get("metrics_export_host", "127.0.0.1"),
+                               self.metrics_export_port)
+            await site.start()
+            logger.info(f"Bilibili Summary插件: 指标导出端口已启动 :{self.metrics_export_port}/metrics")
+
+    async def export_metrics_loop(self):
+        """定期把指标写入本地文件"""
+        while True:
+            await asyncio.sleep(self.metrics_export_interval)
+            try:
+                self.write_metrics_file()
+            except OSError as e:
+                logger.warning(f"写入指标文件失败: {str(e)}")
+
+    def write_metrics_file(self):
+        tmp_path = self.metrics_export_file + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            f.write(self.metrics.render_prometheus())
+        os.replace(tmp_path, self.metrics_export_file)
+
+    async def handle_metrics_request(self, request: web.Request) -> web.Response:
+        return web.Response(text=self.metrics.render_prometheus(), content_type='text/plain')
+
+    # 字幕过短时指纹区分度不够，不参与去重
+    DEDUP_MIN_CHARS = 200
+
+    DEGRADED_MIN_SECONDS = 1.0
+    DEGRADED_PROMPT = "请根据视频标题和简介，用两三句话简要介绍这个视频可能的内容，不要编造具体细节。请用中文回答。"
+
+    ASK_PROMPT = ("你是视频内容问答助手。下面给出视频字幕中与问题相关的片段，每段前标有时间范围。"
+                  "请只根据这些片段回答问题，引用内容时注明对应的时间；片段中没有相关信息时请直接说明。请用中文回答。")
+    ASK_COMMAND_PATTERN = re.compile(r'^\s*/?bs\s+ask\s*(.*)$', re.DOTALL)
+
+    # B站每天轮换WBI密钥，提前刷新
+    WBI_KEY_TTL = 6 * 3600
+    WBI_KEY_RETRY_INTERVAL = 60
+
+    PREFETCH_QUEUE_SIZE = 50
+    PREFETCH_LINKS_PER_MESSAGE = 3
+    # 以本插件命令开头的消息由命令处理，不再预取
+    PLUGIN_COMMAND_PATTERN = re.compile(r'^\s*/?bs(?:_\w+)?(?:\s|$)')
+
+    # 每次轮询只看最新的几个投稿；每轮每个UP主最多总结的新视频数
+    SUBSCRIPTION_PAGE_SIZE = 5
+    SUBSCRIPTION_MAX_NEW_VIDEOS = 3
+
+    SUBTITLE_READ_CHUNK = 64 * 1024
+
+    # 等待其他实例处理同一视频时查询台账的间隔
+    LEDGER_POLL_INTERVAL = 1.0
+
+    BILIBILI_UNAVAILABLE_MESSAGE = "⏳ B站接口触发风控或暂时不可用，请稍后再试"
+
+    CIRCUIT_STATE_VALUES = {CircuitBreaker.CLOSED: 0, CircuitBreaker.HALF_OPEN: 1, CircuitBreaker.OPEN: 2}
+
+    def on_breaker_state_change(self, breaker: CircuitBreaker, old_state: str, new_state: str):
+        """熔断器状态变化时记录日志和指标"""
+        logger.warning(f"熔断器[{breaker.name}]状态变化: {old_state} -> {new_state}")
+        self.metrics.set_gauge('circuit_state', self.CIRCUIT_STATE_VALUES[new_state], upstream=breaker.name)
+        if new_state == CircuitBreaker.OPEN:
+            self.metrics.inc('circuit_opened_total', upstream=breaker.name)
+
+    def build_llm_pool(self) -> EndpointPool:
+        """根据配置构建LLM接口池，每个接口有独立的熔断器"""
+        try:
+            items = parse_endpoints(self.config.get("llm_endpoints", ""))
+        except ValueError as e:
+            logger.error(f"Bilibili Summary插件: llm_endpoints配置无效，使用默认接口: {str(e)}")
+            items = []
+        if not items and self.openai_api_key:
+            items = [{'name': 'default', 'url': self.openai_api_url, 'key': self.openai_api_key,
+                      'model': self.openai_model}]
+
+        endpoints = []
+        for index, item in enumerate(items):
+            name = str(item.get('name') or f"llm{index + 1}")
+            breaker = CircuitBreaker(
+                f"llm:{name}",
+                failure_threshold=self.config.get("breaker_failure_threshold", 5),
+                recovery_timeout=self.config.get("breaker_recovery_timeout", 30),
+                on_state_change=self.on_breaker_state_change
+            )
+            self.breakers[breaker.name] = breaker
+            endpoints.append(LLMEndpoint(
+                name=name,
+                url=item['url'],
+                api_key=item.get('key', ''),
+                model=item['model'],
+                weight=float(item.get('weight', 1)),
+                timeout=float(item.get('timeout', self.llm_timeout)),
+                breaker=breaker
+            ))
+        return EndpointPool(
+            endpoints,
+            routing=self.config.get("llm_routing", "latency"),
+            hedge_delay=self.config.get("llm_hedge_delay", 0),
+            metrics=self.metrics
+        )
+
+    def retry_callback(self, upstream: str) -> Callable[[int, TransientError, float], None]:
+        """生成记录重试日志和计数的回调"""
+        def on_retry(attempt: int, error: TransientError, delay: float):
+            logger.warning(f"{upstream}请求失败({error})，{delay:.1f}秒后第{attempt}次重试")
+            self.metrics.inc('retries_total', upstream=upstream)
+        return on_retry
+
+    async def bili_get_json(self, endpoint: str, url: str, headers: Dict[str, str],
+                            params: Optional[Dict[str, Any]] = None, signed: bool = False,
+                            reader: Optional[Callable[[aiohttp.ClientResponse], Awaitable[Any]]] = None
+                            ) -> Tuple[int, Any]:
+        """请求B站接口并返回(HTTP状态码, JSON)，传入reader时返回reader读取响应体的结果（不检查业务错误码）
+
+        signed为True时每次尝试都用当前的mixin_key对params做WBI签名，签名被拒绝(-352)时刷新密钥后重试。
+        风控错误码、429/412/5xx和网络异常会退避重试，连续失败后该接口熔断；
+        重试耗尽时抛出TransientError，熔断中抛出CircuitOpenError。
+        """
+        async def attempt() -> Tuple[int, Dict[str, Any]]:
+            mixin_key = await self.get_wbi_mixin_key() if signed else None
+            request_url = url
+            if params is not None:
+                query = sign_params(params, mixin_key) if mixin_key else params
+                request_url = f"{url}?{urlencode(query)}"
+
+            session = await self.get_http_session()
+            await self.rate_limiter.acquire(endpoint)
+            try:
+                async with session.get(request_url, headers=headers) as response:
+                    status = response.status
+                    if status != 200:
+                        self.metrics.inc('bilibili_errors_total', endpoint=endpoint, code=f"http_{status}")
+                        if status in (412, 429) or status >= 500:
+                            raise TransientError(f"HTTP {status}",
+                                                 parse_retry_after(response.headers.get('Retry-After')))
+                        return status, {}
+                    if reader is not None:
+                        return status, await reader(response)
+                    data = await response.json()
+            except (aiohttp.ClientConnectionError, aiohttp.ClientPayloadError, asyncio.TimeoutError) as e:
+                self.metrics.inc('bilibili_errors_total', endpoint=endpoint, code='network')
+                raise TransientError(f"网络异常: {e.__class__.__name__}") from e
+
+            code = data.get('code')
+            if code:
+                self.metrics.inc('bilibili_errors_total', endpoint=endpoint, code=code)
+                if code == -352 and mixin_key:
+                    # 签名校验失败，多半是密钥已轮换，下次尝试前刷新
+                    await self.refresh_wbi_mixin_key(mixin_key)
+                if code in RISK_CONTROL_CODES:
+                    raise TransientError(f"风控 code={code}")
+            return status, data
+
+        return await self.retry_policy.run(attempt, self.breakers[endpoint], self.retry_callback(endpoint))
+
+    async def get_wbi_mixin_key(self) -> Optional[str]:
+        """获取WBI签名用的mixin_key，缓存未命中时从nav接口获取，获取失败返回None（不签名）"""
+        mixin_key = self.wbi_key_cache.get('mixin_key')
+        if mixin_key:
+            return mixin_key
+        if time.monotonic() < self._wbi_key_retry_at:
+            # 刚获取失败过，暂不重复请求nav接口
+            return None
+        return await self.refresh_wbi_mixin_key(None)
+
+    async def refresh_wbi_mixin_key(self, stale_key: Optional[str]) -> Optional[str]:
+        """重新获取mixin_key；并发调用只请求一次，缓存中已不是stale_key时直接返回新密钥"""
+        async with self._wbi_key_lock:
+            current = self.wbi_key_cache.get('mixin_key')
+            if current and current != stale_key:
+                return current
+
+            headers = {
+                'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36',
+                'Referer': 'https://www.bilibili.com/'
+            }
+            if self.bilibili_sessdata:
+                headers['Cookie'] = f'SESSDATA={self.bilibili_sessdata}'
+
+            try:
+                _, data = await self.bili_get_json('nav', f"{self.api_base}/x/web-interface/nav", headers)
+                keys = extract_wbi_keys(data)
+                if not keys:
+                    raise ValueError("nav接口未返回wbi_img")
+            except (TransientError, CircuitOpenError, ValueError) as e:
+                logger.warning(f"获取WBI密钥失败，暂不签名: {str(e)}")
+                self._wbi_key_retry_at = time.monotonic() + self.WBI_KEY_RETRY_INTERVAL
+                return None
+
+            mixin_key = get_mixin_key(*keys)
+            self.wbi_key_cache.set('mixin_key', mixin_key)
+            try:
+                self.wbi_key_cache.save()
+            except OSError as e:
+                logger.warning(f"保存WBI密钥失败: {str(e)}")
+            self.metrics.inc('wbi_key_refresh_total', reason='rejected' if stale_key else 'expired')
+            logger.info("已刷新WBI签名密钥")
+            return mixin_key
+
+    async def get_http_session(self) -> aiohttp.ClientSession:
+        """获取共享的HTTP客户端（连接池复用keep-alive连接和DNS缓存）"""
+        if self._http_session is not None and not self._http_session.closed:
+            return self._http_session
+
+        async with self._http_session_lock:
+            if self._http_session is None or self._http_session.closed:
+                connector = aiohttp.TCPConnector(
+                    limit=self.http_pool_per_host * 4,
+                    limit_per_host=self.http_pool_per_host,
+                    ttl_dns_cache=300,
+                    keepalive_timeout=60
+                )
+                timeout = aiohttp.ClientTimeout(
+                    total=None,
+                    connect=self.http_connect_timeout,
+                    sock_read=self.http_read_timeout
+                )
+                self._http_session = aiohttp.ClientSession(connector=connector, timeout=timeout)
+                logger.info("Bilibili Summary插件: 已创建共享HTTP客户端")
+
+        return self._http_session
+
+    def extract_bilibili_links_from_message(self, event: AstrMessageEvent, limit: Optional[int] = None) -> List[str]:
+        """从消息链中提取所有可能的bilibili链接（按出现顺序去重，最多limit个）"""
+        collector = LinkCollector(limit)
 
         # 从消息链中提取链接
         for component in event.message_obj.message:
             if isinstance(component, Comp.Plain):
-                text = component.text
                 # 查找文本中的bilibili链接
-                extracted = self.extract_links_from_text(text)
-                links.extend(extracted)
+                collector.add_text(component.text)
 
             elif isinstance(component, Comp.Reply):
                 # 处理引用消息
                 logger.info(f"检测到引用消息: {component}")
-                reply_links = self.extract_bilibili_from_reply(event, component)
-                links.extend(reply_links)
+                collector.add_all(self.extract_bilibili_from_reply(event, component, limit))
 
             elif isinstance(component, Comp.Forward):
                 # 处理转发消息
                 logger.info(f"检测到转发消息: {component}")
-                forward_links = self.extract_bilibili_from_forward_message(component)
-                links.extend(forward_links)
+                collector.add_all(self.extract_bilibili_from_forward_message(component, limit))
 
             elif hasattr(component, 'type') and component.type == 'Json':
                 # 处理JSON消息组件（如QQ小程序卡片）
                 logger.info(f"检测到JSON消息组件: {component}")
-                json_links = self.extract_bilibili_from_json_component(component)
-                links.extend(json_links)
-
-        return links
+                collector.add_all(self.extract_bilibili_from_json_component(component, limit))
 
-    def extract_links_from_text(self, text: str) -> List[str]:
-        """从文本中提取bilibili链接"""
-        links = []
-        url_patterns = [
-            r'https?://(?:www\.)?bilibili\.com/video/[^\s\'"<>]+',
-            r'https?://m\.bilibili\.com/video/[^\s\'"<>]+',
-            r'https?://b23\.tv/[^\s\'"<>]+',
-            r'BV[a-zA-Z0-9]{10}',
-            r'av\d+',
-        ]
+            if collector.full:
+                break
 
-        for pattern in url_patterns:
-            matches = re.findall(pattern, text, re.IGNORECASE)
-            links.extend(matches)
+        return collector.links
 
-        return links
+    def extract_links_from_text(self, text: str, limit: Optional[int] = None) -> List[str]:
+        """从文本中提取bilibili链接"""
+        return extract_video_links(text, limit)
 
-    def extract_bilibili_from_json_component(self, json_component) -> List[str]:
+    def extract_bilibili_from_json_component(self, json_component, limit: Optional[int] = None) -> List[str]:
         """从JSON消息组件中提取bilibili链接"""
         links = []
 
@@ -103,46 +498,8 @@ class BilibiliSummaryPlugin(Star):
                     json_data = json_component.data
 
             if json_data:
-                # 递归搜索JSON中的所有字符串值
-                def search_json_for_links(obj):
-                    found_links = []
-                    if isinstance(obj, dict):
-                        for key, value in obj.items():
-                            if isinstance(value, str):
-                                # 在字符串值中查找链接
-                                found_links.extend(self.extract_links_from_text(value))
-                            elif isinstance(value, (dict, list)):
-                                found_links.extend(search_json_for_links(value))
-                    elif isinstance(obj, list):
-                        for item in obj:
-                            if isinstance(item, str):
-                                found_links.extend(self.extract_links_from_text(item))
-                            elif isinstance(item, (dict, list)):
-                                found_links.extend(search_json_for_links(item))
-                    return found_links
-
-                links.extend(search_json_for_links(json_data))
-
-                # 特别处理bilibili小程序卡片
-                if isinstance(json_data, dict):
-                    # 检查是否是bilibili相关的小程序
-                    meta = json_data.get('meta', {})
-                    if meta:
-                        detail = meta.get('detail_1', {})
-                        if detail:
-                            # 检查应用名称
-                            title = detail.get('title', '')
-                            if '哔哩哔哩' in title or 'bilibili' in title.lower():
-                                # 提取qqdocurl字段中的链接
-                                qqdocurl = detail.get('qqdocurl', '')
-                                if qqdocurl:
-                                    links.extend(self.extract_links_from_text(qqdocurl))
-
-                                # 提取url字段中的链接
-                                url = detail.get('url', '')
-                                if url:
-                                    links.extend(self.extract_links_from_text(url))
-
+                # 优先检查bilibili小程序卡片的链接字段，再有界地遍历其余字符串
+                links = extract_from_json(json_data, limit)
                 logger.info(f"从JSON组件中提取到链接: {links}")
 
         except Exception as e:
@@ -150,9 +507,10 @@ class BilibiliSummaryPlugin(Star):
 
         return links
 
-    def extract_bilibili_from_reply(self, event: AstrMessageEvent, reply_component) -> List[str]:
+    def extract_bilibili_from_reply(self, event: AstrMessageEvent, reply_component,
+                                    limit: Optional[int] = None) -> List[str]:
         """从引用消息中提取bilibili链接"""
-        links = []
+        collector = LinkCollector(limit)
 
         try:
             # 引用消息的处理方式取决于平台
@@ -161,93 +519,67 @@ class BilibiliSummaryPlugin(Star):
 
             # 尝试从引用消息的文本内容中提取链接
             if hasattr(reply_component, 'text') and reply_component.text:
-                text = reply_component.text
-                url_patterns = [
-                    r'https?://(?:www\.)?bilibili\.com/video/[^\s]+',
-                    r'https?://m\.bilibili\.com/video/[^\s]+',
-                    r'https?://b23\.tv/[^\s]+',
-                    r'BV[a-zA-Z0-9]{10}',
-                    r'av\d+',
-                ]
-
-                for pattern in url_patterns:
-                    matches = re.findall(pattern, text, re.IGNORECASE)
-                    links.extend(matches)
-
-            # 如果引用消息本身包含消息链，递归解析
+                collector.add_text(reply_component.text)
+
+            # 如果引用消息本身包含消息链，递归解析；兼容旧的message属性
+            sub_components = None
             if hasattr(reply_component, 'chain') and reply_component.chain:
-                for sub_component in reply_component.chain:
-                    if isinstance(sub_component, Comp.Plain):
-                        text = sub_component.text
-                        links.extend(self.extract_links_from_text(text))
-                    elif hasattr(sub_component, 'type') and sub_component.type == 'Json':
-                        # 处理引用消息中的JSON组件
-                        json_links = self.extract_bilibili_from_json_component(sub_component)
-                        links.extend(json_links)
-
-            # 兼容旧的message属性
+                sub_components = reply_component.chain
             elif hasattr(reply_component, 'message') and reply_component.message:
-                for sub_component in reply_component.message:
-                    if isinstance(sub_component, Comp.Plain):
-                        text = sub_component.text
-                        links.extend(self.extract_links_from_text(text))
-                    elif hasattr(sub_component, 'type') and sub_component.type == 'Json':
-                        json_links = self.extract_bilibili_from_json_component(sub_component)
-                        links.extend(json_links)
+                sub_components = reply_component.message
+
+            for sub_component in sub_components or []:
+                if collector.full:
+                    break
+                if isinstance(sub_component, Comp.Plain):
+                    collector.add_text(sub_component.text)
+                elif hasattr(sub_component, 'type') and sub_component.type == 'Json':
+                    # 处理引用消息中的JSON组件
+                    collector.add_all(self.extract_bilibili_from_json_component(sub_component, limit))
 
         except Exception as e:
             logger.warning(f"解析引用消息失败: {str(e)}")
 
-        return links
+        return collector.links
 
-    def extract_bilibili_from_forward_message(self, forward_component) -> List[str]:
+    def extract_bilibili_from_forward_message(self, forward_component, limit: Optional[int] = None) -> List[str]:
         """从转发消息中提取bilibili链接"""
-        links = []
+        collector = LinkCollector(limit)
 
         try:
             # 转发消息可能包含多种格式的内容
             logger.info(f"转发消息结构: {forward_component}")
 
             # 尝试从转发消息的各种属性中提取链接
-            content_sources = []
-
-            if hasattr(forward_component, 'content'):
-                content_sources.append(str(forward_component.content))
-            if hasattr(forward_component, 'text'):
-                content_sources.append(str(forward_component.text))
-            if hasattr(forward_component, 'title'):
-                content_sources.append(str(forward_component.title))
-            if hasattr(forward_component, 'summary'):
-                content_sources.append(str(forward_component.summary))
+            for attr in ('content', 'text', 'title', 'summary'):
+                if hasattr(forward_component, attr) and collector.add_text(str(getattr(forward_component, attr))):
+                    return collector.links
 
             # 如果转发消息包含节点列表
             if hasattr(forward_component, 'nodes'):
                 for node in forward_component.nodes:
                     if hasattr(node, 'content'):
                         for content_item in node.content:
-                            if isinstance(content_item, Comp.Plain):
-                                content_sources.append(content_item.text)
-
-            # 在所有内容中查找bilibili链接
-            for content in content_sources:
-                links.extend(self.extract_links_from_text(content))
-
-            # 特殊处理：查找bilibili卡片消息的特征
-            # bilibili分享卡片通常包含特定的文本模式
-            for content in content_sources:
-                # 查找类似 "哔哩哔哩" 或 bilibili 相关的关键词
-                if any(keyword in content.lower() for keyword in ['bilibili', '哔哩哔哩', 'b站']):
-                    # 在这种内容中更积极地查找BV号
-                    additional_links = self.extract_links_from_text(content)
-                    links.extend(additional_links)
+                            if isinstance(content_item, Comp.Plain) and collector.add_text(content_item.text):
+                                return collector.links
 
         except Exception as e:
             logger.warning(f"解析转发消息失败: {str(e)}")
 
-        return links
+        return collector.links
+
+    def parse_page_param(self, input_str: str) -> Optional[str]:
+        """从视频链接的查询参数中提取分P编号"""
+        if '?' not in input_str:
+            return None
+        try:
+            pages = parse_qs(urlparse(input_str).query).get('p')
+            return pages[0] if pages else None
+        except Exception:
+            return None
 
     def parse_bilibili_url(self, input_str: str) -> Optional[str]:
-        """解析bilibili视频链接，提取BV号或AV号"""
+        """解析bilibili视频链接，统一返回BV号（短链接原样返回，需后续解析重定向）"""
         if not input_str or not input_str.strip():
             return None
 
@@ -255,21 +587,24 @@ class BilibiliSummaryPlugin(Star):
 
         # 如果是纯BV号或AV号
         if re.match(r'^BV[a-zA-Z0-9]{10}$', input_str):
-            return input_str
+            return self.canonicalize_video_id(input_str)
         if re.match(r'^[a-zA-Z0-9]{10}$', input_str):
-            return 'BV' + input_str
+            video_id = self.canonicalize_video_id('BV' + input_str)
+            # 10位纯数字也可能是AV号：不是合法BV号时交给下面的AV号分支
+            if video_id or not input_str.isdigit():
+                return video_id
         if re.match(r'^av\d+$', input_str, re.IGNORECASE):
-            return input_str.lower()
+            return self.canonicalize_video_id(input_str)
         if re.match(r'^\d+$', input_str):
-            return 'av' + input_str
+            return self.canonicalize_video_id('av' + input_str)
 
         # 如果是URL链接
-        if 'bilibili.com' in input_str or 'b23.tv' in input_str:
+        if 'bilibili.com' in input_str or parse_short_code(input_str):
             try:
                 parsed = urlparse(input_str)
 
                 # 处理b23.tv短链接 - 需要重定向获取真实链接
-                if 'b23.tv' in parsed.netloc:
+                if parse_short_code(input_str):
                     return input_str  # 返回原链接，后续处理重定向
 
                 # 处理标准bilibili链接
@@ -277,96 +612,133 @@ class BilibiliSummaryPlugin(Star):
                     path = parsed.path
 
                     # 匹配 /video/BVxxxxx 或 /video/avxxxxx
-                    video_match = re.search(r'/video/(BV[a-zA-Z0-9]{10}|av\d+)', path)
+                    video_match = re.search(r'/video/(BV[a-zA-Z0-9]{10}|av\d+)', path, re.IGNORECASE)
                     if video_match:
-                        video_id = video_match.group(1)
-                        if video_id.startswith('BV'):
-                            return video_id
-                        elif video_id.startswith('av'):
-                            return video_id.lower()
+                        return self.canonicalize_video_id(video_match.group(1))
 
                     # 处理查询参数中的bvid
                     query_params = parse_qs(parsed.query)
                     if 'bvid' in query_params:
                         bvid = query_params['bvid'][0]
                         if re.match(r'^BV[a-zA-Z0-9]{10}$', bvid):
-                            return bvid
+                            return self.canonicalize_video_id(bvid)
 
             except Exception as e:
                 logger.warning(f"解析URL失败: {str(e)}")
 
         return None
 
-    async def resolve_short_url(self, short_url: str) -> Optional[str]:
-        """解析b23.tv短链接"""
+    def canonicalize_video_id(self, video_id: str) -> Optional[str]:
+        """把BV号或AV号统一转换为规范的BV号（本地计算，无网络请求）"""
         try:
-            headers = {
-                'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
-            }
+            if video_id[:2].lower() == 'av':
+                return av2bv(int(video_id[2:]))
+            bvid = 'BV' + video_id[2:]
+            return bvid if is_valid_bvid(bvid) else None
+        except ValueError:
+            logger.warning(f"无效的视频ID: {video_id}")
+            return None
 
-            async with aiohttp.ClientSession() as session:
-                async with session.get(short_url, headers=headers, allow_redirects=False) as response:
-                    if response.status in [301, 302, 303, 307, 308]:
-                        location = response.headers.get('Location')
-                        if location:
-                            return self.parse_bilibili_url(location)
+    @timed('short_link')
+    async def resolve_short_url(self, short_url: str) -> Optional[str]:
+        """解析b23.tv短链接（含bili2233.cn等备用域名），逐跳跟随重定向直到得到BV号"""
+        short_code = parse_short_code(short_url)
+        if short_code:
+            cached = self.short_link_cache.get(short_code)
+            self.metrics.inc('cache_requests_total', cache='short_link', result='hit' if cached else 'miss')
+            if cached:
+                logger.info(f"命中短链接缓存: {short_code} -> {cached}")
+                return cached
 
-            return None
-        except Exception as e:
-            logger.error(f"解析短链接失败: {str(e)}")
-            return None
+        headers = {
+            'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
+        }
+
+        async def hop(url: str) -> Tuple[int, Optional[str]]:
+            session = await self.get_http_session()
+            try:
+                await self.rate_limiter.acquire('b23')
+                # 优先使用HEAD请求，只需要Location，不下载页面内容
+                async with session.head(url, headers=headers, allow_redirects=False) as response:
+                    status = response.status
+                    location = response.headers.get('Location')
+                    retry_after = response.headers.get('Retry-After')
+                if status in (404, 405, 501):
+                    await self.rate_limiter.acquire('b23')
+                    async with session.get(url, headers=headers, allow_redirects=False) as response:
+                        status = response.status
+                        location = response.headers.get('Location')
+                        retry_after = response.headers.get('Retry-After')
+            except (aiohttp.ClientConnectionError, asyncio.TimeoutError) as e:
+                raise TransientError(f"网络异常: {e.__class__.__name__}") from e
+            if status == 429 or status >= 500:
+                raise TransientError(f"HTTP {status}", parse_retry_after(retry_after))
+            return status, location
 
-    async def convert_av_to_bv(self, av_id: str) -> Optional[str]:
-        """通过AV号获取BV号"""
         try:
-            # 提取AV号中的数字
-            av_num = re.search(r'av(\d+)', av_id, re.IGNORECASE)
-            if not av_num:
-                return None
+            url = short_url
+            for _ in range(self.max_redirects):
+                status, location = await self.retry_policy.run(
+                    lambda: hop(url), self.breakers['b23'], self.retry_callback('b23')
+                )
 
-            aid = av_num.group(1)
-            url = f"https://api.bilibili.com/x/web-interface/view?aid={aid}"
-            headers = {
-                'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
-            }
+                if status not in (301, 302, 303, 307, 308) or not location:
+                    logger.warning(f"短链接没有重定向: status={status}, url={url}")
+                    return None
+
+                url = urljoin(url, location)
+                video_id = self.parse_bilibili_url(url)
+                if video_id and not parse_short_code(video_id):
+                    if short_code:
+                        self.short_link_cache.set(short_code, video_id)
+                    return video_id
 
-            async with aiohttp.ClientSession() as session:
-                async with session.get(url, headers=headers) as response:
-                    if response.status == 200:
-                        data = await response.json()
-                        if data.get('code') == 0:
-                            bvid = data.get('data', {}).get('bvid')
-                            if bvid:
-                                logger.info(f"成功转换AV号到BV号: {av_id} -> {bvid}")
-                                return bvid
-
-            await asyncio.sleep(self.request_interval)
+            logger.warning(f"短链接重定向次数过多: {short_url}")
             return None
         except Exception as e:
-            logger.error(f"AV号转换失败: {str(e)}")
+            logger.error(f"解析短链接失败: {str(e)}")
+            return None
+
+    def convert_av_to_bv(self, av_id: str) -> Optional[str]:
+        """AV号转BV号（本地计算）"""
+        av_num = re.search(r'av(\d+)', av_id, re.IGNORECASE)
+        if not av_num:
             return None
+        return self.canonicalize_video_id('av' + av_num.group(1))
 
     @filter.command("bs")
-    async def bilibili_summary(self, event: AstrMessageEvent, video_input: str = None):
+    async def bilibili_summary(self, event: AstrMessageEvent, video_input: str = None, part_input: str = None):
         """获取bilibili视频字幕总结"""
 
+        if video_input == "ask":
+            async for result in self.bilibili_ask(event):
+                yield result
+            return
+
         # 如果没有提供参数，尝试从消息中自动提取链接
         if not video_input or not video_input.strip():
             # 从当前消息中提取链接
-            extracted_links = self.extract_bilibili_links_from_message(event)
-            logger.info(f"提取到的所有链接: {extracted_links}")
+            extracted_links = self.extract_bilibili_links_from_message(event, limit=max(1, self.max_batch_videos))
+            logger.info(f"提取到的链接: {extracted_links}")
 
-            if extracted_links:
-                # 如果找到链接，使用第一个
+            if len(extracted_links) > 1:
+                # 消息中包含多个视频时批量处理
+                async for result in self.summarize_batch(event, extracted_links):
+                    yield result
+                return
+            elif extracted_links:
                 video_input = extracted_links[0]
                 logger.info(f"从消息中自动提取到链接: {video_input}")
             else:
                 # 如果没有找到链接，显示帮助信息
                 yield event.plain_result(
                     "使用方法：\n"
-                    "1. /bs [视频链接或BV号]\n"
+                    "1. /bs [视频链接或BV号] [分P]\n"
                     "2. 引用包含bilibili链接的消息后发送 /bs\n"
-                    "3. 转发bilibili视频卡片后发送 /bs\n\n"
+                    "3. 转发bilibili视频卡片后发送 /bs\n"
+                    "4. /bs ask [视频链接或BV号] [问题]：根据字幕回答关于视频的问题\n\n"
+                    "分P选择：3、1-5、1,3,5 或 all，也支持链接中的 ?p=3\n"
+                    "消息中包含多个视频时会批量总结\n\n"
                     "支持格式：\n"
                     "• BV号：BV1jv7YzJED2 或 1jv7YzJED2\n"
                     "• AV号：av123456 或 123456\n"
@@ -376,108 +748,1011 @@ class BilibiliSummaryPlugin(Star):
                 )
                 return
 
+        # 检查配置
+        if not self.llm_pool.endpoints:
+            yield event.plain_result("❌ 未配置OpenAI API密钥，请联系管理员配置插件")
+            return
+
+        deadline = Deadline(self.request_deadline)
+        try:
+            video_id, part_selector = await self.resolve_video_input(video_input, part_input, deadline=deadline)
+        except SummaryError as e:
+            yield event.plain_result(str(e))
+            return
+
+        # 命中缓存时直接返回，不发起任何网络请求
+        cache_key = self.get_summary_cache_key(video_id, part_selector)
+        cached = self.get_cached_summary(cache_key)
+        if cached:
+            yield event.plain_result(self.format_summary_message(cached))
+            return
+
+        # 准入控制：队列已满时立即拒绝（已在处理中的视频直接等待结果）
+        if cache_key not in self._inflight and self.scheduler.full:
+            self.metrics.inc('requests_rejected_total')
+            yield event.plain_result("⏳ 当前排队的总结任务过多，请稍后再试")
+            return
+
+        queue_wait = max(self.rate_limiter.wait_times().values(), default=0.0)
+        if cache_key in self._inflight:
+            yield event.plain_result(f"🔍 视频 {video_id} 正在处理中，请稍候...")
+        elif self.scheduler.queued or self.scheduler.running >= self.scheduler.workers:
+            yield event.plain_result(f"🔍 正在处理视频 {video_id}，前方还有{self.scheduler.queued}个任务排队，请稍候...")
+        elif queue_wait >= 1:
+            yield event.plain_result(f"🔍 正在处理视频 {video_id}，当前请求较多，预计需排队约{queue_wait:.0f}秒...")
+        else:
+            yield event.plain_result(f"🔍 正在处理视频 {video_id}，请稍候...")
+
+        group_key, user_key = self.get_requester_keys(event)
+
+        self.metrics.inc('requests_total')
+        try:
+            if self.stream_output:
+                # 流式输出：由本次请求发起的流程会把LLM增量结果推入队列，按批次发送
+                queue: asyncio.Queue = asyncio.Queue()
+                task = asyncio.ensure_future(self.start_pipeline(
+                    cache_key, video_id, part_selector, group_key, user_key,
+                    on_delta=queue.put_nowait, deadline=deadline))
+                streamed = False
+                async for batch in self.iter_stream_batches(queue, task):
+                    streamed = True
+                    yield event.plain_result(batch)
+                result = await task
+                if not streamed:
+                    yield event.plain_result(self.format_summary_message(result))
+            else:
+                # 同一视频的并发请求共享同一个处理流程
+                result = await self.start_pipeline(cache_key, video_id, part_selector, group_key, user_key,
+                                                   deadline=deadline)
+                yield event.plain_result(self.format_summary_message(result))
+
+        except SummaryError as e:
+            yield event.plain_result(str(e))
+        except Exception as e:
+            logger.error(f"Bilibili Summary插件: 处理请求时发生错误: {str(e)}")
+            yield event.plain_result(f"❌ 处理请求时发生错误: {str(e)}")
+
+    async def bilibili_ask(self, event: AstrMessageEvent):
+        """/bs ask <视频> <问题>：检索字幕中的相关片段后回答，视频也可以来自引用的消息"""
+        match = self.ASK_COMMAND_PATTERN.match(event.message_str or '')
+        rest = match.group(1).strip() if match else ''
+        video_input, _, question = rest.partition(' ')
+        if not (self.parse_bilibili_url(video_input) or parse_short_code(video_input)):
+            # 第一个参数不是视频时，整段作为问题，视频从引用或转发的消息中提取
+            links = self.extract_bilibili_links_from_message(event, limit=1)
+            video_input, question = (links[0] if links else ''), rest
+        question = question.strip()
+
+        if not video_input or not question:
+            yield event.plain_result("使用方法：/bs ask [视频链接或BV号] [问题]\n也可以引用包含视频链接的消息后发送 /bs ask [问题]")
+            return
+        if not self.llm_pool.endpoints:
+            yield event.plain_result("❌ 未配置OpenAI API密钥，请联系管理员配置插件")
+            return
+
+        group_key, user_key = self.get_requester_keys(event)
+        try:
+            video_id, part_selector = await self.resolve_video_input(video_input)
+            future = self.scheduler.submit(group_key, user_key,
+                                           lambda: self.answer_question(video_id, part_selector, question))
+            answer = await future
+        except QueueFullError:
+            self.metrics.inc('requests_rejected_total')
+            yield event.plain_result("⏳ 当前排队的总结任务过多，请稍后再试")
+            return
+        except SummaryError as e:
+            yield event.plain_result(str(e))
+            return
+        except Exception as e:
+            logger.error(f"Bilibili Summary插件: 处理问答时发生错误: {str(e)}")
+            yield event.plain_result(f"❌ 处理请求时发生错误: {str(e)}")
+            return
+        yield event.plain_result(f"❓ {question}\n\n{answer}")
+
+    async def answer_question(self, video_id: str, part_selector: str, question: str) -> str:
+        """用BM25检索与问题最相关的字幕段落，只把这些段落（带时间戳）发给LLM"""
+        loaded = await self.load_segment_pages(video_id, part_selector)
+        hits = []
+        for key, title, segments in loaded:
+            index = self.segment_store.index(key, segments)
+            hits.extend((score, title, passage) for score, passage in index.search(question, self.ask_top_k))
+        hits = sorted(hits, key=lambda hit: hit[0], reverse=True)[:self.ask_top_k]
+        if not hits:
+            # 没有词面匹配（如“视频讲了什么”）时均匀抽取段落
+            passages = [(title, passage) for key, title, segments in loaded
+                        for passage in self.segment_store.index(key, segments).passages]
+            step = max(1, len(passages) // max(1, self.ask_top_k))
+            hits = [(0.0, title, passage) for title, passage in passages[::step][:self.ask_top_k]]
+
+        # 按分P和时间顺序排列片段
+        hits.sort(key=lambda hit: (hit[1], hit[2][0]))
+        multi_page = len(loaded) > 1
+        lines = []
+        for _, title, (start, end, text) in hits:
+            page_label = f"{title} " if multi_page else ''
+            lines.append(f"[{page_label}{format_timestamp(start)}-{format_timestamp(end)}] {text}")
+        content = f"视频标题：{loaded[0][1]}\n\n相关字幕片段：\n" + '\n'.join(lines) + f"\n\n问题：{question}"
+
+        full_tokens = sum(segment_tokens(segments) for _, _, segments in loaded)
+        prompt_tokens = estimate_tokens(content)
+        self.metrics.inc('ask_requests_total')
+        self.metrics.inc('ask_prompt_tokens_total', prompt_tokens)
+        logger.info(f"问答提示词约{prompt_tokens} tokens（完整字幕约{full_tokens} tokens），检索到{len(hits)}个片段")
+
+        answer = await self.chat_completion(self.ASK_PROMPT, content, max_tokens=600)
+        if not answer:
+            raise SummaryError("❌ 生成回答失败")
+        return answer
+
+    async def load_segment_pages(self, video_id: str, part_selector: str) -> List[Tuple[str, str, List[Segment]]]:
+        """读取所选分P的字幕 [(存储键, 标题, 字幕片段)]，本地没有时获取并写入字幕存储"""
+        if part_selector != 'all':
+            keys = [f"{video_id}:{page}" for page in part_selector.split(',')][:self.max_parts]
+            stored = [self.segment_store.get(key) for key in keys]
+            if all(stored):
+                return [(key, title, segments) for key, (title, segments) in zip(keys, stored)]
+
+        video_info = await self.fetch_video_info(video_id)
+        if not video_info or not video_info.get('aid'):
+            raise SummaryError("❌ 获取视频信息失败，请检查BV号是否正确")
+        pages = video_info.get('pages', [])
+        selected_pages = self.select_pages(pages, part_selector)
+        if not selected_pages:
+            raise SummaryError(f"❌ 分P不存在，该视频共有{len(pages)}个分P")
+
+        subtitles = await asyncio.gather(*(self.fetch_subtitle(video_info['aid'], page['cid']) for page in selected_pages))
+        loaded = self.store_segments(video_id, video_info, [
+            (page, segments) for page, segments in zip(selected_pages, subtitles) if segments
+        ])
+        if not loaded:
+            raise SummaryError("❌ 未找到可用的字幕")
+        return loaded
+
+    def store_segments(self, video_id: str, video_info: Dict[str, Any],
+                       available: List[Tuple[Dict[str, Any], List[Segment]]]) -> List[Tuple[str, str, List[Segment]]]:
+        """把各分P带时间戳的字幕写入字幕存储"""
+        title = video_info.get('title', '未知标题')
+        multi_page = len(video_info.get('pages', [])) > 1
+        stored = []
+        for page, segments in available:
+            key = f"{video_id}:{page['page']}"
+            page_title = f"{title}（P{page['page']} {page['part']}）" if multi_page else title
+            try:
+                self.segment_store.set(key, page_title, segments)
+            except sqlite3.Error as e:
+                logger.warning(f"写入字幕存储失败: {str(e)}")
+            stored.append((key, page_title, segments))
+        return stored
+
+    async def resolve_video_input(self, video_input: str, part_input: Optional[str] = None,
+                                  deadline: Optional[Deadline] = None) -> Tuple[str, str]:
+        """把用户输入解析为 (BV号, 分P选择)，无法识别时抛出SummaryError"""
+        video_input = video_input.strip()
+
+        # 解析分P选择：命令参数优先，其次是链接中的 ?p=N
+        part_selector = self.parse_part_selector(part_input or self.parse_page_param(video_input))
+        if not part_selector:
+            raise SummaryError("❌ 无法识别的分P选择，示例：3、1-5、1,3,5 或 all")
+
         # 解析输入的视频标识
-        video_id = self.parse_bilibili_url(video_input.strip())
+        video_id = self.parse_bilibili_url(video_input)
 
         # 如果是短链接，需要先解析
-        if video_input.strip().startswith('https://b23.tv/'):
-            video_id = await self.resolve_short_url(video_input.strip())
+        if parse_short_code(video_input):
+            try:
+                video_id = await self.run_stage('short_link', self.resolve_short_url(video_input),
+                                                deadline.timeout(0.1) if deadline else None)
+            except asyncio.TimeoutError:
+                raise SummaryError("⏳ 解析短链接超时，请稍后再试")
 
         if not video_id:
-            yield event.plain_result("❌ 无法识别的视频链接或ID格式，请检查后重试")
-            return
+            raise SummaryError("❌ 无法识别的视频链接或ID格式，请检查后重试")
 
-        # 直接使用video_id，get_video_info方法会处理AV号和BV号
-            
-        # 检查配置
-        if not self.openai_api_key:
+        # video_id已统一为BV号，缓存和并发合并都以此为键
+        return video_id, part_selector
+
+    def get_cached_summary(self, cache_key: str) -> Optional[Dict[str, Any]]:
+        """读取总结缓存"""
+        if not self.summary_cache:
+            return None
+        cached = self.summary_cache.get(cache_key)
+        self.metrics.inc('cache_requests_total', cache='summary', result='hit' if cached else 'miss')
+        if cached:
+            logger.info(f"命中总结缓存: {cache_key}")
+        return cached
+
+    async def summarize_link(self, video_input: str, group_key: str, user_key: str) -> Dict[str, Any]:
+        """总结单个链接（缓存 -> 合并并发请求 -> 完整流程），失败时抛出SummaryError"""
+        deadline = Deadline(self.request_deadline)
+        video_id, part_selector = await self.resolve_video_input(video_input, deadline=deadline)
+        cache_key = self.get_summary_cache_key(video_id, part_selector)
+        cached = self.get_cached_summary(cache_key)
+        if cached:
+            return cached
+
+        self.metrics.inc('requests_total')
+        return await self.start_pipeline(cache_key, video_id, part_selector, group_key, user_key, deadline=deadline)
+
+    async def summarize_batch(self, event: AstrMessageEvent, links: List[str]):
+        """并发总结多个视频，按输入顺序输出结果或合并为一条摘要"""
+        if not self.llm_pool.endpoints:
             yield event.plain_result("❌ 未配置OpenAI API密钥，请联系管理员配置插件")
             return
-            
-        yield event.plain_result(f"🔍 正在处理视频 {video_id}，请稍候...")
+
+        total = len(links)
+        yield event.plain_result(f"🔍 检测到{total}个视频，正在批量处理，请稍候...")
+        semaphore = asyncio.Semaphore(max(1, self.batch_concurrency))
+        group_key, user_key = self.get_requester_keys(event)
+
+        async def run_one(link: str) -> Dict[str, Any]:
+            async with semaphore:
+                return await self.summarize_link(link, group_key, user_key)
+
+        tasks = [asyncio.ensure_future(run_one(link)) for link in links]
+
+        def describe(index: int, task: asyncio.Future) -> str:
+            error = task.exception()
+            if error is None:
+                return f"[{index + 1}/{total}] {self.format_summary_message(task.result())}"
+            if isinstance(error, SummaryError):
+                return f"[{index + 1}/{total}] {links[index]}\n{error}"
+            logger.error(f"批量处理视频失败: {links[index]}: {str(error)}")
+            return f"[{index + 1}/{total}] {links[index]}\n❌ 处理请求时发生错误: {str(error)}"
 
         try:
-            # 获取视频基本信息
-            video_info = await self.get_video_info(video_id)
-            if not video_info:
-                yield event.plain_result("❌ 获取视频信息失败，请检查BV号是否正确")
-                return
+            if self.batch_merge_output:
+                await asyncio.wait(tasks)
+                yield event.plain_result('\n\n'.join(describe(i, task) for i, task in enumerate(tasks)))
+            else:
+                # 按输入顺序逐个发送，某个视频完成且其前面的视频都已发送后立即发送
+                for index, task in enumerate(tasks):
+                    await asyncio.wait([task])
+                    yield event.plain_result(describe(index, task))
+        finally:
+            for task in tasks:
+                task.cancel()
+
+    async def iter_stream_batches(self, queue: asyncio.Queue, task: asyncio.Future):
+        """从队列中读取流式增量文本，按时间间隔或字符数攒批后产出，直到任务结束"""
+        buffer = ''
+        last_flush = time.monotonic()
+
+        while not task.done() or not queue.empty():
+            try:
+                buffer += await asyncio.wait_for(queue.get(), timeout=0.2)
+            except asyncio.TimeoutError:
+                pass
+
+            now = time.monotonic()
+            if buffer and (len(buffer) >= self.stream_flush_chars or now - last_flush >= self.stream_flush_interval):
+                yield buffer
+                buffer = ''
+                last_flush = now
+
+        if buffer:
+            yield buffer
+
+    def get_requester_keys(self, event: AstrMessageEvent) -> Tuple[str, str]:
+        """调度公平性使用的 (群组, 用户) 键，私聊按用户单独成组"""
+        user_key = f"{event.get_platform_name()}:{event.get_sender_id()}"
+        group_id = event.get_group_id()
+        group_key = f"{event.get_platform_name()}:{group_id}" if group_id else f"private:{user_key}"
+        return group_key, user_key
+
+    def start_pipeline(self, cache_key: str, video_id: str, part_selector: str, group_key: str, user_key: str,
+                       on_delta: Optional[Callable[[str], None]] = None,
+                       deadline: Optional[Deadline] = None) -> Awaitable[Dict[str, Any]]:
+        """启动（或加入进行中的）总结流程，新流程经调度器排队后执行（排队时间也计入deadline）
+
+        配置了任务台账时，先在进程间领取该视频的租约，其他实例正在处理时等待其发布的结果。
+        """
+        def submit():
+            try:
+                return self.scheduler.submit(
+                    group_key, user_key,
+                    lambda: self.summarize_video(video_id, part_selector, cache_key, on_delta=on_delta,
+                                                 deadline=deadline)
+                )
+            except QueueFullError:
+                self.metrics.inc('requests_rejected_total')
+                raise SummaryError("⏳ 当前排队的总结任务过多，请稍后再试")
+
+        if self.job_ledger:
+            return self.run_single_flight(
+                cache_key, lambda: self.run_coordinated(cache_key, video_id, submit, deadline)
+            )
+        return self.run_single_flight(cache_key, submit)
+
+    async def run_coordinated(self, job_key: str, video_id: str, submit: Callable[[], Awaitable[Dict[str, Any]]],
+                              deadline: Optional[Deadline]) -> Dict[str, Any]:
+        """领取台账中的任务租约后执行并发布结果；已被其他实例领取时等待结果，租约过期后接管
+
+        时间不足或台账不可用时直接在本进程执行（此时的结果不发布）。
+        """
+        # 台账操作可能等待数据库锁，放到线程中执行，避免阻塞事件循环
+        try:
+            outcome = await asyncio.to_thread(self.job_ledger.claim, job_key)
+            while outcome == JobLedger.HELD:
+                if deadline and deadline.short(self.degraded_reserve):
+                    # 等不到其他实例的结果，由本进程在剩余时间内给出（降级）回答
+                    self.metrics.inc('ledger_jobs_total', result='wait_timeout')
+                    return await submit()
+                await asyncio.sleep(self.LEDGER_POLL_INTERVAL)
+                # 等待期间只做只读查询，租约过期、被释放或结果已发布时才再次领取
+                if await asyncio.to_thread(self.job_ledger.peek, job_key) != JobLedger.HELD:
+                    outcome = await asyncio.to_thread(self.job_ledger.claim, job_key)
+            shared = None
+            if outcome == JobLedger.DONE:
+                shared = await asyncio.to_thread(self.job_ledger.result, job_key)
+        except sqlite3.Error as e:
+            logger.warning(f"任务台账不可用，直接处理: {str(e)}")
+            return await submit()
+
+        if outcome == JobLedger.DONE:
+            if shared is None:
+                return await submit()
+            self.metrics.inc('ledger_jobs_total', result='shared')
+            logger.info(f"复用其他实例的总结结果: {job_key}")
+            if self.summary_cache:
+                self.summary_cache.set(job_key, video_id, shared)
+            return shared
+
+        self.metrics.inc('ledger_jobs_total', result=outcome)
+        heartbeat = asyncio.create_task(self.renew_lease_loop(job_key))
+        try:
+            result = await submit()
+        except BaseException:
+            await self.release_lease(job_key)
+            raise
+        finally:
+            heartbeat.cancel()
+
+        if result.get('degraded'):
+            await self.release_lease(job_key)
+            return result
+        try:
+            await asyncio.to_thread(self.job_ledger.publish, job_key, result)
+        except sqlite3.Error as e:
+            logger.warning(f"发布总结结果到任务台账失败: {str(e)}")
+        return result
+
+    async def renew_lease_loop(self, job_key: str):
+        """定期为本进程持有的租约续约"""
+        while True:
+            await asyncio.sleep(self.job_ledger.lease_ttl / 3)
+            try:
+                if not await asyncio.to_thread(self.job_ledger.renew, job_key):
+                    self.metrics.inc('ledger_jobs_total', result='lease_lost')
+                    logger.warning(f"任务租约已被其他实例接管: {job_key}")
+                    return
+            except sqlite3.Error as e:
+                logger.warning(f"任务租约续约失败: {str(e)}")
+
+    async def release_lease(self, job_key: str):
+        try:
+            await asyncio.to_thread(self.job_ledger.release, job_key)
+        except sqlite3.Error as e:
+            logger.warning(f"释放任务租约失败: {str(e)}")
+
+    async def run_single_flight(self, key: str, factory: Callable[[], Awaitable[Any]]) -> Any:
+        """对同一key的并发调用只执行一次factory，所有调用方等待同一结果"""
+        task = self._inflight.get(key)
+        if task is None:
+            task = asyncio.ensure_future(factory())
+            self._inflight[key] = task
+            # 任务结束即移除，失败结果不会影响之后的重试
+            task.add_done_callback(lambda _: self._inflight.pop(key, None))
+        else:
+            logger.info(f"复用进行中的处理流程: {key}")
+
+        # shield防止某个调用方被取消时连带取消共享任务
+        return await asyncio.shield(task)
+
+    async def summarize_video(self, video_id: str, part_selector: str, cache_key: str,
+                              on_delta: Optional[Callable[[str], None]] = None,
+                              deadline: Optional[Deadline] = None) -> Dict[str, Any]:
+        """执行完整的总结流程：视频信息 -> 字幕 -> LLM总结，失败时抛出SummaryError"""
+        deadline = deadline or Deadline(self.request_deadline)
+        try:
+            with self.metrics.span('pipeline'):
+                result = await self.run_summary_pipeline(video_id, part_selector, cache_key, on_delta, deadline)
+        except SummaryError:
+            self.metrics.inc('pipelines_total', result='failure')
+            raise
+        self.metrics.inc('pipelines_total', result='degraded' if result.get('degraded') else 'success')
+        return result
+
+    async def run_stage(self, stage: str, awaitable: Awaitable[Any], timeout: Optional[float]) -> Any:
+        """在超时内执行一个阶段，超时时取消该阶段（释放其连接和子任务）并抛出asyncio.TimeoutError"""
+        try:
+            return await asyncio.wait_for(awaitable, timeout)
+        except asyncio.TimeoutError:
+            self.metrics.inc('stage_timeouts_total', stage=stage)
+            logger.warning(f"阶段{stage}超时({timeout or 0:.1f}s)，已取消")
+            raise
+
+    async def run_summary_pipeline(self, video_id: str, part_selector: str, cache_key: str,
+                                   on_delta: Optional[Callable[[str], None]], deadline: Deadline) -> Dict[str, Any]:
+        # 每个阶段使用剩余时间的一部分，并始终为降级回答保留degraded_reserve秒
+        reserve = self.degraded_reserve
+        emitted = False
+        if on_delta:
+            raw_on_delta = on_delta
+
+            def on_delta(text: str):
+                nonlocal emitted
+                emitted = True
+                raw_on_delta(text)
+
+        # 获取视频基本信息
+        try:
+            video_info = await self.run_stage('view', self.fetch_video_info(video_id), deadline.timeout(0.3, reserve))
+        except asyncio.TimeoutError:
+            raise SummaryError("⏳ 获取视频信息超时，请稍后再试")
+        if not video_info:
+            raise SummaryError("❌ 获取视频信息失败，请检查BV号是否正确")
+
+        aid = video_info.get('aid')
+        title = video_info.get('title', '未知标题')
+        desc = video_info.get('desc', '')
+        pages = video_info.get('pages', [])
+
+        if not aid or not pages:
+            raise SummaryError("❌ 无法获取视频的aid或cid")
+
+        selected_pages = self.select_pages(pages, part_selector)
+        if not selected_pages:
+            raise SummaryError(f"❌ 分P不存在，该视频共有{len(pages)}个分P")
+
+        # 并发获取所选分P的字幕（请求仍受限流器约束）
+        try:
+            subtitles = await self.run_stage(
+                'subtitles',
+                asyncio.gather(*(self.fetch_subtitle(aid, page['cid']) for page in selected_pages)),
+                deadline.timeout(0.4, reserve)
+            )
+        except asyncio.TimeoutError:
+            return await self.degraded_summary(title, desc, deadline, on_delta if emitted else None, "字幕获取超时")
+        available = [(page, segments) for page, segments in zip(selected_pages, subtitles) if segments]
+        if not available:
+            raise SummaryError("❌ 未找到可用的字幕")
+        # 保留带时间戳的字幕，之后追问时只需检索相关片段
+        self.store_segments(video_id, video_info, available)
+        if len(available) < len(selected_pages):
+            logger.warning(f"部分分P没有字幕: 可用{len(available)}/{len(selected_pages)}个")
+
+        # 内容指纹去重：单个分P的字幕与已总结过的视频近似相同时直接复用其总结
+        fingerprint = None
+        if self.fingerprint_index is not None and len(available) == 1:
+            page, segments = available[0]
+            fingerprint, duplicate = await self.find_duplicate_summary(video_id, segments)
+            if duplicate:
+                page_title = f"{title}（P{page['page']} {page['part']}）" if len(pages) > 1 else title
+                result = {'title': page_title, 'summary': duplicate['summary'],
+                          'deduplicated_from': duplicate['video_id']}
+                self.summary_cache.set(cache_key, video_id, result)
+                return result
+
+        if deadline.short(reserve * 2):
+            # 剩余时间已不够完整总结，直接给出降级回答
+            return await self.degraded_summary(title, desc, deadline, on_delta if emitted else None, "时间预算不足")
+        try:
+            result = await self.run_stage(
+                'summary',
+                self.summarize_available(title, desc, len(pages) > 1, available, on_delta),
+                deadline.timeout(1.0, reserve)
+            )
+        except asyncio.TimeoutError:
+            return await self.degraded_summary(title, desc, deadline, on_delta if emitted else None, "总结生成超时")
+
+        if self.summary_cache:
+            self.summary_cache.set(cache_key, video_id, result)
+            if fingerprint is not None:
+                page = available[0][0]
+                self.fingerprint_index.add(f"{video_id}:{page['page']}", video_id, cache_key, fingerprint)
+        return result
+
+    async def find_duplicate_summary(self, video_id: str,
+                                     segments: List[Segment]) -> Tuple[Optional[int], Optional[Dict[str, Any]]]:
+        """计算字幕的SimHash指纹并查找其他视频在当前模型和提示词下的已有总结，返回 (指纹, 重复视频的总结)"""
+        text = join_segments(segments)
+        if len(text) < self.DEDUP_MIN_CHARS:
+            return None, None
+
+        with self.metrics.span('fingerprint'):
+            # 长字幕的SimHash需要数百毫秒，放到线程中计算，避免阻塞事件循环
+            fingerprint = await asyncio.to_thread(simhash, text)
+            match = self.fingerprint_index.find(fingerprint, self.dedup_max_distance, exclude_video_id=video_id,
+                                                cache_key_suffix=f":{self.get_summary_variant()}")
+        if not match:
+            return fingerprint, None
+
+        cached = self.summary_cache.get(match['cache_key'])
+        if not cached:
+            # 原视频的总结已过期或被淘汰，指纹随之作废
+            self.fingerprint_index.remove(match['video_key'])
+            return fingerprint, None
+
+        self.metrics.inc('dedup_hits_total')
+        logger.info(f"字幕与 {match['video_id']} 近似重复(汉明距离{match['distance']})，复用其总结")
+        return fingerprint, {'video_id': match['video_id'], 'summary': cached['summary']}
+
+    async def summarize_available(self, title: str, desc: str, multi_page: bool,
+                                  available: List[Tuple[Dict[str, Any], List[Segment]]],
+                                  on_delta: Optional[Callable[[str], None]]) -> Dict[str, Any]:
+        """总结有字幕的分P：单个分P直接总结，多个分P分别总结后再生成整体总结"""
+        if len(available) == 1:
+            page, segments = available[0]
+            if multi_page:
+                title = f"{title}（P{page['page']} {page['part']}）"
+            if on_delta:
+                on_delta(self.format_summary_header({'title': title}))
+            summary = await self.summarize_segments(title, desc, segments, on_delta=on_delta)
+            if not summary:
+                raise SummaryError("❌ 生成总结失败")
+            return {'title': title, 'summary': summary}
+
+        # 多个分P：各分P并发总结，再生成整体总结
+        part_summaries = await asyncio.gather(*(
+            self.summarize_segments(f"{title} - P{page['page']} {page['part']}", '', segments)
+            for page, segments in available
+        ))
+        parts = [
+            {'page': page['page'], 'part': page['part'], 'summary': summary}
+            for (page, _), summary in zip(available, part_summaries) if summary
+        ]
+        if not parts:
+            raise SummaryError("❌ 生成总结失败")
+
+        if on_delta:
+            on_delta(self.format_summary_header({'title': title, 'parts': parts}))
+        overview = '\n\n'.join(f"P{part['page']} {part['part']}：\n{part['summary']}" for part in parts)
+        summary = await self.generate_summary(title, desc, overview, subtitle_label="各分P总结", on_delta=on_delta)
+        if not summary:
+            raise SummaryError("❌ 生成总结失败")
+        return {'title': title, 'summary': summary, 'parts': parts}
+
+    async def degraded_summary(self, title: str, desc: str, deadline: Deadline,
+                               on_delta: Optional[Callable[[str], None]], reason: str) -> Dict[str, Any]:
+        """时间不足时的降级回答：用一次简短的LLM调用概括标题和简介，结果不写入缓存
+
+        on_delta只在已经流式输出过内容时传入，降级回答会接在已输出的内容之后。
+        """
+        self.metrics.inc('degraded_total', reason=reason)
+        logger.warning(f"{reason}，返回基于标题和简介的简要总结: {title}")
+
+        content = f"视频标题：{title}\n\n视频简介：{desc.strip() or '（无）'}"
+        summary = None
+        remaining = deadline.remaining()
+        # 只使用实际剩余的时间，不足以完成一次LLM调用时直接使用简介
+        if remaining >= self.DEGRADED_MIN_SECONDS:
+            try:
+                summary = await self.run_stage(
+                    'degraded', self.chat_completion(self.DEGRADED_PROMPT, content, max_tokens=200),
+                    None if remaining == float('inf') else remaining
+                )
+            except asyncio.TimeoutError:
+                pass
+        if not summary:
+            summary = desc.strip() or "（该视频没有简介）"
+
+        summary = f"⚡ {reason}，以下是根据标题和简介生成的简要介绍，稍后重试可获得完整总结：\n{summary}"
+        if on_delta:
+            on_delta('\n\n' + summary)
+        return {'title': title, 'summary': summary, 'degraded': True}
+
+    def parse_part_selector(self, selector: Optional[str]) -> Optional[str]:
+        """解析分P选择：N / pN / 起-止 / 逗号分隔的组合 / all，返回规范化的选择字符串"""
+        if not selector or not selector.strip():
+            return '1'
+
+        selector = selector.strip().lower()
+        if selector in ('all', '全部'):
+            return 'all'
+
+        pages = set()
+        for item in selector.replace('，', ',').split(','):
+            item = item.strip().lstrip('p')
+            range_match = re.match(r'^(\d+)-(\d+)$', item)
+            if range_match:
+                start, end = int(range_match.group(1)), int(range_match.group(2))
+                if start < 1 or end < start:
+                    return None
+                pages.update(range(start, min(end, start + self.max_parts - 1) + 1))
+            elif item.isdigit() and int(item) >= 1:
+                pages.add(int(item))
+            else:
+                return None
 
-            aid = video_info.get('aid')
-            cid = video_info.get('cid')
-            title = video_info.get('title', '未知标题')
-            desc = video_info.get('desc', '')
+        return ','.join(str(page) for page in sorted(pages)[:self.max_parts])
 
-            if not aid or not cid:
-                yield event.plain_result("❌ 无法获取视频的aid或cid")
+    def select_pages(self, pages: List[Dict[str, Any]], part_selector: str) -> List[Dict[str, Any]]:
+        """按选择字符串筛选分P，最多max_parts个"""
+        if part_selector == 'all':
+            return pages[:self.max_parts]
+        wanted = {int(page) for page in part_selector.split(',')}
+        return [page for page in pages if page['page'] in wanted][:self.max_parts]
+
+    @filter.event_message_type(filter.EventMessageType.GROUP_MESSAGE)
+    async def prefetch_on_message(self, event: AstrMessageEvent):
+        """被动监听群消息中的B站链接，加入后台预取队列（需开启预取）"""
+        if not self.prefetch_enabled or self._prefetch_queue is None:
+            return
+        if self.PLUGIN_COMMAND_PATTERN.match(event.message_str or ''):
+            return
+
+        links = self.extract_bilibili_links_from_message(event, limit=self.PREFETCH_LINKS_PER_MESSAGE)
+        if not links:
+            return
+
+        group_key, _ = self.get_requester_keys(event)
+        budget = self._prefetch_budgets.get(group_key)
+        if budget is None:
+            # 每个群每小时最多预取prefetch_group_budget个链接
+            budget = self._prefetch_budgets[group_key] = TokenBucket(
+                self.prefetch_group_budget / 3600, self.prefetch_group_budget
+            )
+        for link in links:
+            if not budget.try_acquire():
+                self.metrics.inc('prefetch_total', result='over_budget')
+                break
+            try:
+                self._prefetch_queue.put_nowait(link)
+            except asyncio.QueueFull:
+                budget.refund()
+                self.metrics.inc('prefetch_total', result='queue_full')
+                break
+
+    async def prefetch_worker(self):
+        """逐个处理预取队列，只在限流器和调度器空闲时发出请求"""
+        while True:
+            link = await self._prefetch_queue.get()
+            try:
+                while (self.scheduler.queued or self.rate_limiter.wait_time('view') > 0 or
+                       self.rate_limiter.wait_time('player') > 0):
+                    # 有用户请求在排队时让路
+                    await asyncio.sleep(max(1.0, self.request_interval))
+                await self.prefetch_link(link)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self.metrics.inc('prefetch_total', result='failure')
+                logger.info(f"预取失败: {link} - {str(e)}")
+
+    async def prefetch_link(self, link: str):
+        """预热单个链接的视频信息和字幕缓存，开启prefetch_summaries时继续生成总结"""
+        video_id, part_selector = await self.resolve_video_input(link)
+        cache_key = self.get_summary_cache_key(video_id, part_selector)
+        if self.summary_cache and self.summary_cache.contains(cache_key):
+            self.metrics.inc('prefetch_total', result='cached')
+            return
+
+        video_info = await self.fetch_video_info(video_id)
+        if not video_info or not video_info.get('aid'):
+            self.metrics.inc('prefetch_total', result='failure')
+            return
+        for page in self.select_pages(video_info.get('pages', []), part_selector):
+            await self.fetch_subtitle(video_info['aid'], page['cid'])
+
+        if self.prefetch_summaries and not self.scheduler.queued:
+            await self.start_pipeline(cache_key, video_id, part_selector, 'prefetch', 'prefetch')
+            self.metrics.inc('prefetch_total', result='summarized')
+        else:
+            self.metrics.inc('prefetch_total', result='warmed')
+        logger.info(f"预取完成: {video_id}")
+
+    async def fetch_video_info(self, video_id: str) -> Optional[Dict[str, Any]]:
+        """带短期缓存的视频信息获取"""
+        cached = self.video_info_cache.get(video_id)
+        self.metrics.inc('cache_requests_total', cache='video_info', result='hit' if cached else 'miss')
+        if cached:
+            return cached
+        video_info = await self.get_video_info(video_id)
+        if video_info:
+            self.video_info_cache.set(video_id, video_info)
+        return video_info
+
+    async def fetch_subtitle(self, aid: int, cid: int) -> Optional[List[Segment]]:
+        """带短期缓存的字幕获取"""
+        key = f"{aid}:{cid}"
+        cached = self.subtitle_cache.get(key)
+        self.metrics.inc('cache_requests_total', cache='subtitle', result='hit' if cached else 'miss')
+        if cached:
+            return cached
+        segments = await self.get_subtitle(aid, cid)
+        if segments:
+            self.subtitle_cache.set(key, segments)
+        return segments
+
+    @filter.permission_type(filter.PermissionType.ADMIN)
+    @filter.command("bs_sub")
+    async def bilibili_summary_subscribe(self, event: AstrMessageEvent, action: str = None, mid: str = None):
+        """管理当前会话订阅的UP主（管理员）"""
+        origin = event.unified_msg_origin
+        if action in ("add", "del"):
+            if not mid or not mid.strip().isdigit():
+                yield event.plain_result("❌ 请提供UP主的数字UID，例如：/bs_sub add 123456")
                 return
+            mid = mid.strip()
+            if action == "add":
+                changed = self.subscriptions.add(origin, mid)
+                reply = f"✅ 已订阅UP主 {mid}，新投稿将自动总结" if changed else f"UP主 {mid} 已在订阅列表中"
+            else:
+                changed = self.subscriptions.remove(origin, mid)
+                reply = f"🗑️ 已取消订阅UP主 {mid}" if changed else f"未订阅UP主 {mid}"
+            if changed:
+                self.save_subscriptions()
+            yield event.plain_result(reply)
+            return
 
-            # 获取字幕
-            subtitle_text = await self.get_subtitle(aid, cid)
-            if not subtitle_text:
-                yield event.plain_result("❌ 未找到可用的字幕")
+        mids = self.subscriptions.list(origin)
+        if not mids:
+            yield event.plain_result("当前会话没有订阅UP主\n添加订阅：/bs_sub add <UID>")
+            return
+        lines = [f"📡 当前会话订阅的UP主（{len(mids)} 个）："]
+        for item in mids:
+            name = (self.subscriptions.state(item) or {}).get('name')
+            lines.append(f"- {name}（{item}）" if name else f"- {item}")
+        lines.append("添加/取消订阅：/bs_sub add|del <UID>")
+        yield event.plain_result('\n'.join(lines))
+
+    def save_subscriptions(self):
+        try:
+            self.subscriptions.save()
+        except OSError as e:
+            logger.warning(f"保存订阅列表失败: {str(e)}")
+
+    async def subscription_loop(self):
+        """按轮询间隔检查订阅UP主的新投稿，每轮打散为带随机抖动的小批次，避免集中请求B站"""
+        semaphore = asyncio.Semaphore(max(1, self.subscription_concurrency))
+        while True:
+            plan = plan_batches(self.subscriptions.mids(), self.subscription_batch_size,
+                                self.subscription_poll_interval)
+            if not plan:
+                await asyncio.sleep(self.subscription_poll_interval)
+                continue
+            for delay, batch in plan:
+                await asyncio.sleep(delay)
+                await asyncio.gather(*(self.check_uploader(semaphore, mid) for mid in batch))
+
+    async def check_uploader(self, semaphore: asyncio.Semaphore, mid: str):
+        """拉取UP主最新投稿，总结上次轮询之后发布的视频"""
+        async with semaphore:
+            try:
+                state = self.subscriptions.state(mid)
+                if state is None:
+                    return
+                videos = await self.get_uploader_videos(mid)
+                if not videos:
+                    self.metrics.inc('subscription_polls_total', result='failure' if videos is None else 'empty')
+                    return
+
+                newest = max(video['created'] for video in videos)
+                state['name'] = videos[0]['author'] or state.get('name', '')
+                last_created = state.get('last_created')
+                if last_created is not None and newest <= last_created:
+                    self.metrics.inc('subscription_polls_total', result='unchanged')
+                    return
+                state['last_created'] = newest
+                self.save_subscriptions()
+                if last_created is None:
+                    # 首次轮询只记录进度，不回溯总结历史投稿
+                    self.metrics.inc('subscription_polls_total', result='seeded')
+                    return
+
+                self.metrics.inc('subscription_polls_total', result='new')
+                fresh = sorted((video for video in videos if video['created'] > last_created),
+                               key=lambda video: video['created'])
+                for video in fresh[-self.SUBSCRIPTION_MAX_NEW_VIDEOS:]:
+                    await self.summarize_upload(mid, video)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self.metrics.inc('subscription_polls_total', result='failure')
+                logger.warning(f"检查UP主 {mid} 的投稿失败: {str(e)}")
+
+    async def summarize_upload(self, mid: str, video: Dict[str, Any]):
+        """离线总结一个新投稿并写入缓存，开启subscription_push时推送到订阅的会话"""
+        # 有用户请求在排队时让路
+        while self.scheduler.queued:
+            await asyncio.sleep(max(1.0, self.request_interval))
+
+        bvid = video['bvid']
+        cache_key = self.get_summary_cache_key(bvid)
+        result = None
+        # 只检查是否已有总结，不计入缓存命中统计，也不影响LRU淘汰
+        if not (self.summary_cache and self.summary_cache.contains(cache_key)):
+            try:
+                result = await self.start_pipeline(cache_key, bvid, '1', 'subscription', f"subscription:{mid}")
+            except SummaryError as e:
+                self.metrics.inc('subscription_summaries_total', result='failure')
+                logger.info(f"订阅视频总结失败: {bvid} - {str(e)}")
                 return
+        self.metrics.inc('subscription_summaries_total', result='success')
+        logger.info(f"订阅视频总结完成: {bvid}")
 
-            # 生成总结
-            summary = await self.generate_summary(title, desc, subtitle_text)
-            if summary:
-                # 构建完整的结果信息
-                result_message = f"📺 视频标题：{title}\n\n📋 内容总结：\n{summary}"
-                yield event.plain_result(result_message)
-            else:
-                yield event.plain_result("❌ 生成总结失败")
+        if not self.subscription_push:
+            return
+        if result is None:
+            # 推送时才读取已缓存的总结
+            result = self.summary_cache.get(cache_key)
+            if result is None:
+                return
+        message = (f"📡 UP主 {video['author'] or mid} 发布了新视频：https://www.bilibili.com/video/{bvid}\n\n"
+                   + self.format_summary_message(result))
+        for origin in self.subscriptions.subscribers(mid):
+            try:
+                await self.context.send_message(origin, MessageChain().message(message))
+            except Exception as e:
+                logger.warning(f"推送订阅总结失败: {origin} - {str(e)}")
 
-        except Exception as e:
-            logger.error(f"Bilibili Summary插件: 处理请求时发生错误: {str(e)}")
-            yield event.plain_result(f"❌ 处理请求时发生错误: {str(e)}")
+    async def get_uploader_videos(self, mid: str) -> Optional[List[Dict[str, Any]]]:
+        """获取UP主最新的几个投稿（按发布时间倒序），失败时返回None"""
+        url = f"{self.api_base}/x/space/wbi/arc/search"
+        params = {'mid': mid, 'ps': self.SUBSCRIPTION_PAGE_SIZE, 'pn': 1, 'order': 'pubdate'}
+        headers = {
+            'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36',
+            'Referer': f'https://space.bilibili.com/{mid}'
+        }
+        if self.bilibili_sessdata:
+            headers['Cookie'] = f'SESSDATA={self.bilibili_sessdata}'
+
+        try:
+            status, data = await self.bili_get_json('space', url, headers, params=params, signed=True)
+        except (TransientError, CircuitOpenError) as e:
+            logger.warning(f"获取UP主 {mid} 的投稿列表失败: {str(e)}")
+            return None
+        if status != 200 or data.get('code') != 0:
+            logger.warning(f"获取UP主 {mid} 的投稿列表失败: status={status}, code={data.get('code')}")
+            return None
+
+        vlist = ((data.get('data') or {}).get('list') or {}).get('vlist') or []
+        return [
+            {
+                'bvid': item['bvid'],
+                'title': item.get('title', ''),
+                'author': item.get('author', ''),
+                'created': int(item.get('created') or 0)
+            }
+            for item in vlist if is_valid_bvid(item.get('bvid') or '')
+        ]
+
+    @filter.permission_type(filter.PermissionType.ADMIN)
+    @filter.command("bs_cache")
+    async def bilibili_summary_cache(self, event: AstrMessageEvent, action: str = None, video_input: str = None):
+        """查看或清除总结缓存（管理员）"""
+        if not self.summary_cache:
+            yield event.plain_result("总结缓存未启用")
+            return
 
+        if action == "clear":
+            video_id = self.parse_bilibili_url(video_input.strip()) if video_input else None
+            if video_input and not video_id:
+                yield event.plain_result("❌ 无法识别的视频链接或ID格式，请检查后重试")
+                return
+            removed = self.summary_cache.purge(video_id)
+            yield event.plain_result(f"🧹 已清除 {removed} 条总结缓存")
+            return
+
+        stats = self.summary_cache.stats()
+        yield event.plain_result(
+            f"📦 总结缓存：{stats['entries']} 条\n"
+            f"命中：{stats['hits']}，未命中：{stats['misses']}，命中率：{stats['hit_rate']:.1%}\n"
+            "清除缓存：/bs_cache clear [视频链接或ID]"
+        )
+
+    @filter.permission_type(filter.PermissionType.ADMIN)
+    @filter.command("bs_stats")
+    async def bilibili_summary_stats(self, event: AstrMessageEvent, action: str = None):
+        """查看各阶段耗时和计数统计（管理员）"""
+        if action == "reset":
+            self.metrics.reset()
+            yield event.plain_result("🧹 统计数据已重置")
+            return
+
+        lines = [self.metrics.render_text()]
+        if self.summary_cache:
+            stats = self.summary_cache.stats()
+            lines.append(f"📦 总结缓存：{stats['entries']} 条，命中率 {stats['hit_rate']:.1%}")
+        lines.append(f"🔗 短链接缓存：{len(self.short_link_cache)} 条")
+        lines.append(f"🗂️ 视频信息缓存：{len(self.video_info_cache)} 条，字幕缓存：{len(self.subtitle_cache)} 条")
+        if self._prefetch_queue is not None:
+            lines.append(f"📥 预取队列：{self._prefetch_queue.qsize()}")
+        if self.subscriptions.mids():
+            lines.append(f"📡 订阅的UP主：{len(self.subscriptions.mids())} 个")
+        waits = ', '.join(f"{name}={wait:.1f}s" for name, wait in self.rate_limiter.wait_times().items())
+        lines.append(f"🚦 限流排队：{waits}")
+        lines.append(f"🔄 进行中的视频：{len(self._inflight)}，"
+                     f"执行中任务：{self.scheduler.running}/{self.scheduler.workers}，排队：{self.scheduler.queued}")
+        breakers = ', '.join(
+            f"{name}={breaker.state}" + (f"({breaker.retry_in():.0f}s)" if breaker.retry_in() else '')
+            for name, breaker in self.breakers.items()
+        )
+        lines.append(f"🛡️ 熔断器：{breakers}")
+        yield event.plain_result('\n'.join(lines))
+
+    def get_summary_cache_key(self, video_id: str, part_selector: str = '1') -> str:
+        """构建总结缓存键：视频ID + 分P + 模型 + 提示词哈希"""
+        return f"{video_id}:p{part_selector}:{self.get_summary_variant()}"
+
+    def get_summary_variant(self) -> str:
+        """总结缓存键中区分模型和提示词的部分"""
+        prompt_hash = hashlib.sha1(self.summary_prompt.encode('utf-8')).hexdigest()[:16]
+        return f"{self.llm_pool.model_tag}:{prompt_hash}"
+
+    def format_summary_header(self, result: Dict[str, Any]) -> str:
+        """构建结果信息中总结正文之前的部分"""
+        message = f"📺 视频标题：{result['title']}\n\n"
+        if result.get('deduplicated_from'):
+            message += f"♻️ 与已总结的视频 {result['deduplicated_from']} 内容相同，已复用其总结\n\n"
+        parts = result.get('parts')
+        if parts:
+            for part in parts:
+                message += f"🎞️ P{part['page']} {part['part']}：\n{part['summary']}\n\n"
+            return message + "📋 整体总结：\n"
+        return message + "📋 内容总结：\n"
+
+    def format_summary_message(self, result: Dict[str, Any]) -> str:
+        """构建完整的结果信息"""
+        return self.format_summary_header(result) + result['summary']
+
+    @timed('view')
     async def get_video_info(self, video_id: str) -> Optional[Dict[str, Any]]:
         """获取视频基本信息"""
         # 根据视频ID类型构建URL
         if video_id.startswith('av'):
             # AV号
             aid = re.search(r'av(\d+)', video_id, re.IGNORECASE).group(1)
-            url = f"https://api.bilibili.com/x/web-interface/view?aid={aid}"
+            url = f"{self.api_base}/x/web-interface/view?aid={aid}"
         else:
             # BV号
-            url = f"https://api.bilibili.com/x/web-interface/view?bvid={video_id}"
+            url = f"{self.api_base}/x/web-interface/view?bvid={video_id}"
         headers = {
             'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
         }
 
         try:
-            async with aiohttp.ClientSession() as session:
-                async with session.get(url, headers=headers) as response:
-                    if response.status == 200:
-                        data = await response.json()
-                        code = data.get('code')
-                        if code == 0:
-                            video_data = data.get('data', {})
-                            pages = video_data.get('pages', [])
-                            if pages:
-                                result = {
-                                    'aid': video_data.get('aid'),
-                                    'cid': pages[0].get('cid'),  # 取第一个分P
-                                    'title': video_data.get('title'),
-                                    'desc': video_data.get('desc')
+            status, data = await self.bili_get_json('view', url, headers)
+            if status == 200:
+                code = data.get('code')
+                if code == 0:
+                    video_data = data.get('data', {})
+                    pages = video_data.get('pages', [])
+                    if pages:
+                        result = {
+                            'aid': video_data.get('aid'),
+                            'cid': pages[0].get('cid'),  # 第一个分P
+                            'title': video_data.get('title'),
+                            'desc': video_data.get('desc'),
+                            'pages': [
+                                {
+                                    'page': page.get('page', index + 1),
+                                    'cid': page.get('cid'),
+                                    'part': page.get('part', ''),
+                                    'duration': page.get('duration', 0)
                                 }
-                                logger.info(f"成功获取视频信息: {result['title']}")
-                                return result
-                        else:
-                            message = data.get('message', '未知错误')
-                            logger.warning(f"Bilibili API返回错误: code={code}, message={message}")
-                    else:
-                        logger.warning(f"HTTP请求失败: status={response.status}")
+                                for index, page in enumerate(pages)
+                            ]
+                        }
+                        logger.info(f"成功获取视频信息: {result['title']}")
+                        return result
+                else:
+                    message = data.get('message', '未知错误')
+                    logger.warning(f"Bilibili API返回错误: code={code}, message={message}")
+            else:
+                logger.warning(f"HTTP请求失败: status={status}")
 
-            await asyncio.sleep(self.request_interval)
             return None
+        except (TransientError, CircuitOpenError) as e:
+            logger.warning(f"获取视频信息失败: {str(e)}")
+            raise SummaryError(self.BILIBILI_UNAVAILABLE_MESSAGE)
         except Exception as e:
             logger.error(f"获取视频信息失败: {str(e)}")
             return None
 
-    async def get_subtitle(self, aid: int, cid: int) -> Optional[str]:
+    async def get_subtitle(self, aid: int, cid: int) -> Optional[List[Segment]]:
         """获取视频字幕"""
-        url = f"https://api.bilibili.com/x/player/wbi/v2?aid={aid}&cid={cid}"
+        url = f"{self.api_base}/x/player/wbi/v2"
         headers = {
             'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36',
             'Referer': 'https://www.bilibili.com/'
@@ -488,160 +1763,394 @@ class BilibiliSummaryPlugin(Star):
             headers['Cookie'] = f'SESSDATA={self.bilibili_sessdata}'
 
         try:
-            async with aiohttp.ClientSession() as session:
-                async with session.get(url, headers=headers) as response:
-                    if response.status == 200:
-                        data = await response.json()
-                        code = data.get('code')
-                        if code == 0:
-                            subtitle_data = data.get('data', {}).get('subtitle', {})
-                            subtitles = subtitle_data.get('subtitles', [])
-
-                            if not subtitles:
-                                # 检查是否需要登录
-                                need_login = data.get('data', {}).get('need_login_subtitle', False)
-                                if need_login:
-                                    logger.warning("获取字幕需要登录，请检查SESSDATA配置")
-                                else:
-                                    logger.warning("该视频没有可用的字幕")
-                                return None
-
-                            # 优先选择中文字幕
-                            selected_subtitle = None
-                            for subtitle in subtitles:
-                                lan_doc = subtitle.get('lan_doc', '')
-                                if '中文' in lan_doc:
-                                    selected_subtitle = subtitle
-                                    logger.info(f"选择中文字幕: {lan_doc}")
-                                    break
-
-                            # 如果没有中文字幕，选择第一个
-                            if not selected_subtitle and subtitles:
-                                selected_subtitle = subtitles[0]
-                                lan_doc = selected_subtitle.get('lan_doc', '未知语言')
-                                logger.info(f"未找到中文字幕，选择: {lan_doc}")
-
-                            if selected_subtitle:
-                                subtitle_url = selected_subtitle.get('subtitle_url')
-                                if subtitle_url:
-                                    # 确保URL是完整的
-                                    if subtitle_url.startswith('//'):
-                                        subtitle_url = 'https:' + subtitle_url
-                                    elif not subtitle_url.startswith('http'):
-                                        subtitle_url = 'https://' + subtitle_url
-
-                                    return await self.download_subtitle(subtitle_url)
+            selected_url = None
+            with self.metrics.span('player'):
+                status, data = await self.bili_get_json('player', url, headers,
+                                                        params={'aid': aid, 'cid': cid}, signed=True)
+            if status == 200:
+                code = data.get('code')
+                if code == 0:
+                    subtitle_data = data.get('data', {}).get('subtitle', {})
+                    subtitles = subtitle_data.get('subtitles', [])
+
+                    if not subtitles:
+                        # 检查是否需要登录
+                        need_login = data.get('data', {}).get('need_login_subtitle', False)
+                        if need_login:
+                            logger.warning("获取字幕需要登录，请检查SESSDATA配置")
                         else:
-                            message = data.get('message', '未知错误')
-                            logger.warning(f"获取字幕API返回错误: code={code}, message={message}")
-                    else:
-                        logger.warning(f"获取字幕HTTP请求失败: status={response.status}")
+                            logger.warning("该视频没有可用的字幕")
+                        return None
+
+                    # 优先选择中文字幕
+                    selected_subtitle = None
+                    for subtitle in subtitles:
+                        lan_doc = subtitle.get('lan_doc', '')
+                        if '中文' in lan_doc:
+                            selected_subtitle = subtitle
+                            logger.info(f"选择中文字幕: {lan_doc}")
+                            break
+
+                    # 如果没有中文字幕，选择第一个
+                    if not selected_subtitle and subtitles:
+                        selected_subtitle = subtitles[0]
+                        lan_doc = selected_subtitle.get('lan_doc', '未知语言')
+                        logger.info(f"未找到中文字幕，选择: {lan_doc}")
+
+                    if selected_subtitle:
+                        subtitle_url = selected_subtitle.get('subtitle_url')
+                        if subtitle_url:
+                            # 确保URL是完整的
+                            if subtitle_url.startswith('//'):
+                                subtitle_url = 'https:' + subtitle_url
+                            elif not subtitle_url.startswith('http'):
+                                subtitle_url = 'https://' + subtitle_url
+
+                            selected_url = subtitle_url
+                else:
+                    message = data.get('message', '未知错误')
+                    logger.warning(f"获取字幕API返回错误: code={code}, message={message}")
+            else:
+                logger.warning(f"获取字幕HTTP请求失败: status={status}")
 
-            await asyncio.sleep(self.request_interval)
+            # 字幕下载单独计时，并在释放播放器接口连接后进行
+            if selected_url:
+                return await self.download_subtitle(selected_url)
             return None
+        except SummaryError:
+            raise
+        except (TransientError, CircuitOpenError) as e:
+            logger.warning(f"获取字幕失败: {str(e)}")
+            raise SummaryError(self.BILIBILI_UNAVAILABLE_MESSAGE)
         except Exception as e:
             logger.error(f"获取字幕失败: {str(e)}")
             return None
 
-    async def download_subtitle(self, subtitle_url: str) -> Optional[str]:
-        """下载字幕文件并提取文本"""
+    @timed('subtitle')
+    async def download_subtitle(self, subtitle_url: str) -> Optional[List[Segment]]:
+        """下载字幕文件并提取带时间戳的字幕片段"""
         headers = {
             'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36',
             'Referer': 'https://www.bilibili.com/'
         }
 
         try:
-            async with aiohttp.ClientSession() as session:
-                async with session.get(subtitle_url, headers=headers) as response:
-                    if response.status == 200:
-                        subtitle_data = await response.json()
-                        body = subtitle_data.get('body', [])
-
-                        if not body:
-                            logger.warning("字幕文件为空")
-                            return None
-
-                        # 提取所有字幕文本
-                        subtitle_texts = []
-                        for item in body:
-                            content = item.get('content', '').strip()
-                            if content:
-                                subtitle_texts.append(content)
-
-                        if not subtitle_texts:
-                            logger.warning("字幕内容为空")
-                            return None
-
-                        full_text = ' '.join(subtitle_texts)
-                        original_length = len(full_text)
-
-                        # 限制长度
-                        if original_length > self.max_subtitle_length:
-                            full_text = full_text[:self.max_subtitle_length] + "..."
-                            logger.info(f"字幕文本过长({original_length}字符)，已截断到{self.max_subtitle_length}字符")
-                        else:
-                            logger.info(f"成功获取字幕文本({original_length}字符)")
-
-                        return full_text
-                    else:
-                        logger.warning(f"下载字幕HTTP请求失败: status={response.status}")
+            status, segments = await self.bili_get_json('subtitle', subtitle_url, headers,
+                                                        reader=self.read_subtitle)
+            if status == 200:
+                if not segments:
+                    logger.warning("字幕内容为空")
+                    return None
+
+                if segments.truncated:
+                    logger.info(f"字幕超过读取上限({self.max_subtitle_chars}字符)，只使用前{len(segments)}行")
+                logger.info(f"成功获取字幕文本({len(segments)}行, {text_length(segments)}字符)")
+                return segments
+            else:
+                logger.warning(f"下载字幕HTTP请求失败: status={status}")
 
-            await asyncio.sleep(self.request_interval)
             return None
+        except (TransientError, CircuitOpenError) as e:
+            logger.warning(f"下载字幕失败: {str(e)}")
+            raise SummaryError(self.BILIBILI_UNAVAILABLE_MESSAGE)
         except Exception as e:
             logger.error(f"下载字幕失败: {str(e)}")
             return None
 
-    async def generate_summary(self, title: str, desc: str, subtitle_text: str) -> Optional[str]:
-        """使用LLM生成视频总结"""
+    async def read_subtitle(self, response: aiohttp.ClientResponse) -> SegmentArray:
+        """流式读取并解析字幕文件，累计文本达到max_subtitle_chars后停止读取"""
+        parser = SubtitleStreamParser(self.max_subtitle_chars)
+        decoder = codecs.getincrementaldecoder('utf-8')('replace')
+        async for chunk in response.content.iter_chunked(self.SUBTITLE_READ_CHUNK):
+            if parser.feed(decoder.decode(chunk)):
+                # 提前结束时未读完的响应会直接关闭连接，不再下载剩余部分
+                break
+        else:
+            parser.feed(decoder.decode(b'', final=True))
+        return parser.close()
+
+    async def summarize_segments(self, title: str, desc: str, segments: List[Segment],
+                                 on_delta: Optional[Callable[[str], None]] = None) -> Optional[str]:
+        """总结字幕，超长字幕按时间分块后并行总结再逐层合并"""
+        segments = self.compact_subtitle(segments)
+        budget, measure, unit = self.get_subtitle_budget(title, desc)
+        desc = self.fit_desc(desc)
+        total = measure(join_segments(segments))
+        if total <= budget:
+            return await self.generate_summary(title, desc, join_segments(segments), on_delta=on_delta)
+
+        chunks = split_segments(segments, budget, measure)
+        logger.info(f"字幕文本过长({total}{unit})，分为{len(chunks)}段并行总结")
+        semaphore = asyncio.Semaphore(max(1, self.chunk_concurrency))
+
+        async def summarize_chunk(index: int, chunk: List[Segment]) -> Optional[str]:
+            start, end = format_timestamp(chunk[0][0]), format_timestamp(chunk[-1][1])
+            prompt = (f"以下是视频《{title}》字幕的第{index + 1}/{len(chunks)}段（{start}-{end}）。"
+                      "请提炼这一段的主要内容和关键信息，用简洁的要点列出，不要编造字幕中没有的内容。")
+            async with semaphore:
+                partial = await self.chat_completion(prompt, join_segments(chunk), max_tokens=500)
+            return f"[{start}-{end}]\n{partial}" if partial else None
+
+        partials = await asyncio.gather(*(summarize_chunk(i, chunk) for i, chunk in enumerate(chunks)))
+        partials = [p for p in partials if p]
+        if not partials:
+            return None
+        if len(partials) < len(chunks):
+            logger.warning(f"部分字幕段总结失败: 成功{len(partials)}/{len(chunks)}段")
+
+        # 分段要点过多时逐层合并，最多max_reduce_tiers层
+        tier = 0
+        fanout = max(2, self.reduce_fanout)
+        while len(partials) > fanout and tier < self.max_reduce_tiers:
+            groups = [partials[i:i + fanout] for i in range(0, len(partials), fanout)]
+
+            async def reduce_group(group: List[str]) -> Optional[str]:
+                prompt = (f"以下是视频《{title}》若干连续片段的要点，请合并为更精炼的要点，"
+                          "保持时间顺序并保留时间标记。")
+                async with semaphore:
+                    return await self.chat_completion(prompt, '\n\n'.join(group), max_tokens=700)
+
+            reduced = await asyncio.gather(*(reduce_group(group) for group in groups))
+            # 合并失败的组保留原要点，避免丢失内容
+            partials = [r if r else '\n\n'.join(g) for r, g in zip(reduced, groups)]
+            tier += 1
+            logger.info(f"完成第{tier}层合并，剩余{len(partials)}段要点")
+
+        return await self.generate_summary(title, desc, '\n\n'.join(partials),
+                                           subtitle_label="分段要点", on_delta=on_delta)
+
+    def compact_subtitle(self, segments: List[Segment]) -> List[Segment]:
+        """提交LLM前压缩字幕，并记录压缩前后的token估算"""
+        if not self.subtitle_compaction:
+            return segments
+        compacted = compact_segments(segments)
+        if not compacted:
+            # 字幕全是非语音内容时保留原文，交给LLM判断
+            return segments
+        before, after = segment_tokens(segments), segment_tokens(compacted)
+        self.metrics.inc('subtitle_tokens_total', before, stage='raw')
+        self.metrics.inc('subtitle_tokens_total', after, stage='compacted')
+        logger.info(f"字幕压缩: {len(segments)}行 -> {len(compacted)}行, 约{before} -> {after} tokens")
+        return compacted
+
+    def get_subtitle_budget(self, title: str, desc: str) -> Tuple[int, Callable[[str], int], str]:
+        """单次请求可容纳的字幕量，返回 (预算, 计量函数, 单位)
+
+        按token计量时从max_prompt_tokens中扣除提示词、标题和简介；max_prompt_tokens为0时沿用按字符计的max_subtitle_length。
+        """
+        if self.max_prompt_tokens <= 0:
+            return self.max_subtitle_length, len, '字符'
+        overhead = estimate_tokens(self.summary_prompt) + estimate_tokens(title) + \
+            min(estimate_tokens(desc or ''), self.max_prompt_tokens // 10)
+        return max(self.max_prompt_tokens // 4, self.max_prompt_tokens - overhead), estimate_tokens, 'tokens'
+
+    def fit_desc(self, desc: str) -> str:
+        """简介超过token预算的十分之一时截断"""
+        if not desc or self.max_prompt_tokens <= 0:
+            return desc
+        limit = self.max_prompt_tokens // 10
+        if estimate_tokens(desc) <= limit:
+            return desc
+        # 按估算比例截断，汉字约1.3 token/字，取保守值
+        return desc[:int(limit / 1.3)] + '…'
+
+    async def generate_summary(self, title: str, desc: str, subtitle_text: str,
+                               subtitle_label: str = "视频字幕",
+                               on_delta: Optional[Callable[[str], None]] = None) -> Optional[str]:
+        """使用LLM生成视频总结，传入on_delta时以流式方式逐段回调"""
         # 构建提示词
         content = f"视频标题：{title}\n\n"
         if desc and desc.strip():
             content += f"视频简介：{desc}\n\n"
-        content += f"视频字幕：\n{subtitle_text}"
+        content += f"{subtitle_label}：\n{subtitle_text}"
+
+        if on_delta:
+            summary = await self.chat_completion_stream(self.summary_prompt, content, on_delta)
+        else:
+            summary = await self.chat_completion(self.summary_prompt, content)
+        if summary:
+            logger.info(f"成功生成总结({len(summary)}字符)")
+        return summary
+
+    @timed('llm')
+    async def chat_completion(self, system_prompt: str, user_content: str, max_tokens: int = 1000) -> Optional[str]:
+        """调用LLM接口池（延迟路由、对冲请求、失败切换），返回回复文本"""
+        messages = [
+            {"role": "system", "content": system_prompt},
+            {"role": "user", "content": user_content}
+        ]
+
+        async def attempt(endpoint: LLMEndpoint) -> Optional[str]:
+            headers = {
+                'Content-Type': 'application/json',
+                'Authorization': f'Bearer {endpoint.api_key}'
+            }
+            payload = {
+                "model": endpoint.model,
+                "messages": messages,
+                "temperature": 0.7,
+                "max_tokens": max_tokens
+            }
+
+            session = await self.get_http_session()
+            # LLM生成耗时较长，单独放宽读取超时
+            llm_timeout = aiohttp.ClientTimeout(total=endpoint.timeout, connect=self.http_connect_timeout)
+            try:
+                async with session.post(endpoint.url, headers=headers, json=payload, timeout=llm_timeout) as response:
+                    if response.status != 200:
+                        error_text = await response.text()
+                        logger.error(f"LLM API[{endpoint.name}]请求失败: {response.status} - {error_text}")
+                        self.metrics.inc('llm_errors_total', code=response.status)
+                        if response.status == 429 or response.status >= 500:
+                            raise TransientError(f"HTTP {response.status}",
+                                                 parse_retry_after(response.headers.get('Retry-After')))
+                        return None
+                    data = await response.json()
+            except aiohttp.ClientConnectionError as e:
+                raise TransientError(f"网络异常: {e.__class__.__name__}") from e
+            except asyncio.TimeoutError:
+                logger.warning(f"LLM API[{endpoint.name}]请求超时({endpoint.timeout:.0f}s)")
+                raise
+
+            self.record_llm_usage(data.get('usage'))
+            choices = data.get('choices', [])
+            if not choices:
+                logger.warning("LLM响应中没有choices")
+                return None
+            content = choices[0].get('message', {}).get('content', '').strip()
+            if not content:
+                logger.warning("LLM返回空内容")
+                return None
+            return content
 
+        try:
+            # 接口池内先切换接口；所有接口都遇到临时错误时再整体退避重试。
+            # 整体超时只切换不重试：生成已耗费了完整的超时时间，重试只会让用户等待更久
+            return await self.retry_policy.run(lambda: self.llm_pool.run(attempt), None, self.retry_callback('llm'))
+        except Exception as e:
+            logger.error(f"调用LLM API失败: {str(e)}")
+            return None
+
+    def record_llm_usage(self, usage: Optional[Dict[str, Any]]):
+        """记录LLM返回的token用量"""
+        if not usage:
+            return
+        self.metrics.inc('llm_tokens_total', usage.get('prompt_tokens', 0), type='prompt')
+        self.metrics.inc('llm_tokens_total', usage.get('completion_tokens', 0), type='completion')
+
+    @timed('llm_stream')
+    async def chat_completion_stream(self, system_prompt: str, user_content: str,
+                                     on_delta: Callable[[str], None], max_tokens: int = 1000) -> Optional[str]:
+        """以SSE流式方式调用OpenAI兼容接口，每收到增量文本即回调on_delta
+
+        流式请求只发往接口池中排名第一的接口，不做对冲；
+        尚未产出任何内容就失败时回退到普通请求（走接口池切换），回退结果整体回调一次。
+        """
         messages = [
-            {"role": "system", "content": self.summary_prompt},
-            {"role": "user", "content": content}
+            {"role": "system", "content": system_prompt},
+            {"role": "user", "content": user_content}
         ]
 
+        parts: List[str] = []
+        endpoint = self.llm_pool.ranked()[0]
+        if endpoint.breaker.retry_in() > 0:
+            # 全部接口熔断中，快速失败，不再发起流式请求
+            logger.warning(f"LLM接口熔断中，{endpoint.breaker.retry_in():.0f}秒后重试")
+            return None
+
         headers = {
             'Content-Type': 'application/json',
-            'Authorization': f'Bearer {self.openai_api_key}'
+            'Authorization': f'Bearer {endpoint.api_key}'
         }
 
         payload = {
-            "model": self.openai_model,
+            "model": endpoint.model,
             "messages": messages,
             "temperature": 0.7,
-            "max_tokens": 1000
+            "max_tokens": max_tokens,
+            "stream": True
         }
 
         try:
-            async with aiohttp.ClientSession() as session:
-                async with session.post(self.openai_api_url, headers=headers, json=payload) as response:
-                    if response.status == 200:
-                        data = await response.json()
-                        choices = data.get('choices', [])
-                        if choices:
-                            content = choices[0].get('message', {}).get('content', '').strip()
-                            if content:
-                                logger.info(f"成功生成总结({len(content)}字符)")
-                                return content
-                            else:
-                                logger.warning("LLM返回空内容")
-                                return None
-                        else:
-                            logger.warning("LLM响应中没有choices")
-                            return None
-                    else:
-                        error_text = await response.text()
-                        logger.error(f"LLM API请求失败: {response.status} - {error_text}")
-                        return None
+            session = await self.get_http_session()
+            llm_timeout = aiohttp.ClientTimeout(total=endpoint.timeout, connect=self.http_connect_timeout)
+            async with session.post(endpoint.url, headers=headers, json=payload, timeout=llm_timeout) as response:
+                if response.status != 200:
+                    error_text = await response.text()
+                    logger.warning(f"LLM流式请求失败: {response.status} - {error_text}")
+                    self.metrics.inc('llm_errors_total', code=response.status)
+                elif 'text/event-stream' not in response.headers.get('Content-Type', ''):
+                    # 接口不支持流式时会直接返回完整JSON
+                    data = await response.json(content_type=None)
+                    self.record_llm_usage(data.get('usage'))
+                    choices = data.get('choices', [])
+                    if choices:
+                        content = choices[0].get('message', {}).get('content', '').strip()
+                        if content:
+                            on_delta(content)
+                            return content
+                else:
+                    async for raw_line in response.content:
+                        line = raw_line.decode('utf-8', errors='ignore').strip()
+                        if not line.startswith('data:'):
+                            continue
+                        data_str = line[5:].strip()
+                        if data_str == '[DONE]':
+                            break
+                        try:
+                            chunk = json.loads(data_str)
+                        except json.JSONDecodeError:
+                            continue
+                        # 部分接口会在最后一个数据块中返回usage
+                        self.record_llm_usage(chunk.get('usage'))
+                        choices = chunk.get('choices') or []
+                        if not choices:
+                            continue
+                        delta = (choices[0].get('delta') or {}).get('content')
+                        if delta:
+                            parts.append(delta)
+                            on_delta(delta)
         except Exception as e:
-            logger.error(f"调用LLM API失败: {str(e)}")
+            logger.error(f"LLM流式请求失败: {str(e)}")
+            if parts:
+                # 已向用户输出部分内容，不再回退，避免缓存不完整的总结
+                return None
+
+        content = ''.join(parts).strip()
+        if content:
+            return content
+        if parts:
             return None
 
+        logger.info("流式输出不可用，回退到普通请求")
+        content = await self.chat_completion(system_prompt, user_content, max_tokens=max_tokens)
+        if content:
+            on_delta(content)
+        return content
+
     async def terminate(self):
         """插件卸载时调用"""
+        await self.scheduler.stop()
+        if self._prefetch_task:
+            self._prefetch_task.cancel()
+        if self._subscription_task:
+            self._subscription_task.cancel()
+        if self._metrics_task:
+            self._metrics_task.cancel()
+            try:
+                self.write_metrics_file()
+            except OSError as e:
+                logger.warning(f"写入指标文件失败: {str(e)}")
+        if self._metrics_runner:
+            await self._metrics_runner.cleanup()
+        if self._http_session is not None and not self._http_session.closed:
+            await self._http_session.close()
+        if self.summary_cache:
+            self.summary_cache.close()
+        self.segment_store.close()
+        if self.fingerprint_index is not None:
+            self.fingerprint_index.close()
+        if self.job_ledger:
+            self.job_ledger.close()
+        self.short_link_cache.save()
         logger.info("Bilibili Summary插件: 已卸载")
@@ -0,0 +1,160 @@
+import bisect
+import functools
+import time
+from contextlib import contextmanager
+from typing import Dict, List, Tuple
+
+# 阶段耗时直方图的分桶上界（秒）
+DEFAULT_BUCKETS = (0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+
+LabelKey = Tuple[Tuple[str, str], ...]
+
+
+def _label_key(labels: Dict[str, str]) -> LabelKey:
+    return tuple(sorted((key, str(value)) for key, value in labels.items()))
+
+
+def _format_labels(labels: LabelKey, extra: str = '') -> str:
+    parts = [f'{key}="{value}"' for key, value in labels]
+    if extra:
+        parts.append(extra)
+    return '{' + ','.join(parts) + '}' if parts else ''
+
+
+class Histogram:
+    """固定分桶的直方图，记录开销只有一次二分查找"""
+
+    def __init__(self, buckets: Tuple[float, ...] = DEFAULT_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value: float):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+
+    def quantile(self, q: float) -> float:
+        """按分桶线性插值估算分位数"""
+        if not self.count:
+            return 0.0
+        target = q * self.count
+        cumulative = 0
+        for index, bucket_count in enumerate(self.counts):
+            if cumulative + bucket_count >= target and bucket_count:
+                lower = self.buckets[index - 1] if index > 0 else 0.0
+                upper = self.buckets[index] if index < len(self.buckets) else lower * 2 or 1.0
+                return lower + (upper - lower) * (target - cumulative) / bucket_count
+            cumulative += bucket_count
+        return self.buckets[-1]
+
+
+class Metrics:
+    """进程内的计数器和直方图"""
+
+    def __init__(self, namespace: str = 'bilibili_summary'):
+        self.namespace = namespace
+        self.counters: Dict[str, Dict[LabelKey, float]] = {}
+        self.histograms: Dict[str, Dict[LabelKey, Histogram]] = {}
+        self.gauges: Dict[str, Dict[LabelKey, float]] = {}
+        self.started_at = time.time()
+
+    def inc(self, name: str, value: float = 1, **labels):
+        series = self.counters.setdefault(name, {})
+        key = _label_key(labels)
+        series[key] = series.get(key, 0) + value
+
+    def set_gauge(self, name: str, value: float, **labels):
+        self.gauges.setdefault(name, {})[_label_key(labels)] = value
+
+    def observe(self, name: str, value: float, **labels):
+        series = self.histograms.setdefault(name, {})
+        key = _label_key(labels)
+        histogram = series.get(key)
+        if histogram is None:
+            histogram = series[key] = Histogram()
+        histogram.observe(value)
+
+    @contextmanager
+    def span(self, stage: str):
+        """记录一个阶段的耗时"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe('stage_seconds', time.perf_counter() - start, stage=stage)
+
+    def counter_value(self, name: str, **labels) -> float:
+        return self.counters.get(name, {}).get(_label_key(labels), 0)
+
+    def reset(self):
+        self.counters.clear()
+        self.histograms.clear()
+        self.gauges.clear()
+        self.started_at = time.time()
+
+    def render_text(self) -> str:
+        """生成便于在聊天中阅读的统计摘要"""
+        lines: List[str] = []
+        stages = self.histograms.get('stage_seconds', {})
+        if stages:
+            lines.append("⏱️ 阶段耗时（次数 / 平均 / p50 / p95）：")
+            for key, histogram in sorted(stages.items()):
+                stage = dict(key).get('stage', '')
+                lines.append(
+                    f"• {stage}: {histogram.count}次 / {histogram.sum / histogram.count:.2f}s / "
+                    f"{histogram.quantile(0.5):.2f}s / {histogram.quantile(0.95):.2f}s"
+                )
+
+        if self.counters or self.gauges:
+            lines.append("📊 计数：")
+            for name, series in sorted(list(self.counters.items()) + list(self.gauges.items())):
+                for key, value in sorted(series.items()):
+                    label_text = ','.join(f"{k}={v}" for k, v in key)
+                    lines.append(f"• {name}{'[' + label_text + ']' if label_text else ''}: {value:g}")
+
+        uptime = time.time() - self.started_at
+        lines.append(f"统计时长：{uptime / 3600:.1f}小时")
+        return '\n'.join(lines)
+
+    def render_prometheus(self) -> str:
+        """生成Prometheus文本格式"""
+        lines: List[str] = []
+        for name, series in sorted(self.counters.items()):
+            full_name = f"{self.namespace}_{name}"
+            lines.append(f"# TYPE {full_name} counter")
+            for key, value in sorted(series.items()):
+                lines.append(f"{full_name}{_format_labels(key)} {value:g}")
+
+        for name, series in sorted(self.gauges.items()):
+            full_name = f"{self.namespace}_{name}"
+            lines.append(f"# TYPE {full_name} gauge")
+            for key, value in sorted(series.items()):
+                lines.append(f"{full_name}{_format_labels(key)} {value:g}")
+
+        for name, series in sorted(self.histograms.items()):
+            full_name = f"{self.namespace}_{name}"
+            lines.append(f"# TYPE {full_name} histogram")
+            for key, histogram in sorted(series.items()):
+                cumulative = 0
+                for bound, bucket_count in zip(histogram.buckets, histogram.counts):
+                    cumulative += bucket_count
+                    le = 'le="%g"' % bound
+                    lines.append(f"{full_name}_bucket{_format_labels(key, le)} {cumulative}")
+                le = 'le="+Inf"'
+                lines.append(f"{full_name}_bucket{_format_labels(key, le)} {histogram.count}")
+                lines.append(f"{full_name}_sum{_format_labels(key)} {histogram.sum:.6f}")
+                lines.append(f"{full_name}_count{_format_labels(key)} {histogram.count}")
+        return '\n'.join(lines) + '\n'
+
+
+def timed(stage: str):
+    """记录异步方法耗时的装饰器，要求实例上有metrics属性"""
+    def decorator(func):
+        @functools.wraps(func)
+        async def wrapper(self, *args, **kwargs):
+            with self.metrics.span(stage):
+                return await func(self, *args, **kwargs)
+        return wrapper
+    return decorator
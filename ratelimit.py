@@ -0,0 +1,79 @@
+import asyncio
+import time
+from typing import Dict
+
+
+class TokenBucket:
+    """令牌桶，令牌不足时按预约顺序排队（先到先得）"""
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = max(1.0, capacity)
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def reserve(self) -> float:
+        """预约一个令牌，返回需要等待的秒数（令牌可以为负，表示已被排队的调用方预约）"""
+        if self.rate <= 0:
+            return 0.0
+        self._refill()
+        self._tokens -= 1
+        return 0.0 if self._tokens >= 0 else -self._tokens / self.rate
+
+    def try_acquire(self) -> bool:
+        """有可用令牌时立即取走并返回True，否则不排队直接返回False"""
+        if self.rate <= 0:
+            return True
+        self._refill()
+        if self._tokens < 1:
+            return False
+        self._tokens -= 1
+        return True
+
+    def refund(self):
+        """归还一个未使用的预约"""
+        if self.rate <= 0:
+            return
+        self._refill()
+        self._tokens = min(self.capacity, self._tokens + 1)
+
+    def wait_time(self) -> float:
+        """当前新调用方需要等待的秒数"""
+        if self.rate <= 0:
+            return 0.0
+        self._refill()
+        return 0.0 if self._tokens >= 1 else (1 - self._tokens) / self.rate
+
+
+class RateLimiter:
+    """进程内共享的限流器，每个接口一个令牌桶"""
+
+    def __init__(self, rates: Dict[str, float], burst: float):
+        self.buckets = {name: TokenBucket(rate, burst) for name, rate in rates.items()}
+
+    async def acquire(self, endpoint: str):
+        """等待直到允许向endpoint发出一次请求"""
+        bucket = self.buckets.get(endpoint)
+        if bucket is None:
+            return
+
+        delay = bucket.reserve()
+        if delay <= 0:
+            return
+        try:
+            await asyncio.sleep(delay)
+        except asyncio.CancelledError:
+            bucket.refund()
+            raise
+
+    def wait_time(self, endpoint: str) -> float:
+        bucket = self.buckets.get(endpoint)
+        return bucket.wait_time() if bucket else 0.0
+
+    def wait_times(self) -> Dict[str, float]:
+        return {name: bucket.wait_time() for name, bucket in self.buckets.items()}
@@ -0,0 +1,157 @@
+import asyncio
+import random
+import time
+from email.utils import parsedate_to_datetime
+from typing import Any, Awaitable, Callable, Optional
+
+# B站风控相关的错误码，通常稍后重试即可恢复
+RISK_CONTROL_CODES = (-412, -352, -799)
+
+
+class TransientError(Exception):
+    """可重试的临时错误（风控、限流、5xx、网络异常）"""
+
+    def __init__(self, message: str, retry_after: Optional[float] = None):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class CircuitOpenError(Exception):
+    """熔断器处于打开状态，请求被直接拒绝"""
+
+
+def parse_retry_after(value: Optional[str]) -> Optional[float]:
+    """解析Retry-After响应头（秒数或HTTP日期）"""
+    if not value:
+        return None
+    value = value.strip()
+    if value.isdigit():
+        return float(value)
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+class CircuitBreaker:
+    """按上游划分的熔断器：连续失败达到阈值后打开，冷却后进入半开状态放行一个探测请求"""
+
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half_open'
+
+    def __init__(self, name: str, failure_threshold: int, recovery_timeout: float,
+                 on_state_change: Optional[Callable[['CircuitBreaker', str, str], None]] = None):
+        self.name = name
+        self.failure_threshold = max(1, failure_threshold)
+        self.recovery_timeout = recovery_timeout
+        self.on_state_change = on_state_change
+        self.state = self.CLOSED
+        self.failures = 0
+        self._opened_at = 0.0
+        self._probe_in_flight = False
+
+    def _set_state(self, state: str):
+        if state != self.state:
+            old_state, self.state = self.state, state
+            if self.on_state_change:
+                self.on_state_change(self, old_state, state)
+
+    def allow(self) -> bool:
+        """当前是否允许发出请求"""
+        if self.state == self.CLOSED:
+            return True
+        if self.state == self.OPEN:
+            if time.monotonic() - self._opened_at < self.recovery_timeout:
+                return False
+            self._set_state(self.HALF_OPEN)
+        # 半开状态只放行一个探测请求
+        if self._probe_in_flight:
+            return False
+        self._probe_in_flight = True
+        return True
+
+    def retry_in(self) -> float:
+        """距离允许下一次探测还需等待的秒数"""
+        if self.state != self.OPEN:
+            return 0.0
+        return max(0.0, self.recovery_timeout - (time.monotonic() - self._opened_at))
+
+    def record_success(self):
+        self._probe_in_flight = False
+        self.failures = 0
+        self._set_state(self.CLOSED)
+
+    def record_failure(self):
+        self._probe_in_flight = False
+        self.failures += 1
+        if self.state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+            self._opened_at = time.monotonic()
+            self._set_state(self.OPEN)
+
+    def release(self):
+        """请求既未成功也未失败（如被取消）时归还探测名额"""
+        self._probe_in_flight = False
+
+
+class RetryPolicy:
+    """带抖动的指数退避重试，优先遵循服务端给出的Retry-After"""
+
+    def __init__(self, max_attempts: int, base_delay: float, max_delay: float):
+        self.max_attempts = max(1, max_attempts)
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+
+    def backoff(self, attempt: int, retry_after: Optional[float] = None) -> float:
+        if retry_after is not None:
+            return min(retry_after, self.max_delay)
+        # full jitter：在 [0, base * 2^attempt] 内随机，避免多个请求同时重试
+        return random.uniform(0, min(self.max_delay, self.base_delay * (2 ** attempt)))
+
+    async def run(self, func: Callable[[], Awaitable[Any]], breaker: Optional[CircuitBreaker] = None,
+                  on_retry: Optional[Callable[[int, TransientError, float], None]] = None) -> Any:
+        """执行func，遇到TransientError时退避重试；熔断器打开时抛出CircuitOpenError"""
+        for attempt in range(self.max_attempts):
+            if breaker and not breaker.allow():
+                raise CircuitOpenError(f"{breaker.name}熔断中，{breaker.retry_in():.0f}秒后重试")
+            try:
+                result = await func()
+            except TransientError as e:
+                if breaker:
+                    breaker.record_failure()
+                if attempt == self.max_attempts - 1:
+                    raise
+                delay = self.backoff(attempt, e.retry_after)
+                if on_retry:
+                    on_retry(attempt + 1, e, delay)
+                await asyncio.sleep(delay)
+                continue
+            except BaseException:
+                if breaker:
+                    breaker.release()
+                raise
+            if breaker:
+                breaker.record_success()
+            return result
+
+
+class Deadline:
+    """一次请求的截止时间，各阶段按剩余时间分配超时；seconds为0时不限时"""
+
+    def __init__(self, seconds: float):
+        self.expires_at = time.monotonic() + seconds if seconds and seconds > 0 else None
+
+    def remaining(self) -> float:
+        if self.expires_at is None:
+            return float('inf')
+        return max(0.0, self.expires_at - time.monotonic())
+
+    def timeout(self, share: float = 1.0, reserve: float = 0.0, minimum: float = 1.0) -> Optional[float]:
+        """本阶段可用的超时秒数：先扣除为后续阶段保留的reserve，再取剩余时间的share比例"""
+        if self.expires_at is None:
+            return None
+        return max(minimum, (self.remaining() - reserve) * share)
+
+    def short(self, reserve: float) -> bool:
+        """剩余时间是否已不足reserve秒"""
+        return self.remaining() < reserve
@@ -0,0 +1,133 @@
+import asyncio
+from collections import OrderedDict, deque
+from typing import Any, Awaitable, Callable, Deque, Dict, List, Optional
+
+
+class QueueFullError(Exception):
+    """排队任务已满，拒绝新任务"""
+
+
+class _Job:
+    __slots__ = ('group', 'user', 'factory', 'future')
+
+    def __init__(self, group: str, user: str, factory: Callable[[], Awaitable[Any]], future: asyncio.Future):
+        self.group = group
+        self.user = user
+        self.factory = factory
+        self.future = future
+
+
+class FairScheduler:
+    """固定数量的工作协程 + 有界队列，按群组、再按用户轮转取任务，并限制单个用户的并发数"""
+
+    def __init__(self, workers: int, max_queue: int, per_user_limit: int):
+        self.workers = max(1, workers)
+        self.max_queue = max_queue
+        self.per_user_limit = max(1, per_user_limit)
+        # group -> user -> 任务队列，OrderedDict的顺序即轮转顺序
+        self._groups: "OrderedDict[str, OrderedDict[str, Deque[_Job]]]" = OrderedDict()
+        self._running: Dict[str, int] = {}
+        self._queued = 0
+        self._condition: Optional[asyncio.Condition] = None
+        self._worker_tasks: List[asyncio.Task] = []
+
+    @property
+    def queued(self) -> int:
+        return self._queued
+
+    @property
+    def running(self) -> int:
+        return sum(self._running.values())
+
+    @property
+    def full(self) -> bool:
+        return self.max_queue > 0 and self._queued >= self.max_queue
+
+    def submit(self, group: str, user: str, factory: Callable[[], Awaitable[Any]]) -> asyncio.Future:
+        """提交任务，返回任务结果的Future；队列已满时立即抛出QueueFullError"""
+        if self.full:
+            raise QueueFullError(f"排队任务已满({self._queued})")
+
+        self._ensure_workers()
+        future = asyncio.get_running_loop().create_future()
+        users = self._groups.setdefault(group, OrderedDict())
+        users.setdefault(user, deque()).append(_Job(group, user, factory, future))
+        self._queued += 1
+        self._notify()
+        return future
+
+    def _ensure_workers(self):
+        if self._worker_tasks:
+            return
+        self._condition = asyncio.Condition()
+        self._worker_tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+
+    def _notify(self):
+        async def notify():
+            async with self._condition:
+                self._condition.notify_all()
+        asyncio.create_task(notify())
+
+    def _pick(self) -> Optional[_Job]:
+        """轮转选出下一个可运行的任务：跳过已达到并发上限的用户"""
+        for group, users in list(self._groups.items()):
+            for user, jobs in list(users.items()):
+                if self._running.get(user, 0) >= self.per_user_limit:
+                    continue
+
+                job = jobs.popleft()
+                self._queued -= 1
+                if jobs:
+                    users.move_to_end(user)
+                else:
+                    del users[user]
+                if users:
+                    self._groups.move_to_end(group)
+                else:
+                    del self._groups[group]
+
+                if job.future.done():
+                    # 调用方已取消，继续选下一个
+                    return self._pick()
+                return job
+        return None
+
+    async def _worker(self):
+        while True:
+            async with self._condition:
+                job = self._pick()
+                while job is None:
+                    await self._condition.wait()
+                    job = self._pick()
+
+            self._running[job.user] = self._running.get(job.user, 0) + 1
+            try:
+                result = await job.factory()
+                if not job.future.done():
+                    job.future.set_result(result)
+            except asyncio.CancelledError:
+                if not job.future.done():
+                    job.future.cancel()
+                raise
+            except Exception as e:
+                if not job.future.done():
+                    job.future.set_exception(e)
+            finally:
+                self._running[job.user] -= 1
+                if not self._running[job.user]:
+                    del self._running[job.user]
+                # 用户并发数下降后，其排队中的任务可能变为可运行
+                self._notify()
+
+    async def stop(self):
+        """停止所有工作协程并取消排队中的任务"""
+        for task in self._worker_tasks:
+            task.cancel()
+        await asyncio.gather(*self._worker_tasks, return_exceptions=True)
+        self._worker_tasks = []
+        for users in self._groups.values():
+            for jobs in users.values():
+                for job in jobs:
+                    job.future.cancel()
+        self._groups.clear()
+        self._queued = 0
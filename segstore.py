@@ -0,0 +1,156 @@
+import heapq
+import json
+import math
+import os
+import re
+import sqlite3
+import time
+import zlib
+from collections import Counter, OrderedDict
+from typing import Dict, List, Optional, Tuple
+
+from .subtitle import Segment, compact_segments, join_segments, split_segments
+
+_TERM_PATTERN = re.compile(r'(?P<cjk>[\u3400-\u4dbf\u4e00-\u9fff]+)|(?P<word>[a-z]+)|(?P<digit>[0-9]+)')
+
+
+def tokenize(text: str) -> List[str]:
+    """检索用分词：中文按相邻两字切分（bigram），英文单词和数字整体作为一个词"""
+    terms: List[str] = []
+    for match in _TERM_PATTERN.finditer(text.lower()):
+        run = match.group()
+        if match.lastgroup == 'cjk' and len(run) > 1:
+            terms.extend(run[i:i + 2] for i in range(len(run) - 1))
+        else:
+            terms.append(run)
+    return terms
+
+
+def build_passages(segments: List[Segment], max_chars: int = 200) -> List[Segment]:
+    """把相邻字幕行合并为不超过max_chars的检索段落，保留首尾时间戳"""
+    return [
+        (chunk[0][0], chunk[-1][1], join_segments(chunk))
+        for chunk in split_segments(segments, max_chars)
+    ]
+
+
+class SegmentIndex:
+    """字幕段落上的BM25倒排索引"""
+
+    def __init__(self, passages: List[Segment], k1: float = 1.5, b: float = 0.75):
+        self.passages = passages
+        self.k1 = k1
+        self.b = b
+        self.postings: Dict[str, List[Tuple[int, int]]] = {}
+        self.lengths: List[int] = []
+
+        for doc_id, (_, _, text) in enumerate(passages):
+            counts = Counter(tokenize(text))
+            self.lengths.append(sum(counts.values()))
+            for term, tf in counts.items():
+                self.postings.setdefault(term, []).append((doc_id, tf))
+        self.avg_length = (sum(self.lengths) / len(self.lengths)) if self.lengths else 1.0
+
+    def search(self, query: str, top_k: int) -> List[Tuple[float, Segment]]:
+        """返回与问题最相关的top_k个段落及其得分，按得分降序"""
+        count = len(self.passages)
+        scores: Dict[int, float] = {}
+        for term in set(tokenize(query)):
+            postings = self.postings.get(term)
+            if not postings:
+                continue
+            idf = math.log(1 + (count - len(postings) + 0.5) / (len(postings) + 0.5))
+            for doc_id, tf in postings:
+                length_norm = 1 - self.b + self.b * self.lengths[doc_id] / (self.avg_length or 1.0)
+                scores[doc_id] = scores.get(doc_id, 0.0) + idf * tf * (self.k1 + 1) / (tf + self.k1 * length_norm)
+
+        best = heapq.nlargest(top_k, scores.items(), key=lambda item: item[1])
+        return [(score, self.passages[doc_id]) for doc_id, score in best]
+
+
+class SegmentStore:
+    """按视频分P保存带时间戳的字幕（SQLite，zlib压缩），并在内存中缓存最近使用的检索索引"""
+
+    def __init__(self, db_path: str, ttl: float, max_entries: int, index_cache_size: int = 32):
+        self.db_path = db_path
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.index_cache_size = index_cache_size
+        self._indexes: "OrderedDict[str, SegmentIndex]" = OrderedDict()
+
+        os.makedirs(os.path.dirname(db_path) or '.', exist_ok=True)
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS segments ("
+            "  segment_key TEXT PRIMARY KEY,"
+            "  title TEXT NOT NULL,"
+            "  data BLOB NOT NULL,"
+            "  created_at REAL NOT NULL,"
+            "  accessed_at REAL NOT NULL"
+            ")"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_segments_accessed ON segments(accessed_at)")
+        self._conn.commit()
+
+    def get(self, segment_key: str) -> Optional[Tuple[str, List[Segment]]]:
+        """读取 (标题, 字幕片段)，不存在或已过期时返回None"""
+        now = time.time()
+        row = self._conn.execute(
+            "SELECT title, data, created_at FROM segments WHERE segment_key = ?", (segment_key,)
+        ).fetchone()
+        if row is None:
+            return None
+
+        title, data, created_at = row
+        if self.ttl > 0 and now - created_at > self.ttl:
+            self._conn.execute("DELETE FROM segments WHERE segment_key = ?", (segment_key,))
+            self._conn.commit()
+            self._indexes.pop(segment_key, None)
+            return None
+
+        self._conn.execute("UPDATE segments SET accessed_at = ? WHERE segment_key = ?", (now, segment_key))
+        self._conn.commit()
+        segments = [tuple(item) for item in json.loads(zlib.decompress(data).decode('utf-8'))]
+        return title, segments
+
+    def set(self, segment_key: str, title: str, segments: List[Segment]):
+        """写入字幕，超出容量时淘汰最久未访问的条目"""
+        now = time.time()
+        # 时间戳保留两位小数，紧凑JSON再压缩
+        payload = json.dumps([[round(start, 2), round(end, 2), text] for start, end, text in segments],
+                             ensure_ascii=False, separators=(',', ':'))
+        self._conn.execute(
+            "INSERT OR REPLACE INTO segments (segment_key, title, data, created_at, accessed_at) "
+            "VALUES (?, ?, ?, ?, ?)",
+            (segment_key, title, zlib.compress(payload.encode('utf-8')), now, now)
+        )
+        self._indexes.pop(segment_key, None)
+
+        if self.max_entries > 0:
+            count = self._conn.execute("SELECT COUNT(*) FROM segments").fetchone()[0]
+            if count > self.max_entries:
+                self._conn.execute(
+                    "DELETE FROM segments WHERE segment_key IN ("
+                    "  SELECT segment_key FROM segments ORDER BY accessed_at ASC LIMIT ?"
+                    ")",
+                    (count - self.max_entries,)
+                )
+        self._conn.commit()
+
+    def index(self, segment_key: str, segments: List[Segment]) -> SegmentIndex:
+        """获取（或构建并缓存）该分P字幕的检索索引，建索引前先压缩重复和无意义的字幕行"""
+        index = self._indexes.get(segment_key)
+        if index is None:
+            passages = build_passages(compact_segments(segments) or segments)
+            index = self._indexes[segment_key] = SegmentIndex(passages)
+            while len(self._indexes) > self.index_cache_size:
+                self._indexes.popitem(last=False)
+        self._indexes.move_to_end(segment_key)
+        return index
+
+    def __len__(self) -> int:
+        return self._conn.execute("SELECT COUNT(*) FROM segments").fetchone()[0]
+
+    def close(self):
+        self._conn.close()
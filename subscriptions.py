@@ -0,0 +1,82 @@
+import json
+import os
+import random
+from typing import Any, Dict, List, Optional
+
+
+class SubscriptionStore:
+    """各会话订阅的UP主及每个UP主的轮询进度，持久化到JSON文件"""
+
+    def __init__(self, persist_path: str):
+        self.persist_path = persist_path
+        # 会话标识(unified_msg_origin) -> 订阅的UP主mid列表
+        self.groups: Dict[str, List[str]] = {}
+        # mid -> {'name': UP主昵称, 'last_created': 已处理的最新投稿时间}
+        self.uploaders: Dict[str, Dict[str, Any]] = {}
+        self.load()
+
+    def load(self):
+        if not os.path.exists(self.persist_path):
+            return
+        try:
+            with open(self.persist_path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return
+        self.groups = data.get('groups', {})
+        self.uploaders = data.get('uploaders', {})
+
+    def save(self):
+        os.makedirs(os.path.dirname(self.persist_path) or '.', exist_ok=True)
+        tmp_path = self.persist_path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({'groups': self.groups, 'uploaders': self.uploaders}, f, ensure_ascii=False)
+        os.replace(tmp_path, self.persist_path)
+
+    def add(self, origin: str, mid: str) -> bool:
+        """添加订阅，已订阅时返回False"""
+        mids = self.groups.setdefault(origin, [])
+        if mid in mids:
+            return False
+        mids.append(mid)
+        self.uploaders.setdefault(mid, {'name': '', 'last_created': None})
+        return True
+
+    def remove(self, origin: str, mid: str) -> bool:
+        """取消订阅，未订阅时返回False；不再被任何会话订阅的UP主会一并清除进度"""
+        mids = self.groups.get(origin, [])
+        if mid not in mids:
+            return False
+        mids.remove(mid)
+        if not mids:
+            del self.groups[origin]
+        if not self.subscribers(mid):
+            self.uploaders.pop(mid, None)
+        return True
+
+    def list(self, origin: str) -> List[str]:
+        return list(self.groups.get(origin, []))
+
+    def subscribers(self, mid: str) -> List[str]:
+        return [origin for origin, mids in self.groups.items() if mid in mids]
+
+    def mids(self) -> List[str]:
+        return list(self.uploaders)
+
+    def state(self, mid: str) -> Optional[Dict[str, Any]]:
+        return self.uploaders.get(mid)
+
+
+def plan_batches(mids: List[str], batch_size: int, interval: float, jitter: float = 0.5) -> List[tuple]:
+    """把一轮轮询打散为若干批次：返回 [(等待秒数, 本批mid列表)]
+
+    mid顺序每轮随机打乱，各批次均匀分布在interval内并带±jitter比例的随机抖动，避免集中请求。
+    """
+    mids = list(mids)
+    random.shuffle(mids)
+    batch_size = max(1, batch_size)
+    batches = [mids[i:i + batch_size] for i in range(0, len(mids), batch_size)]
+    if not batches:
+        return []
+    spacing = interval / len(batches)
+    return [(spacing * random.uniform(1 - jitter, 1 + jitter), batch) for batch in batches]
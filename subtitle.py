@@ -0,0 +1,301 @@
+import json
+import math
+import re
+from array import array
+from collections.abc import Sequence
+from typing import Callable, Iterable, Iterator, List, Tuple
+
+# 字幕片段：(开始秒数, 结束秒数, 文本)
+Segment = Tuple[float, float, str]
+
+
+def format_timestamp(seconds: float) -> str:
+    """将秒数格式化为 mm:ss 或 hh:mm:ss"""
+    seconds = int(seconds)
+    hours, rest = divmod(seconds, 3600)
+    minutes, secs = divmod(rest, 60)
+    if hours:
+        return f"{hours}:{minutes:02d}:{secs:02d}"
+    return f"{minutes:02d}:{secs:02d}"
+
+
+def join_segments(segments: List[Segment]) -> str:
+    """拼接字幕片段文本"""
+    return ' '.join(content for _, _, content in segments)
+
+
+def text_length(segments: List[Segment]) -> int:
+    """拼接后的字幕文本长度"""
+    if not segments:
+        return 0
+    return sum(len(content) for _, _, content in segments) + len(segments) - 1
+
+
+def split_segments(segments: List[Segment], max_size: int,
+                   measure: Callable[[str], int] = len) -> List[List[Segment]]:
+    """按字幕行边界把字幕切分为若干块，每块按measure计量不超过max_size（单行超长时独占一块）"""
+    chunks: List[List[Segment]] = []
+    current: List[Segment] = []
+    current_length = 0
+
+    for segment in segments:
+        length = measure(segment[2]) + (1 if current else 0)
+        if current and current_length + length > max_size:
+            chunks.append(current)
+            current = []
+            current_length = 0
+            length = measure(segment[2])
+        current.append(segment)
+        current_length += length
+
+    if current:
+        chunks.append(current)
+    return chunks
+
+
+# 估算token数用的字符类别：CJK字符、拉丁字母单词、数字串、其他非空白符号
+_TOKEN_PATTERN = re.compile(
+    r'(?P<cjk>[\u3040-\u30ff\u3400-\u4dbf\u4e00-\u9fff\uac00-\ud7af\uf900-\ufaff]+)'
+    r'|(?P<word>[A-Za-z]+)|(?P<digit>[0-9]+)|(?P<other>\S)'
+)
+
+
+def estimate_tokens(text: str) -> int:
+    """离线估算文本的token数（按常见BPE分词器的经验比例：汉字约1.3个/字，英文约4字母/个）"""
+    total = 0.0
+    for match in _TOKEN_PATTERN.finditer(text):
+        kind = match.lastgroup
+        length = match.end() - match.start()
+        if kind == 'cjk':
+            total += length * 1.3
+        elif kind == 'word':
+            total += max(1.0, length / 4)
+        elif kind == 'digit':
+            total += max(1.0, length / 3)
+        else:
+            total += 1
+    return math.ceil(total)
+
+
+def segment_tokens(segments: List[Segment]) -> int:
+    """拼接后的字幕文本估算token数"""
+    return estimate_tokens(join_segments(segments))
+
+
+# 非语音标记：[音乐]、（掌声）、【笑声】、[Music] 等，以及音符符号
+_NON_SPEECH_PATTERN = re.compile(
+    r'[\[\(（【<《]\s*(?:音乐|背景音乐|掌声|笑声|欢呼|鼓掌|笑|music|applause|laughter|laughs|silence)\s*[\]\)）】>》]'
+    r'|[♪♫♬♩🎵🎶]+',
+    re.IGNORECASE
+)
+# 整行只有语气词时视为无内容
+_FILLER_PATTERN = re.compile(r'^(?:嗯|啊|呃|额|哦|噢|唔|哎|诶|欸|那个|就是|然后|um+|uh+|er+|ah+|hmm+|oh)+$', re.IGNORECASE)
+_NORMALIZE_PATTERN = re.compile(r'[\W_]+', re.UNICODE)
+
+
+def _normalize(text: str) -> str:
+    return _NORMALIZE_PATTERN.sub('', text).lower()
+
+
+def _join_text(left: str, right: str) -> str:
+    # 中文之间直接拼接，其他情况用空格分隔
+    if left and right and (left[-1].isascii() or right[0].isascii()):
+        return f"{left} {right}"
+    return left + right
+
+
+def compact_segments(segments: List[Segment], merge_chars: int = 12, max_merged_chars: int = 80,
+                     merge_gap: float = 1.0) -> List[Segment]:
+    """压缩字幕：去除非语音标记和纯语气词行，合并重复和滚动重复的相邻行，拼接过短的片段
+
+    自动生成的字幕常出现逐字滚动的重复行（后一行包含前一行），此时保留较完整的一行。
+    """
+    compacted: List[Segment] = []
+    previous_norm = ''
+
+    for start, end, content in segments:
+        text = _NON_SPEECH_PATTERN.sub('', content).strip()
+        norm = _normalize(text)
+        if not norm or _FILLER_PATTERN.match(norm):
+            continue
+
+        if compacted:
+            last_start, last_end, last_text = compacted[-1]
+            if norm == previous_norm or norm in previous_norm:
+                # 重复或被上一行包含：只延长上一行的结束时间
+                compacted[-1] = (last_start, max(last_end, end), last_text)
+                continue
+            if previous_norm in norm:
+                # 上一行的滚动扩展：用较完整的这一行替换上一行
+                # 只合并完全重复和包含关系，句式相同但内容不同的行（只差一个词或数字）必须保留
+                compacted[-1] = (last_start, max(last_end, end), text)
+                previous_norm = norm
+                continue
+            if (len(last_text) < merge_chars and start - last_end <= merge_gap and
+                    len(last_text) + len(text) <= max_merged_chars):
+                # 上一行过短且紧邻：合并为一行
+                merged = _join_text(last_text, text)
+                compacted[-1] = (last_start, end, merged)
+                # 之后按合并后的整行比较，避免滚动扩展替换掉合并进来的前半部分
+                previous_norm = _normalize(merged)
+                continue
+
+        compacted.append((start, end, text))
+        previous_norm = norm
+
+    return compacted
+
+
+class SegmentArray(Sequence):
+    """紧凑存储的字幕片段：时间戳存放在array中，访问时才组装为 (开始秒数, 结束秒数, 文本) 元组"""
+
+    __slots__ = ('_starts', '_ends', '_texts', 'truncated')
+
+    def __init__(self, segments: Iterable[Segment] = ()):
+        self._starts = array('d')
+        self._ends = array('d')
+        self._texts: List[str] = []
+        # 是否因超出读取上限而只保留了前面一部分
+        self.truncated = False
+        for start, end, text in segments:
+            self.append(start, end, text)
+
+    def append(self, start: float, end: float, text: str):
+        self._starts.append(start)
+        self._ends.append(end)
+        self._texts.append(text)
+
+    def __len__(self) -> int:
+        return len(self._texts)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+        return self._starts[index], self._ends[index], self._texts[index]
+
+    def __iter__(self) -> Iterator[Segment]:
+        return zip(self._starts, self._ends, self._texts)
+
+
+# 数据不足、需要等待下一块输入
+_PENDING = object()
+# JSON值之后可能出现的字符
+_VALUE_DELIMITERS = ',}] \t\r\n'
+
+
+class SubtitleStreamParser:
+    """增量解析B站字幕JSON（{..., "body": [{"from": 秒, "to": 秒, "content": 文本, ...}, ...]}）
+
+    逐块feed解码后的文本，body中的条目逐个解析后只保留时间戳和文本，不构建整个文件的JSON对象；
+    body解析完毕或文本累计达到max_chars时feed返回True，调用方可以停止读取。
+    """
+
+    # 单个未解析完的值超过该长度时视为格式错误，避免缓冲区无限增长
+    MAX_PENDING_CHARS = 1 << 20
+
+    def __init__(self, max_chars: int = 0):
+        self.max_chars = max_chars
+        self.segments = SegmentArray()
+        self.done = False
+        self._chars = 0
+        self._buffer = ''
+        self._pos = 0
+        self._state = 'start'
+        self._key = None
+        self._decoder = json.JSONDecoder()
+
+    def feed(self, text: str) -> bool:
+        if not self.done:
+            self._buffer = self._buffer[self._pos:] + text
+            self._pos = 0
+            self._parse(final=False)
+        return self.done
+
+    def close(self) -> SegmentArray:
+        """输入结束，返回解析出的字幕；JSON不完整或格式错误时抛出ValueError"""
+        if not self.done:
+            self._parse(final=True)
+            if not self.done:
+                raise ValueError("字幕JSON不完整")
+        return self.segments
+
+    def _decode(self, final: bool):
+        """解析当前位置的一个JSON值，数据不足时返回_PENDING"""
+        try:
+            value, end = self._decoder.raw_decode(self._buffer, self._pos)
+        except json.JSONDecodeError:
+            if final or len(self._buffer) - self._pos > self.MAX_PENDING_CHARS:
+                raise
+            return _PENDING
+        if end >= len(self._buffer) and not final:
+            return _PENDING
+        # 数字只有在后面跟着分隔符时才算读完（如 0.4 可能被切成 "0." 和 "4"，此时只解析出了0）
+        if (isinstance(value, (int, float)) and not isinstance(value, bool) and
+                end < len(self._buffer) and self._buffer[end] not in _VALUE_DELIMITERS):
+            if final:
+                raise ValueError("字幕JSON格式错误")
+            return _PENDING
+        self._pos = end
+        return value
+
+    def _parse(self, final: bool):
+        buffer = self._buffer
+        while not self.done:
+            while self._pos < len(buffer) and buffer[self._pos] in ' \t\r\n':
+                self._pos += 1
+            if self._pos >= len(buffer):
+                return
+            char = buffer[self._pos]
+            state = self._state
+
+            if state == 'start':
+                if char != '{':
+                    raise ValueError("字幕JSON格式错误")
+                self._pos += 1
+                self._state = 'key'
+            elif state == 'key':
+                if char == '}':
+                    # 顶层对象结束（没有body）
+                    self.done = True
+                elif char == ',':
+                    self._pos += 1
+                else:
+                    key = self._decode(final)
+                    if key is _PENDING:
+                        return
+                    self._key = key
+                    self._state = 'colon'
+            elif state == 'colon':
+                if char != ':':
+                    raise ValueError("字幕JSON格式错误")
+                self._pos += 1
+                self._state = 'body' if self._key == 'body' else 'value'
+            elif state == 'body' and char == '[':
+                self._pos += 1
+                self._state = 'items'
+            elif state in ('value', 'body'):
+                # 其他字段的值（体积很小）直接跳过
+                if self._decode(final) is _PENDING:
+                    return
+                self._state = 'key'
+            elif char == ']':
+                # body解析完毕，后面的字段不再需要
+                self.done = True
+            elif char == ',':
+                self._pos += 1
+            else:
+                item = self._decode(final)
+                if item is _PENDING:
+                    return
+                if isinstance(item, dict):
+                    self._add(item)
+
+    def _add(self, item: dict):
+        content = str(item.get('content') or '').strip()
+        if not content:
+            return
+        self.segments.append(float(item.get('from') or 0.0), float(item.get('to') or 0.0), content)
+        self._chars += len(content)
+        if self.max_chars > 0 and self._chars >= self.max_chars:
+            self.segments.truncated = True
+            self.done = True
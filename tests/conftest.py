@@ -0,0 +1,5 @@
+import os
+import sys
+
+# 插件以包的形式由AstrBot加载；测试只覆盖不依赖AstrBot的独立模块，直接按模块名导入
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,63 @@
+import random
+
+import pytest
+
+from bvid import MAX_AID, av2bv, bv2av, is_valid_bvid
+
+KNOWN_PAIRS = [
+    (2, 'BV1xx411c7mD'),
+    (170001, 'BV17x411w7KC'),
+    (455017605, 'BV1Q541167Qg'),
+    (882584971, 'BV1mK4y1C7Bz'),
+    (1054803170, 'BV1mH4y1u7UA'),
+    (111298867365120, 'BV1L9Uoa9EUx'),
+]
+
+
+@pytest.mark.parametrize('aid, bvid', KNOWN_PAIRS)
+def test_known_pairs(aid, bvid):
+    assert av2bv(aid) == bvid
+    assert bv2av(bvid) == aid
+    assert is_valid_bvid(bvid)
+
+
+def test_round_trip_random_aids():
+    rng = random.Random(20240229)
+    aids = [1, MAX_AID - 1] + [rng.randrange(1, MAX_AID) for _ in range(20000)]
+    # 覆盖各个数量级的小AV号
+    aids += [rng.randrange(1, 1 << bits) for bits in range(1, 52) for _ in range(50)]
+    for aid in aids:
+        bvid = av2bv(aid)
+        assert len(bvid) == 12 and bvid.startswith('BV1')
+        assert bv2av(bvid) == aid
+        assert is_valid_bvid(bvid)
+
+
+@pytest.mark.parametrize('aid', [0, -1, MAX_AID, MAX_AID + 1, 1 << 64])
+def test_rejects_out_of_range_aid(aid):
+    with pytest.raises(ValueError):
+        av2bv(aid)
+
+
+@pytest.mark.parametrize('bvid', [
+    '', 'BV', 'BV17x411w7K', 'BV17x411w7KCC', 'BV27x411w7KC', 'bv17x411w7KC', 'av170001',
+    'BV17x411w7K0', 'BV17x411w7KI', 'BV17x411w7KO', 'BV17x411w7Kl', 'BV17x411w7K-',
+])
+def test_rejects_malformed_bvid(bvid):
+    with pytest.raises(ValueError):
+        bv2av(bvid)
+    assert not is_valid_bvid(bvid)
+
+
+def test_rejects_bvid_outside_aid_range():
+    # 格式合法但不是由合法AV号生成的BV号
+    rng = random.Random(7)
+    alphabet = 'FcwAPNKTMug3GV5Lj7EJnHpWsx4tb8haYeviqBz6rkCy12mUSDQX9RdoZf'
+    rejected = 0
+    for _ in range(2000):
+        bvid = 'BV1' + ''.join(rng.choice(alphabet) for _ in range(9))
+        if not is_valid_bvid(bvid):
+            rejected += 1
+        else:
+            assert 0 < bv2av(bvid) < MAX_AID
+    assert rejected > 0
@@ -0,0 +1,85 @@
+import json
+
+import pytest
+
+from subtitle import SubtitleStreamParser, compact_segments, join_segments
+
+HEADER = {
+    'font_size': 0.4, 'font_color': '#FFFFFF', 'background_alpha': 0.5, 'background_color': '#9C27B0',
+    'Stroke': 'none', 'type': 'AIsubtitle', 'lang': 'ai-zh', 'version': 'v1.6.0.4'
+}
+BODY = [
+    {'from': 0.12, 'to': 1.5, 'sid': 1, 'location': 2, 'content': '大家好', 'music': 0.0},
+    {'from': 1.5, 'to': 3.0, 'sid': 2, 'location': 2, 'content': '   ', 'music': 0.0},
+    {'from': 10, 'to': 12.25, 'sid': 3, 'location': 2, 'content': ' 今天聊聊 "JSON" \\ 解析 ', 'music': 0.0},
+]
+EXPECTED = [(0.12, 1.5, '大家好'), (10.0, 12.25, '今天聊聊 "JSON" \\ 解析')]
+
+
+def parse(*parts, max_chars=0):
+    parser = SubtitleStreamParser(max_chars)
+    for part in parts:
+        if parser.feed(part):
+            break
+    return parser.close()
+
+
+@pytest.mark.parametrize('indent', [None, 2])
+def test_split_at_every_offset(indent):
+    raw = json.dumps({**HEADER, 'body': BODY}, ensure_ascii=False, indent=indent)
+    for offset in range(len(raw) + 1):
+        assert list(parse(raw[:offset], raw[offset:])) == EXPECTED, offset
+
+
+def test_single_character_chunks():
+    raw = json.dumps({**HEADER, 'body': BODY, 'trailer': [1, {'x': None}]}, ensure_ascii=False)
+    assert list(parse(*raw)) == EXPECTED
+
+
+def test_stops_at_max_chars():
+    body = [{'from': i, 'to': i + 1, 'content': '字幕内容'} for i in range(100)]
+    segments = parse(json.dumps({'body': body}, ensure_ascii=False), max_chars=10)
+    assert len(segments) == 3
+    assert segments.truncated
+
+
+def test_missing_body():
+    assert list(parse(json.dumps(HEADER))) == []
+    assert list(parse('{"body": null}')) == []
+
+
+@pytest.mark.parametrize('raw', ['[]', '{"body": [{"from": 1', '{"font_size": 0.x, "body": []}', '{"body": [}'])
+def test_malformed(raw):
+    with pytest.raises(ValueError):
+        parse(raw)
+
+
+def test_compact_keeps_template_lines():
+    lines = ['I think this is a good idea', 'I think this is a bad idea'] + [f'这是第{i}句测试字幕内容' for i in range(50)]
+    segments = [(i * 2.5, i * 2.5 + 2.0, text) for i, text in enumerate(lines)]
+    compacted = compact_segments(segments)
+    # 过短的相邻行可以拼接，但每一行的内容都必须保留
+    joined = join_segments(compacted)
+    assert all(text in joined for text in lines)
+
+
+def test_compact_merges_repeats_and_rolling_lines():
+    segments = [
+        (0.0, 1.0, '[音乐]'),
+        (1.0, 2.0, '今天我们来聊一聊'),
+        (2.0, 3.0, '今天我们来聊一聊字幕压缩'),
+        (3.0, 4.0, '今天我们来聊一聊字幕压缩'),
+        (4.0, 5.0, '嗯'),
+        (5.0, 6.0, '字幕压缩'),
+        (6.0, 8.0, '下一句完全不同的话题内容'),
+    ]
+    assert compact_segments(segments) == [
+        (1.0, 6.0, '今天我们来聊一聊字幕压缩'),
+        (6.0, 8.0, '下一句完全不同的话题内容'),
+    ]
+
+
+def test_compact_keeps_short_merged_prefix():
+    segments = [(0.0, 0.5, '好的'), (0.6, 1.0, '今天我们'), (1.0, 2.0, '今天我们来聊字幕')]
+    compacted = ' '.join(text for _, _, text in compact_segments(segments))
+    assert '好的' in compacted and '今天我们来聊字幕' in compacted
@@ -0,0 +1,42 @@
+import hashlib
+import time
+from typing import Any, Dict, Optional, Tuple
+from urllib.parse import urlencode
+
+# B站前端用于打乱 img_key + sub_key 的固定下标表
+MIXIN_KEY_ENC_TAB = (
+    46, 47, 18, 2, 53, 8, 23, 32, 15, 50, 10, 31, 58, 3, 45, 35, 27, 43, 5, 49,
+    33, 9, 42, 19, 29, 28, 14, 39, 12, 38, 41, 13, 37, 48, 7, 16, 24, 55, 40,
+    61, 26, 17, 0, 1, 60, 51, 30, 4, 22, 25, 54, 21, 56, 59, 6, 63, 57, 62, 11,
+    36, 20, 34, 44, 52
+)
+
+# 签名前需要从参数值中去掉的字符
+_FILTERED_CHARS = str.maketrans('', '', "!'()*")
+
+
+def get_mixin_key(img_key: str, sub_key: str) -> str:
+    """由 img_key 和 sub_key 计算签名用的 mixin_key"""
+    raw = img_key + sub_key
+    return ''.join(raw[index] for index in MIXIN_KEY_ENC_TAB if index < len(raw))[:32]
+
+
+def extract_wbi_keys(nav_data: Dict[str, Any]) -> Optional[Tuple[str, str]]:
+    """从 /x/web-interface/nav 的响应中取出 (img_key, sub_key)（未登录时接口也会返回）"""
+    wbi_img = (nav_data.get('data') or {}).get('wbi_img') or {}
+    img_url, sub_url = wbi_img.get('img_url', ''), wbi_img.get('sub_url', '')
+    if not img_url or not sub_url:
+        return None
+    # 取文件名（去掉路径和扩展名）
+    img_key = img_url.rsplit('/', 1)[-1].split('.', 1)[0]
+    sub_key = sub_url.rsplit('/', 1)[-1].split('.', 1)[0]
+    return (img_key, sub_key) if img_key and sub_key else None
+
+
+def sign_params(params: Dict[str, Any], mixin_key: str, timestamp: Optional[int] = None) -> Dict[str, str]:
+    """为请求参数添加 wts 和 w_rid 签名，返回按键排序的新参数"""
+    signed = {key: str(value).translate(_FILTERED_CHARS) for key, value in params.items()}
+    signed['wts'] = str(int(timestamp if timestamp is not None else time.time()))
+    signed = dict(sorted(signed.items()))
+    signed['w_rid'] = hashlib.md5((urlencode(signed) + mixin_key).encode('utf-8')).hexdigest()
+    return signed